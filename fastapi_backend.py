@@ -4,17 +4,23 @@ FastAPI Backend for AI Study Assistant - GROQ VERSION
 This version uses Groq API instead of OpenAI
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 import tempfile
 import os
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Callable
 import json
+import hashlib
 import asyncio
 import logging
+import threading
+import sqlite3
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel
 import time
+from contextlib import asynccontextmanager
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,6 +30,7 @@ logger = logging.getLogger(__name__)
 try:
     from pipeline import (
         GroqClient,
+        AsyncGroqClient,
         EnhancedPDFProcessor,
         SummaryAgent,
         FlashcardAgent,
@@ -33,18 +40,37 @@ try:
         AIEnhancedWebResourceAgent,
         QAChatbotAgent,
         AIPresentationCoordinatorAgent,
-        PresentationAgent
+        PresentationAgent,
+        StudyPackAgent,
+        ExtractedDocument,
+        PageStore,
+        AgentRegistry,
+        create_session_store,
+        PROMPT_CONTENT,
+        count_tokens
     )
     logger.info("✅ Successfully imported pipeline modules")
 except ImportError as e:
     logger.error(f"❌ Failed to import pipeline modules: {e}")
     raise
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the shared agents once per worker before serving, and release them on shutdown"""
+    container = AgentContainer()
+    await container.start()
+    app.state.agents = container
+    try:
+        yield
+    finally:
+        await container.close()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="AI Study Assistant API",
     description="Backend API for AI-powered study material generation",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -69,6 +95,7 @@ class ProcessingStatus(BaseModel):
   word_count: int
   page_count: int
   methods_used: List[str]
+  session_id: str = "default"
 
 class SummaryResponse(BaseModel):
   summary: str
@@ -94,6 +121,16 @@ class QuizResponse(BaseModel):
   status: str
   fallback_used: bool = False
 
+class StudyPackResponse(BaseModel):
+  summary: str
+  flashcards: List[Dict]
+  quiz: List[Dict]
+  topic: str
+  keywords: List[str]
+  status: str
+  fallback_sections: List[str] = []
+  fallback_used: bool = False
+
 class ResearchPapersResponse(BaseModel):
   papers: List[Dict]
   count: int
@@ -112,6 +149,7 @@ class WebResourcesResponse(BaseModel):
 class QuestionRequest(BaseModel):
   question: str
   document_text: str
+  session_id: Optional[str] = None
 
 class AnswerResponse(BaseModel):
   answer: str
@@ -124,12 +162,57 @@ class ApiStatusResponse(BaseModel):
   message: str
   fallback_enabled: bool
 
+class JobCreatedResponse(BaseModel):
+  job_id: str
+  session_id: str
+  status: str
+  status_url: str
+
+class JobStatusResponse(BaseModel):
+  job_id: str
+  session_id: str
+  status: str
+  message: str
+  filename: str
+  pages_total: int
+  pages_done: int
+  ocr_pages_pending: int
+  eta_seconds: Optional[float] = None
+  word_count: int
+  partial_text_available: bool
+
 # Pydantic models for Slidesmaker feature
 
 
 
+# Upload limits
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024  # 50MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Background extraction jobs
+MAX_EXTRACTION_JOBS = int(os.getenv("MAX_EXTRACTION_JOBS", "2"))
+FINISHED_JOB_TTL = 3600  # Seconds to keep finished jobs around for polling
+PARTIAL_TEXT_MAX_CHARS = 60000  # Partial session text stops growing past this
+# The partial session is republished at most every this many pages or seconds
+PARTIAL_SESSION_PAGES = int(os.getenv("PARTIAL_SESSION_PAGES", "10"))
+PARTIAL_SESSION_SECONDS = float(os.getenv("PARTIAL_SESSION_SECONDS", "2"))
+
+# Upper bound on text handed to the AI agents; they trim it further to each model's token budget
+AI_SOURCE_MAX_CHARS = int(os.getenv("AI_SOURCE_MAX_CHARS", "40000"))
+# Summaries cover the whole document through map-reduce; this only bounds the cost of huge uploads
+SUMMARY_SOURCE_MAX_CHARS = int(os.getenv("SUMMARY_SOURCE_MAX_CHARS", "200000"))
+# Completion allowance for question answers, streamed or not
+QUESTION_MAX_TOKENS = 800
+
 # Global variables to store state
-study_sessions = {}
+# Sessions live in a bounded store (SESSION_STORE=sqlite shares them across workers);
+# sessions read from it may be copies, so changes go back through study_sessions.update()
+study_sessions = create_session_store()
+# Live job progress for extractions running in this process; share_job() copies it
+# into the session store so a poll landing on another worker still finds the job
+processing_jobs = {}
+processing_jobs_lock = threading.Lock()
+extraction_executor: Optional[ThreadPoolExecutor] = None
 api_status = {
   "available": False,
   "quota_exceeded": False,
@@ -137,8 +220,8 @@ api_status = {
   "consecutive_failures": 0
 }
 
-# Initialize agents with error handling
-client = None
+# Shared agents, bound by AgentContainer when the app starts (None until then or if one failed to build)
+client: Optional[AsyncGroqClient] = None
 pdf_processor = None
 summary_agent = None
 flashcard_agent = None
@@ -148,51 +231,164 @@ youtube_agent = None
 web_agent = None
 presentation_agent = None 
 coordinator_agent = None
+study_pack_agent = None
 
-def check_api_status():
-  """Check Groq API status and update global status"""
-  global api_status
-  
-  current_time = time.time()
-  
-  # Only check every 60 seconds to avoid spam
-  if current_time - api_status["last_check"] < 60:
-      return api_status["available"]
-  
-  try:
-      if client:
-          test_response = client.chat_completion(
-              [{"role": "user", "content": "Test"}],
-              max_tokens=5
-          )
-          
-          if "❌" in test_response:
-              if "quota" in test_response.lower() or "429" in test_response:
-                  api_status["quota_exceeded"] = True
-                  api_status["available"] = False
-                  api_status["consecutive_failures"] += 1
-              else:
-                  api_status["available"] = False
-                  api_status["consecutive_failures"] += 1
-          else:
-              api_status["available"] = True
-              api_status["quota_exceeded"] = False
-              api_status["consecutive_failures"] = 0
-      else:
-          api_status["available"] = False
-          
-  except Exception as e:
-      api_status["available"] = False
-      api_status["consecutive_failures"] += 1
-      logger.error(f"API status check failed: {e}")
-  
-  api_status["last_check"] = current_time
-  
-  # Log status changes
-  if api_status["consecutive_failures"] > 0:
-      logger.warning(f"⚠️ API issues detected. Consecutive failures: {api_status['consecutive_failures']}")
-  
-  return api_status["available"]
+async def check_api_status():
+    """Update the global API status from the outcomes of real Groq calls.
+
+    No request is sent: availability comes from the client's circuit breakers and
+    rate-limit budget, read off the event loop when that budget is shared through
+    SQLite. Models recover through the breakers' half-open probes, or through the
+    optional background probe task.
+    """
+    global api_status
+    
+    if client:
+        health = await client.limiter.offload(client.health_status)
+        previous_failures = api_status["consecutive_failures"]
+        api_status.update(
+            available=health["available"],
+            quota_exceeded=health["quota_exceeded"],
+            consecutive_failures=health["consecutive_failures"]
+        )
+        # Log status changes
+        if health["consecutive_failures"] > previous_failures:
+            logger.warning(f"⚠️ API issues detected. Consecutive failures: {health['consecutive_failures']}")
+    else:
+        api_status["available"] = False
+    
+    api_status["last_check"] = time.time()
+    return api_status["available"]
+
+async def health_probe_loop(interval: float):
+    """Probe Groq in the background when no real call has succeeded for interval seconds"""
+    while True:
+        await asyncio.sleep(interval)
+        if not client:
+            continue
+        last_success = client.health.last_success()
+        if last_success and time.time() - last_success < interval:
+            continue
+        try:
+            response = await client.achat_completion(
+                [{"role": "user", "content": "Test"}], max_tokens=5, retry_count=1, deadline=15.0, use_cache=False, task="health"
+            )
+            logger.info(f"🩺 Background API probe: {'ok' if not response.startswith('❌') else response}")
+        except Exception as e:
+            logger.error(f"Background API probe failed: {e}")
+
+# Module-level names the request handlers use, keyed by their AgentRegistry name
+AGENT_GLOBALS = {
+    "client": "client",
+    "pdf_processor": "pdf_processor",
+    "summary": "summary_agent",
+    "flashcards": "flashcard_agent",
+    "quiz": "quiz_agent",
+    "research": "research_agent",
+    "youtube": "youtube_agent",
+    "web": "web_agent",
+    "presentation": "presentation_agent",
+    "coordinator": "coordinator_agent",
+    "study_pack": "study_pack_agent"
+}
+
+class AgentContainer:
+    """Everything one worker shares across requests: the pooled AsyncGroqClient, the
+    agents built on it, their HTTP sessions and caches, and the extraction thread pool.
+
+    start() builds all agents up front and warms the Groq connection pool, so the
+    first request pays no setup cost; close() releases them in reverse. An agent
+    that fails to build is logged and left as None, and its endpoints use fallbacks.
+    """
+
+    def __init__(self):
+        self.registry = AgentRegistry(client=AsyncGroqClient())
+        self.extraction_executor = None
+        self.health_probe = None
+        self.failed = {}
+        self.startup_seconds = None
+        self.warm_up_result = {}
+
+    async def start(self):
+        started = time.perf_counter()
+        # Constructors block (tesseract check, SQLite caches, API client setup), so build off the loop
+        await asyncio.to_thread(self._build_agents)
+        self.extraction_executor = ThreadPoolExecutor(max_workers=MAX_EXTRACTION_JOBS, thread_name_prefix="pdf-extraction")
+        bind_agents(self)
+        await self.warm_up()
+
+        # GROQ_HEALTH_PROBE_SECONDS=0 (default) relies on real traffic alone
+        interval = float(os.getenv("GROQ_HEALTH_PROBE_SECONDS", "0"))
+        if interval > 0:
+            self.health_probe = asyncio.create_task(health_probe_loop(interval))
+            logger.info(f"🩺 Background API probe every {interval:g}s")
+        self.startup_seconds = round(time.perf_counter() - started, 3)
+        logger.info(f"✅ Agents ready in {self.startup_seconds}s ({len(self.registry.loaded())} loaded, {len(self.failed)} failed)")
+
+    def _build_agents(self):
+        for name in AGENT_GLOBALS:
+            try:
+                self.registry.get(name)
+            except Exception as e:
+                self.failed[name] = str(e)
+                logger.error(f"❌ Failed to initialize {name}: {e}")
+
+    def agent(self, name: str):
+        return None if name in self.failed else self.registry.get(name)
+
+    async def warm_up(self):
+        """Open the Groq keep-alive connection and load the tokenizer before traffic arrives"""
+        started = time.perf_counter()
+        await asyncio.to_thread(count_tokens, "warm up")
+        groq = self.agent("client")
+        if groq and groq.async_client and os.getenv("GROQ_WARMUP", "1") != "0":
+            try:
+                # Listing models sets up TLS and the pooled connection without spending tokens
+                await asyncio.wait_for(groq.async_client.with_options(max_retries=0).models.list(), timeout=10.0)
+                self.warm_up_result["groq_connection"] = "ok"
+            except Exception as e:
+                self.warm_up_result["groq_connection"] = f"failed: {str(e) or type(e).__name__}"
+                logger.warning(f"⚠️ Groq warm-up failed: {e}")
+        self.warm_up_result["seconds"] = round(time.perf_counter() - started, 3)
+
+    async def close(self):
+        if self.health_probe:
+            self.health_probe.cancel()
+            try:
+                await self.health_probe
+            except asyncio.CancelledError:
+                pass
+        bind_agents(None)
+        if self.extraction_executor:
+            # Running jobs finish in the background; queued ones are dropped with the process
+            self.extraction_executor.shutdown(wait=False, cancel_futures=True)
+        for name in self.registry.loaded():
+            session = getattr(self.registry.get(name), "session", None)
+            if session is not None and hasattr(session, "close"):
+                session.close()
+        groq = self.registry.get("client") if "client" in self.registry.loaded() else None
+        if groq and hasattr(groq, "aclose"):
+            await groq.aclose()
+        elif groq:
+            groq.close()
+        self.registry.close()
+        logger.info("👋 Agents shut down")
+
+    def status(self) -> Dict:
+        return {
+            "loaded": self.registry.loaded(),
+            "failed": self.failed,
+            "startup_seconds": self.startup_seconds,
+            "warm_up": self.warm_up_result,
+            "health_probe": self.health_probe is not None and not self.health_probe.done()
+        }
+
+def bind_agents(container: Optional[AgentContainer]):
+    """Point the module-level agent names at the container's agents (None unbinds them)"""
+    global extraction_executor
+    for name, global_name in AGENT_GLOBALS.items():
+        globals()[global_name] = container.agent(name) if container else None
+    extraction_executor = container.extraction_executor if container else None
 
 def generate_fallback_summary(text: str) -> str:
   """Generate a basic summary without AI when quota is exceeded"""
@@ -343,17 +539,15 @@ async def generate_presentation(
 ):
     """Generate presentation using the coordinator agent"""
     try:
-        if session_id not in study_sessions:
+        session = await study_sessions.aget(session_id)
+        if session is None:
             raise HTTPException(status_code=404, detail="No session found. Please upload a PDF first.")
             
         if not coordinator_agent:
             raise HTTPException(status_code=503, detail="Presentation service not available")
             
-        # Get text from session
-        text = study_sessions[session_id]["text"]
-        
         # Limit text length for processing
-        presentation_text = text[:8000]  # Limit to first 8000 characters
+        presentation_text = session_text(session, 8000)
         
         logger.info(f"🎨 Generating presentation from {len(presentation_text)} characters of text")
         
@@ -380,7 +574,7 @@ async def generate_presentation(
             raise HTTPException(status_code=500, detail="Failed to generate PPTX file")
         
         # Store in session
-        study_sessions[session_id]["presentation_path"] = pptx_path
+        await study_sessions.aupdate(session_id, presentation_path=pptx_path)
         
         return PresentationResponse(
             status="success",
@@ -421,12 +615,12 @@ async def test_presentation():
                 "status": "error",
                 "message": "Coordinator agent is None (not initialized)",
                 "coordinator_available": False,
-                "api_available": check_api_status(),
+                "api_available": await check_api_status(),
                 "debug": "Agent not initialized during startup"
             }
         
         # Check API
-        api_status = check_api_status()
+        api_status = await check_api_status()
         logger.info(f"API status: {api_status}")
         
         return {
@@ -455,7 +649,7 @@ async def generate_presentation_simple(topic: str = "Machine Learning"):
         if not coordinator_agent:
             return {"error": "Coordinator not available"}
         
-        if not check_api_status():
+        if not await check_api_status():
             return {"error": "API not available"}
         
         logger.info(f"🧪 Testing simple presentation generation: {topic}")
@@ -489,10 +683,11 @@ async def generate_presentation_simple(topic: str = "Machine Learning"):
 @app.get("/download-presentation/{session_id}")
 async def download_presentation(session_id: str):
     """Download generated presentation"""
-    if session_id not in study_sessions:
+    session = await study_sessions.aget(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="No session found")
     
-    presentation_path = study_sessions[session_id].get("presentation_path")
+    presentation_path = session.get("presentation_path")
     if not presentation_path or not os.path.exists(presentation_path):
         raise HTTPException(status_code=404, detail="No presentation file found")
     
@@ -506,7 +701,7 @@ async def download_presentation(session_id: str):
 @app.get("/health")
 async def health_check():
     """Enhanced health check"""
-    is_api_available = check_api_status()
+    is_api_available = await check_api_status()
     
     health_status = {
         "status": "healthy",
@@ -520,12 +715,91 @@ async def health_check():
         "groq_key_configured": bool(os.getenv("GROQ_API_KEY")),
         "fallback_mode": not is_api_available,
         "active_sessions": len(study_sessions),
+        "session_store": await study_sessions.offload(study_sessions.stats),
         "consecutive_api_failures": api_status["consecutive_failures"],
-        "presentation_service": presentation_agent is not None  # Add this
+        "presentation_service": presentation_agent is not None,  # Add this
+        "extraction_cache": pdf_processor.cache.stats() if pdf_processor and pdf_processor.cache else None,
+        "model_circuits": client.breaker.snapshot() if client else {},
+        "model_health": client.health.snapshot() if client else {},
+        "llm_response_cache": client.cache_stats() if client else None,
+        "agent_container": app.state.agents.status() if hasattr(app.state, "agents") else None
     }
     
     return health_status
 
+def build_session(result: Dict, filename: str, file_size: int, partial: bool = False) -> Dict:
+  """Session entry for an extraction result (partial while a background job is running)"""
+  return {
+      "text": result["text"],
+      "document": result.get("document"),
+      "file_info": f"File: {filename} ({file_size/1024/1024:.2f} MB)",
+      "processing_result": result,
+      "filename": filename,
+      "partial": partial,
+      "page_store": result.get("page_store")
+  }
+
+def session_text(session: Dict, max_chars: int) -> str:
+  """Leading session text within max_chars, cut at a paragraph boundary when possible"""
+  document = session.get("document")
+  if document is not None:
+      return document.head(max_chars)
+  text = session["text"]
+  return text[:max_chars] + "..." if len(text) > max_chars else text
+
+def summary_source(session: Dict) -> str:
+  """Text to summarize, within SUMMARY_SOURCE_MAX_CHARS.
+
+  Large documents are read from their page store, since the session only holds a
+  preview of them. Reads the store, so call it from a thread.
+  """
+  store_path = session.get("page_store")
+  if store_path:
+      pages, total = {}, 0
+      try:
+          for page_number, method, text in PageStore(store_path).read_pages():
+              if pages and total + len(text) > SUMMARY_SOURCE_MAX_CHARS:
+                  break
+              pages[page_number] = (method, text)
+              total += len(text)
+      except sqlite3.Error as e:
+          logger.warning(f"⚠️ Page store unavailable, summarizing the preview: {e}")
+          pages = {}
+      if pages:
+          return ExtractedDocument.from_pages(pages).text
+  return session_text(session, SUMMARY_SOURCE_MAX_CHARS)
+
+async def stream_upload_to_temp_file(file: UploadFile) -> tuple:
+  """Copy an upload to a temp file chunk by chunk.
+
+  Returns (path, size, sha256). Raises 400 as soon as the size limit is crossed
+  and never holds more than one chunk of the upload in memory.
+  """
+  digest = hashlib.sha256()
+  file_size = 0
+  temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
+  
+  def write_chunk(chunk: bytes):
+      digest.update(chunk)
+      temp_file.write(chunk)
+  
+  try:
+      with temp_file:
+          while True:
+              chunk = await file.read(UPLOAD_CHUNK_SIZE)
+              if not chunk:
+                  break
+              file_size += len(chunk)
+              if file_size > MAX_UPLOAD_BYTES:
+                  raise HTTPException(status_code=400, detail="File too large. Maximum size is 50MB")
+              # Hashing and disk writes run in a worker thread so slow disks don't stall the event loop
+              await asyncio.to_thread(write_chunk, chunk)
+  except BaseException:
+      os.unlink(temp_file.name)
+      raise
+  
+  return temp_file.name, file_size, digest.hexdigest()
+
 @app.post("/upload-pdf", response_model=ProcessingStatus)
 async def upload_pdf(file: UploadFile = File(...)):
   """Upload and process PDF file - This works without AI"""
@@ -536,30 +810,24 @@ async def upload_pdf(file: UploadFile = File(...)):
   if not file.filename.lower().endswith('.pdf'):
       raise HTTPException(status_code=400, detail="Only PDF files are allowed")
   
-  # Check file size (limit to 50MB)
-  content = await file.read()
-  file_size = len(content)
-  
-  if file_size > 50 * 1024 * 1024:  # 50MB limit
+  if file.size is not None and file.size > MAX_UPLOAD_BYTES:
       raise HTTPException(status_code=400, detail="File too large. Maximum size is 50MB")
   
-  if file_size == 0:
-      raise HTTPException(status_code=400, detail="Empty file uploaded")
-  
   temp_file_path = None
   
   try:
-      logger.info(f"📄 Processing PDF: {file.filename} ({file_size/1024/1024:.2f}MB)")
+      # Stream to disk in chunks, hashing and size-checking as we go
+      temp_file_path, file_size, content_hash = await stream_upload_to_temp_file(file)
+      
+      if file_size == 0:
+          raise HTTPException(status_code=400, detail="Empty file uploaded")
       
-      # Create temporary file
-      with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-          temp_file.write(content)
-          temp_file_path = temp_file.name
+      logger.info(f"📄 Processing PDF: {file.filename} ({file_size/1024/1024:.2f}MB)")
       
       # Process PDF with timeout handling
       try:
           result = await asyncio.wait_for(
-              asyncio.to_thread(pdf_processor.extract_text_with_ocr, temp_file_path),
+              asyncio.to_thread(pdf_processor.extract_text_with_ocr, temp_file_path, content_hash=content_hash),
               timeout=120.0  # 2 minutes timeout
           )
       except asyncio.TimeoutError:
@@ -579,12 +847,7 @@ async def upload_pdf(file: UploadFile = File(...)):
       
       # Store session data
       session_id = "default"
-      study_sessions[session_id] = {
-          "text": result["text"],
-          "file_info": f"File: {file.filename} ({file_size/1024/1024:.2f} MB)",
-          "processing_result": result,
-          "filename": file.filename
-      }
+      await study_sessions.aset(session_id, build_session(result, file.filename, file_size))
       
       logger.info(f"✅ PDF processed successfully: {result['word_count']} words extracted")
       
@@ -593,7 +856,8 @@ async def upload_pdf(file: UploadFile = File(...)):
           message=result["message"],
           word_count=result["word_count"],
           page_count=result["page_count"],
-          methods_used=result["methods_used"]
+          methods_used=result["methods_used"],
+          session_id=session_id
       )
   
   except HTTPException:
@@ -610,29 +874,239 @@ async def upload_pdf(file: UploadFile = File(...)):
           except Exception as e:
               logger.warning(f"⚠️ Failed to cleanup temp file: {e}")
 
+def run_extraction_job(job_id: str, temp_file_path: str, content_hash: str):
+  """Run PDF extraction for a background job, publishing partial text as pages land"""
+  job = processing_jobs[job_id]
+  page_texts = {}
+  # published_at starts at 0 so the first page is published right away; version
+  # numbers snapshots so a slow write never replaces a newer one
+  partial = {"chars": 0, "unpublished": 0, "published_at": 0.0, "version": 0, "written": 0}
+  # OCR workers report pages from several threads; this orders their session writes
+  publish_lock = threading.Lock()
+  
+  def take_snapshot():
+      # Called with processing_jobs_lock held: copy the pages, nothing more
+      partial["unpublished"] = 0
+      partial["published_at"] = time.monotonic()
+      partial["version"] += 1
+      return partial["version"], dict(page_texts)
+  
+  def publish_partial(snapshot):
+      # Runs after processing_jobs_lock is released so status polls never wait on it
+      version, pages = snapshot
+      document = ExtractedDocument.from_pages(pages)
+      partial_result = {
+          "text": document.text,
+          "document": document,
+          "status": "processing",
+          "message": "⏳ Extraction in progress",
+          "word_count": document.word_count,
+          "page_count": job["pages_total"],
+          "methods_used": []
+      }
+      session = build_session(partial_result, job["filename"], job["file_size"], partial=True)
+      with publish_lock:
+          if version <= partial["written"]:
+              return
+          study_sessions.set(job["session_id"], session)
+          partial["written"] = version
+          with processing_jobs_lock:
+              job["word_count"] = partial_result["word_count"]
+          share_job(job)
+  
+  def on_progress(event: Dict):
+      snapshot = None
+      with processing_jobs_lock:
+          if event["event"] == "started":
+              job["pages_total"] = event["pages_total"]
+          elif event["event"] == "ocr_started":
+              job["ocr_pages_pending"] = event["ocr_pages"]
+              # The text layer is done; don't hold its last pages back while OCR runs
+              if partial["unpublished"]:
+                  snapshot = take_snapshot()
+          elif event["event"] == "page":
+              if event["method"] == "ocr":
+                  job["ocr_pages_pending"] = max(0, job["ocr_pages_pending"] - 1)
+              else:
+                  job["pages_done"] += 1
+              if event["text"] and partial["chars"] < PARTIAL_TEXT_MAX_CHARS:
+                  partial["chars"] += len(event["text"])
+                  page_texts[event["page"]] = (event["method"], event["text"])
+                  partial["unpublished"] += 1
+                  if (partial["unpublished"] >= PARTIAL_SESSION_PAGES
+                          or partial["chars"] >= PARTIAL_TEXT_MAX_CHARS
+                          or time.monotonic() - partial["published_at"] >= PARTIAL_SESSION_SECONDS):
+                      snapshot = take_snapshot()
+      if snapshot:
+          publish_partial(snapshot)
+  
+  try:
+      with processing_jobs_lock:
+          job["status"] = "processing"
+          job["message"] = "⏳ Extracting text"
+          job["started_at"] = time.time()
+      share_job(job)
+      result = pdf_processor.extract_text_with_ocr(
+          temp_file_path, content_hash=content_hash, progress_callback=on_progress
+      )
+      
+      failed = result["status"] == "error" or result["word_count"] < 10
+      # The session is settled before the job reports it, so a poll that sees
+      # "completed" can read the full document
+      with publish_lock:
+          partial["written"] = partial["version"] + 1
+          if failed:
+              study_sessions.delete(job["session_id"])
+          else:
+              study_sessions.set(job["session_id"], build_session(result, job["filename"], job["file_size"]))
+      
+      with processing_jobs_lock:
+          job["pages_done"] = job["pages_total"] = len(result.get("page_timings", [])) or job["pages_total"]
+          job["ocr_pages_pending"] = 0
+          job["word_count"] = result["word_count"]
+          job["message"] = result["message"]
+          if failed:
+              job["status"] = "failed"
+              job["message"] = result["message"] if result["status"] == "error" else \
+                  "Very little text could be extracted. PDF may be image-based, protected, or corrupted."
+          else:
+              job["status"] = "completed"
+      logger.info(f"✅ Extraction job {job_id} {job['status']}: {job['word_count']} words")
+  
+  except Exception as e:
+      logger.error(f"❌ Extraction job {job_id} failed: {str(e)}")
+      # A partial session from a failed job must not pass for the document
+      with publish_lock:
+          partial["written"] = partial["version"] + 1
+          study_sessions.delete(job["session_id"])
+      with processing_jobs_lock:
+          job["status"] = "failed"
+          job["message"] = f"Processing failed: {str(e)}"
+  
+  finally:
+      with processing_jobs_lock:
+          job["finished_at"] = time.time()
+      share_job(job)
+      try:
+          os.unlink(temp_file_path)
+      except Exception as e:
+          logger.warning(f"⚠️ Failed to cleanup temp file: {e}")
+
+def share_job(job: Dict):
+  """Publish a copy of the job's status to the session store for other workers"""
+  with processing_jobs_lock:
+      snapshot = dict(job)
+  study_sessions.set_job(snapshot["job_id"], snapshot)
+
+def prune_finished_jobs():
+  """Forget jobs that finished more than FINISHED_JOB_TTL seconds ago"""
+  cutoff = time.time() - FINISHED_JOB_TTL
+  with processing_jobs_lock:
+      for job_id in [j for j, job in processing_jobs.items() if job.get("finished_at") and job["finished_at"] < cutoff]:
+          del processing_jobs[job_id]
+
+def estimate_job_eta(job: Dict) -> Optional[float]:
+  """Estimate remaining seconds from the average time per finished unit of work"""
+  if job["status"] in ("completed", "failed"):
+      return 0.0
+  done = job["pages_done"]
+  remaining = max(0, job["pages_total"] - done) + job["ocr_pages_pending"]
+  if not job.get("started_at") or done == 0:
+      return None
+  elapsed = time.time() - job["started_at"]
+  return round(elapsed / done * remaining, 1)
+
+@app.post("/upload-pdf-async", response_model=JobCreatedResponse)
+async def upload_pdf_async(file: UploadFile = File(...), session_id: str = "default"):
+  """Upload a PDF and extract it in the background; poll /upload-status/{job_id} for progress"""
+  
+  if not file.filename:
+      raise HTTPException(status_code=400, detail="No filename provided")
+  
+  if not file.filename.lower().endswith('.pdf'):
+      raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+  
+  if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+      raise HTTPException(status_code=400, detail="File too large. Maximum size is 50MB")
+  
+  temp_file_path, file_size, content_hash = await stream_upload_to_temp_file(file)
+  if file_size == 0:
+      os.unlink(temp_file_path)
+      raise HTTPException(status_code=400, detail="Empty file uploaded")
+  
+  prune_finished_jobs()
+  job_id = uuid.uuid4().hex
+  with processing_jobs_lock:
+      processing_jobs[job_id] = {
+          "job_id": job_id,
+          "session_id": session_id,
+          "status": "queued",
+          "message": "Waiting for an extraction worker",
+          "filename": file.filename,
+          "file_size": file_size,
+          "pages_total": 0,
+          "pages_done": 0,
+          "ocr_pages_pending": 0,
+          "word_count": 0,
+          "created_at": time.time()
+      }
+  await study_sessions.offload(share_job, processing_jobs[job_id])
+  
+  extraction_executor.submit(run_extraction_job, job_id, temp_file_path, content_hash)
+  logger.info(f"📄 Queued extraction job {job_id}: {file.filename} ({file_size/1024/1024:.2f}MB)")
+  
+  return JobCreatedResponse(
+      job_id=job_id,
+      session_id=session_id,
+      status="queued",
+      status_url=f"/upload-status/{job_id}"
+  )
+
+@app.get("/upload-status/{job_id}", response_model=JobStatusResponse)
+async def upload_status(job_id: str):
+  """Report progress of a background extraction job"""
+  
+  with processing_jobs_lock:
+      job = processing_jobs.get(job_id)
+      job = dict(job) if job else None
+  if job is None:
+      # Running (or finished) on another worker; its last shared status is close enough
+      job = await study_sessions.offload(study_sessions.get_job, job_id)
+  if job is None:
+      raise HTTPException(status_code=404, detail="Job not found")
+  return JobStatusResponse(
+      job_id=job_id,
+      session_id=job["session_id"],
+      status=job["status"],
+      message=job["message"],
+      filename=job["filename"],
+      pages_total=job["pages_total"],
+      pages_done=job["pages_done"],
+      ocr_pages_pending=job["ocr_pages_pending"],
+      eta_seconds=estimate_job_eta(job),
+      word_count=job["word_count"],
+      partial_text_available=job["word_count"] > 0
+  )
+
 @app.post("/generate-summary", response_model=SummaryResponse)
 async def generate_summary(session_id: str = "default"):
   """Generate summary with fallback support"""
   
-  if session_id not in study_sessions:
+  session = await study_sessions.aget(session_id)
+  if session is None:
       raise HTTPException(status_code=404, detail="No document found. Please upload a PDF first.")
   
-  text = study_sessions[session_id]["text"]
-  is_api_available = check_api_status()
+  # Documents beyond the model context are summarized chunk by chunk
+  text = await asyncio.to_thread(summary_source, session)
+  is_api_available = await check_api_status()
   
   try:
       if is_api_available and summary_agent:
-          logger.info("📝 Generating AI summary...")
-          
-          # Limit text length for faster processing
-          max_chars = 8000
-          if len(text) > max_chars:
-              text = text[:max_chars] + "..."
-              logger.info(f"📝 Text truncated to {max_chars} characters for faster processing")
+          logger.info(f"📝 Generating AI summary from {len(text)} characters...")
           
           # Generate summary with timeout
           summary = await asyncio.wait_for(
-              asyncio.to_thread(summary_agent.generate_summary, text),
+              summary_agent.agenerate_summary(text, deadline=85.0),
               timeout=90.0
           )
           
@@ -660,31 +1134,71 @@ async def generate_summary(session_id: str = "default"):
       summary = generate_fallback_summary(text)
       return SummaryResponse(summary=summary, status="success", fallback_used=True)
 
+@app.post("/generate-summary/stream")
+async def generate_summary_stream(session_id: str = "default"):
+  """Stream the summary as server-sent events, one event per generated chunk"""
+  
+  session = await study_sessions.aget(session_id)
+  if session is None:
+      raise HTTPException(status_code=404, detail="No document found. Please upload a PDF first.")
+  
+  text = await asyncio.to_thread(summary_source, session)
+  chunks = None
+  if await check_api_status() and summary_agent:
+      logger.info("📝 Streaming AI summary...")
+      chunks = summary_agent.astream_summary(text, map_deadline=85.0)
+  
+  return sse_response(chunks, lambda: generate_fallback_summary(text))
+
+def sse_response(chunks, fallback: Callable[[], str]) -> StreamingResponse:
+  """Relay streamed AI text as server-sent events.
+
+  Each chunk is sent as {"token": ...}. If the AI fails before its first token
+  the fallback text is sent instead, and a final {"done": true, "fallback_used": ...}
+  event closes the stream.
+  """
+  async def events():
+      streamed = False
+      if chunks is not None:
+          try:
+              async for chunk in chunks:
+                  if not streamed and chunk.startswith("❌"):
+                      logger.warning(f"AI stream failed, using fallback: {chunk}")
+                      break
+                  streamed = True
+                  yield f"data: {json.dumps({'token': chunk})}\n\n"
+          except Exception as e:
+              logger.error(f"❌ AI stream error: {str(e)}")
+      if not streamed:
+          yield f"data: {json.dumps({'token': fallback()})}\n\n"
+      yield f"data: {json.dumps({'done': True, 'fallback_used': not streamed})}\n\n"
+  
+  return StreamingResponse(events(), media_type="text/event-stream",
+                           headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/generate-flashcards", response_model=FlashcardResponse)
 async def generate_flashcards(session_id: str = "default", num_cards: int = 10):
   """Generate flashcards with fallback support"""
   
-  if session_id not in study_sessions:
+  session = await study_sessions.aget(session_id)
+  if session is None:
       raise HTTPException(status_code=404, detail="No document found. Please upload a PDF first.")
   
   if num_cards < 1 or num_cards > 20:
       num_cards = min(max(num_cards, 1), 20)
   
-  text = study_sessions[session_id]["text"]
-  is_api_available = check_api_status()
+  text = session["text"]
+  is_api_available = await check_api_status()
   
   try:
       if is_api_available and flashcard_agent:
           logger.info(f"🃏 Generating {num_cards} AI flashcards...")
           
-          # Limit text length for faster processing
-          max_chars = 6000
-          if len(text) > max_chars:
-              text = text[:max_chars] + "..."
+          text = session_text(session, AI_SOURCE_MAX_CHARS)
           
           # Generate flashcards with timeout
           flashcards = await asyncio.wait_for(
-              asyncio.to_thread(flashcard_agent.generate_flashcards_structured, text, num_cards),
+              flashcard_agent.agenerate_flashcards_structured(text, num_cards, deadline=115.0),
               timeout=120.0
           )
           
@@ -716,27 +1230,25 @@ async def generate_flashcards(session_id: str = "default", num_cards: int = 10):
 async def generate_quiz(session_id: str = "default", num_questions: int = 8):
   """Generate quiz with fallback support"""
   
-  if session_id not in study_sessions:
+  session = await study_sessions.aget(session_id)
+  if session is None:
       raise HTTPException(status_code=404, detail="No document found. Please upload a PDF first.")
   
   if num_questions < 1 or num_questions > 15:
       num_questions = min(max(num_questions, 1), 15)
   
-  text = study_sessions[session_id]["text"]
-  is_api_available = check_api_status()
+  text = session["text"]
+  is_api_available = await check_api_status()
   
   try:
       if is_api_available and quiz_agent:
           logger.info(f"📝 Generating {num_questions} AI quiz questions...")
           
-          # Limit text length for faster processing
-          max_chars = 6000
-          if len(text) > max_chars:
-              text = text[:max_chars] + "..."
+          text = session_text(session, AI_SOURCE_MAX_CHARS)
           
           # Generate quiz with timeout
           quiz = await asyncio.wait_for(
-              asyncio.to_thread(quiz_agent.generate_quiz_structured, text, num_questions),
+              quiz_agent.agenerate_quiz_structured(text, num_questions, deadline=115.0),
               timeout=120.0
           )
           
@@ -764,11 +1276,77 @@ async def generate_quiz(session_id: str = "default", num_questions: int = 8):
       quiz = generate_fallback_quiz(text, num_questions)
       return QuizResponse(quiz=quiz, count=len(quiz), status="success", fallback_used=True)
 
+@app.post("/generate-study-pack", response_model=StudyPackResponse)
+async def generate_study_pack(session_id: str = "default", num_cards: int = 10, num_questions: int = 8):
+  """Generate summary, flashcards, quiz and keywords in one AI request"""
+  
+  session = await study_sessions.aget(session_id)
+  if session is None:
+      raise HTTPException(status_code=404, detail="No document found. Please upload a PDF first.")
+  
+  num_cards = min(max(num_cards, 1), 20)
+  num_questions = min(max(num_questions, 1), 15)
+  text = session_text(session, AI_SOURCE_MAX_CHARS)
+  
+  def fallback_pack() -> StudyPackResponse:
+      topic, keywords = extract_keywords_fallback(text)
+      return StudyPackResponse(
+          summary=generate_fallback_summary(text),
+          flashcards=generate_fallback_flashcards(text, num_cards),
+          quiz=generate_fallback_quiz(text, num_questions),
+          topic=topic,
+          keywords=keywords,
+          status="success",
+          fallback_sections=list(StudyPackAgent.SECTIONS),
+          fallback_used=True
+      )
+  
+  try:
+      if await check_api_status() and study_pack_agent:
+          logger.info(f"📦 Generating study pack ({num_cards} flashcards, {num_questions} questions)...")
+          pack = await asyncio.wait_for(
+              study_pack_agent.agenerate_study_pack(text, num_cards, num_questions, deadline=110.0),
+              timeout=180.0
+          )
+          
+          summary = pack["summary"]
+          if summary.startswith("❌"):
+              summary = generate_fallback_summary(text)
+          flashcards = pack["flashcards"] or generate_fallback_flashcards(text, num_cards)
+          quiz = pack["quiz"] or generate_fallback_quiz(text, num_questions)
+          
+          # Discovery endpoints reuse these instead of asking the AI for keywords again
+          await study_sessions.aupdate(session_id, keywords=pack["keywords"])
+          
+          logger.info(f"✅ Study pack generated (regenerated sections: {pack['fallback_sections']})")
+          return StudyPackResponse(
+              summary=summary,
+              flashcards=flashcards,
+              quiz=quiz,
+              topic=pack["keywords"]["topic"],
+              keywords=pack["keywords"]["keywords"],
+              status="success",
+              fallback_sections=pack["fallback_sections"],
+              fallback_used=bool(pack["fallback_sections"])
+          )
+      
+      else:
+          logger.info("📦 Generating fallback study pack (API unavailable)...")
+          return fallback_pack()
+  
+  except asyncio.TimeoutError:
+      logger.error("❌ Study pack generation timeout, using fallback")
+      return fallback_pack()
+  except Exception as e:
+      logger.error(f"❌ Study pack generation error: {str(e)}, using fallback")
+      return fallback_pack()
+
 @app.post("/discover-research", response_model=ResearchPapersResponse)
 async def discover_research(session_id: str = "default", max_papers: int = 10):
   """Discover research papers - works without AI quota"""
   
-  if session_id not in study_sessions:
+  session = await study_sessions.aget(session_id)
+  if session is None:
       raise HTTPException(status_code=404, detail="No document found. Please upload a PDF first.")
   
   if max_papers > 15:
@@ -776,7 +1354,7 @@ async def discover_research(session_id: str = "default", max_papers: int = 10):
   
   try:
       logger.info("🔍 Discovering research papers...")
-      text = study_sessions[session_id]["text"]
+      text = session["text"]
       
       # This can work even with quota issues since it mainly uses web search
       papers = await asyncio.wait_for(
@@ -800,7 +1378,8 @@ async def discover_research(session_id: str = "default", max_papers: int = 10):
 async def discover_videos(session_id: str = "default", max_videos: int = 10):
     """Discover YouTube videos - FIXED VERSION"""
     
-    if session_id not in study_sessions:
+    session = await study_sessions.aget(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="No document found. Please upload a PDF first.")
     
     if max_videos > 12:
@@ -808,11 +1387,15 @@ async def discover_videos(session_id: str = "default", max_videos: int = 10):
     
     try:
         logger.info("🎥 Starting video discovery...")
-        text = study_sessions[session_id]["text"]
+        text = session["text"]
         
         # Extract keywords with better fallback
         try:
-            if check_api_status() and research_agent:
+            if session.get("keywords"):
+                # Already extracted by /generate-study-pack
+                topic = session["keywords"]["topic"]
+                research_keywords = session["keywords"]["keywords"]
+            elif await check_api_status() and research_agent:
                 topic, research_keywords, all_keywords = await asyncio.wait_for(
                     asyncio.to_thread(research_agent.extract_smart_keywords_and_topic, text),
                     timeout=30.0
@@ -907,7 +1490,8 @@ def generate_placeholder_videos(text: str, max_videos: int) -> List[Dict]:
 async def discover_resources(session_id: str = "default", max_resources: int = 12):
     """Discover web resources - FIXED VERSION"""
     
-    if session_id not in study_sessions:
+    session = await study_sessions.aget(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="No document found. Please upload a PDF first.")
     
     if max_resources > 15:
@@ -915,11 +1499,15 @@ async def discover_resources(session_id: str = "default", max_resources: int = 1
     
     try:
         logger.info("🌐 Discovering web resources...")
-        text = study_sessions[session_id]["text"]
+        text = session["text"]
         
         # Extract keywords with fallback
         try:
-            if check_api_status() and research_agent:
+            if session.get("keywords"):
+                # Already extracted by /generate-study-pack
+                topic = session["keywords"]["topic"]
+                research_keywords = session["keywords"]["keywords"]
+            elif await check_api_status() and research_agent:
                 topic, research_keywords, all_keywords = await asyncio.wait_for(
                     asyncio.to_thread(research_agent.extract_smart_keywords_and_topic, text),
                     timeout=30.0
@@ -984,41 +1572,25 @@ async def ask_question(request: QuestionRequest):
   if not request.document_text.strip():
       raise HTTPException(status_code=400, detail="No document text provided")
   
-  is_api_available = check_api_status()
+  is_api_available = await check_api_status()
+  document_text = await asyncio.to_thread(question_context, request, AI_SOURCE_MAX_CHARS)
   
   try:
       if is_api_available and client:
           logger.info(f"❓ Answering question with AI: {request.question[:50]}...")
           
-          # Limit text for analysis
-          max_chars = 6000
-          text_content = request.document_text[:max_chars]
-          if len(request.document_text) > max_chars:
-              text_content += "..."
-
-          prompt = f"""Based on the following document content, please answer the question comprehensively and accurately.
-
-Document Content:
-{text_content}
-
-Question: {request.question}
-
-Instructions:
-- Provide a detailed, accurate answer based on the document
-- If the information isn't in the document, say so clearly
-- Use specific examples from the document when possible
-- Keep the answer well-structured and easy to understand"""
+          prompt = fit_question_prompt(request.question, document_text)
 
           # Generate answer with timeout
           response = await asyncio.wait_for(
-              asyncio.to_thread(client.chat_completion, [{"role": "user", "content": prompt}], None, 800),
+              client.achat_completion([{"role": "user", "content": prompt}], max_tokens=QUESTION_MAX_TOKENS, deadline=55.0, task="answer"),
               timeout=60.0
           )
           
           if response.startswith("❌"):
               # AI failed, use fallback
               logger.warning("AI question answering failed, using fallback")
-              fallback_answer = generate_fallback_answer(request.question, request.document_text)
+              fallback_answer = generate_fallback_answer(request.question, document_text)
               return AnswerResponse(answer=fallback_answer, status="success", fallback_used=True)
           
           logger.info("✅ Question answered successfully with AI")
@@ -1027,18 +1599,77 @@ Instructions:
       else:
           # Use fallback mode
           logger.info(f"❓ Answering question with fallback: {request.question[:50]}...")
-          fallback_answer = generate_fallback_answer(request.question, request.document_text)
+          fallback_answer = generate_fallback_answer(request.question, document_text)
           return AnswerResponse(answer=fallback_answer, status="success", fallback_used=True)
   
   except asyncio.TimeoutError:
       logger.error("❌ Question answering timeout, using fallback")
-      fallback_answer = generate_fallback_answer(request.question, request.document_text)
+      fallback_answer = generate_fallback_answer(request.question, document_text)
       return AnswerResponse(answer=fallback_answer, status="success", fallback_used=True)
   except Exception as e:
       logger.error(f"❌ Question answering error: {str(e)}, using fallback")
-      fallback_answer = generate_fallback_answer(request.question, request.document_text)
+      fallback_answer = generate_fallback_answer(request.question, document_text)
       return AnswerResponse(answer=fallback_answer, status="success", fallback_used=True)
 
+@app.post("/ask-question/stream")
+async def ask_question_stream(request: QuestionRequest):
+  """Answer a question as server-sent events, one event per generated chunk"""
+  if not request.question.strip():
+      raise HTTPException(status_code=400, detail="Question cannot be empty")
+  
+  if not request.document_text.strip():
+      raise HTTPException(status_code=400, detail="No document text provided")
+  
+  document_text = await asyncio.to_thread(question_context, request, AI_SOURCE_MAX_CHARS)
+  chunks = None
+  if await check_api_status() and client:
+      logger.info(f"❓ Streaming answer with AI: {request.question[:50]}...")
+      prompt = fit_question_prompt(request.question, document_text)
+      chunks = client.astream_completion([{"role": "user", "content": prompt}], max_tokens=QUESTION_MAX_TOKENS, task="answer")
+  
+  return sse_response(chunks, lambda: generate_fallback_answer(request.question, document_text))
+
+def fit_question_prompt(question: str, document_text: str) -> str:
+  """Question prompt carrying as much of document_text as the token budget allows"""
+  return client.fill_prompt(build_question_prompt(question, PROMPT_CONTENT), document_text, QUESTION_MAX_TOKENS, task="answer")
+
+def build_question_prompt(question: str, text_content: str) -> str:
+  return f"""Based on the following document content, please answer the question comprehensively and accurately.
+
+Document Content:
+{text_content}
+
+Question: {question}
+
+Instructions:
+- Provide a detailed, accurate answer based on the document
+- If the information isn't in the document, say so clearly
+- Use specific examples from the document when possible
+- Keep the answer well-structured and easy to understand"""
+
+def question_context(request: QuestionRequest, max_chars: int) -> str:
+  """Document text for a question; large documents contribute their most relevant pages.
+  Reads the session store and searches the page store, so call it from a thread."""
+  session = study_sessions.get(request.session_id) if request.session_id else None
+  if not session or not session.get("page_store"):
+      return request.document_text
+  
+  try:
+      pages = PageStore(session["page_store"]).search(request.question, limit=10)
+  except sqlite3.Error as e:
+      # The store was pruned since upload; the preview text still answers most questions
+      logger.warning(f"⚠️ Page store unavailable, answering from the preview: {e}")
+      return request.document_text
+  
+  parts = []
+  total = 0
+  for page in pages:
+      if parts and total + len(page["text"]) > max_chars:
+          break
+      parts.append(f"--- Page {page['page']} ---\n{page['text']}")
+      total += len(page["text"])
+  return "\n\n".join(parts) or request.document_text
+
 def generate_fallback_answer(question: str, document_text: str) -> str:
   """Generate a basic answer without AI when quota is exceeded"""
   if not question.strip() or not document_text.strip():
@@ -1097,12 +1728,36 @@ def generate_fallback_answer(question: str, document_text: str) -> str:
 
 **Note:** This search was performed using basic text matching due to AI service limitations. For more sophisticated analysis, please try again later when the AI service is available."""
 
+@app.get("/search-document")
+async def search_document(query: str, session_id: str = "default", limit: int = 5):
+  """Full-text search over the pages of a large document"""
+  
+  session = await study_sessions.aget(session_id)
+  if session is None:
+      raise HTTPException(status_code=404, detail="No document found. Please upload a PDF first.")
+  
+  store_path = session.get("page_store")
+  if not store_path:
+      raise HTTPException(status_code=400, detail="Search is only available for documents processed in large-document mode")
+  
+  try:
+      pages = await asyncio.to_thread(PageStore(store_path).search, query, min(max(limit, 1), 20))
+  except sqlite3.Error:
+      raise HTTPException(status_code=404, detail="The search index for this document has expired. Please upload it again.")
+  return {
+      "query": query,
+      "results": [
+          {"page": page["page"], "method": page["method"], "excerpt": page["text"][:500]}
+          for page in pages
+      ],
+      "count": len(pages)
+  }
+
 @app.delete("/clear-session")
 async def clear_session(session_id: str = "default"):
   """Clear session data"""
   
-  if session_id in study_sessions:
-      del study_sessions[session_id]
+  if await study_sessions.adelete(session_id):
       logger.info(f"🗑️ Cleared session: {session_id}")
       return {"message": "Session cleared successfully", "status": "success"}
   else:
@@ -1112,14 +1767,15 @@ async def clear_session(session_id: str = "default"):
 async def get_session_info(session_id: str = "default"):
   """Get information about current session"""
   
-  if session_id not in study_sessions:
+  session_data = await study_sessions.aget(session_id)
+  if session_data is None:
       return {"active": False, "message": "No active session"}
   
-  session_data = study_sessions[session_id]
-  is_api_available = check_api_status()
+  is_api_available = await check_api_status()
   
   return {
       "active": True,
+      "session_id": session_id,
       "file_info": session_data.get("file_info", ""),
       "filename": session_data.get("filename", ""),
       "word_count": session_data.get("processing_result", {}).get("word_count", 0),
@@ -1135,7 +1791,7 @@ async def get_session_info(session_id: str = "default"):
 @app.post("/check-quota")
 async def check_quota_endpoint():
   """Endpoint to manually check API quota status"""
-  is_available = check_api_status()
+  is_available = await check_api_status()
   
   return {
       "api_available": is_available,
@@ -1143,6 +1799,7 @@ async def check_quota_endpoint():
       "consecutive_failures": api_status["consecutive_failures"],
       "last_check": api_status["last_check"],
       "message": "API operational" if is_available else "API unavailable - using fallback mode",
+      "rate_limits": await client.limiter.offload(client.limiter.stats) if client else None,
       "fallback_features": [
           "Basic PDF text extraction",
           "Simple summary generation", 
@@ -1154,6 +1811,13 @@ async def check_quota_endpoint():
       ]
   }
 
+@app.get("/model-routing")
+async def model_routing():
+  """Model order chosen per task type, with the per-model latency and error figures behind it"""
+  if not client:
+      return {"enabled": False, "tasks": {}, "models": {}}
+  return client.router.snapshot()
+
 
 if __name__ == "__main__":
   import uvicorn
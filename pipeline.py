@@ -4,23 +4,29 @@ import sys
 import platform
 import subprocess
 import tempfile
-import shutil
 from datetime import datetime
 from typing import Dict, List, Tuple, Any
 from pathlib import Path
 import time
 import json
 import re
+import queue
+import threading
+import multiprocessing
+import hashlib
+import sqlite3
+import pickle
 import requests
 from urllib.parse import quote_plus, urljoin
-from bs4 import BeautifulSoup
 import xml.etree.ElementTree as ET
-from youtube_service import YouTubeService
-from collections import Counter
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from urllib.parse import urlparse
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict, field
+from contextlib import contextmanager
 from abc import ABC, abstractmethod
-from typing import Optional, Dict
+from typing import Optional, Dict, Callable, Iterator
 import random
 import re
 
@@ -33,26 +39,1048 @@ def safe_json_parse(text: str):
         json_match = re.search(r"(\[.*\]|\{.*\})", text, re.DOTALL)
         if json_match:
             text = json_match.group(1)
-        return json.loads(text)
+        # strict=False accepts raw newlines inside strings, common in markdown fields
+        return json.loads(text, strict=False)
     except Exception as e:
         print(f"⚠️ JSON parsing failed: {e}")
         return None
 
 
 import pdfplumber
-import pytesseract
-from pdf2image import convert_from_path
-from PIL import Image, ImageDraw, ImageFont
+# pytesseract, pdf2image, pptx and googleapiclient are imported where they are used,
+# so importing this module (every API worker start) does not pay for them
+from PIL import Image, ImageDraw, ImageFont, ImageOps
 from dotenv import load_dotenv
-from groq import Groq
+from groq import Groq, AsyncGroq
+import httpx
+import asyncio
 # Add this import at the top of your pipeline.py
 
 # Load environment variables
 load_dotenv()
 
+##### PERSISTENT DISK CACHE #####
+class DiskCache:
+    """Size-bounded SQLite key/value store with LRU eviction and optional TTL.
+
+    Values are stored as JSON. A fresh connection is opened per operation, so one
+    cache file can be shared by threads and by several worker processes.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, ttl: Optional[float] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+                if row and self.ttl is not None and now - row[1] > self.ttl:
+                    conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                    row = None
+                if row:
+                    conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            print(f"⚠️ Cache read failed: {e}")
+            row = None
+
+        with self._lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any):
+        payload = json.dumps(value)
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, size, now, now)
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"⚠️ Cache write failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        with self._lock:
+            self.evictions += evicted
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            with self._connect() as conn:
+                entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        except sqlite3.Error:
+            entries, size = 0, 0
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+CACHE_DIR = os.getenv("STUDY_ASSISTANT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "study_assistant_cache"))
+
+##### SESSION STORES #####
+class SessionStore(ABC):
+    """Study sessions keyed by session id, bounded by count, size and idle time.
+
+    Sessions expire ttl seconds after they were last read or written, and the
+    least recently used ones are evicted once max_sessions or max_bytes is
+    exceeded. The session written last is never evicted by its own write.
+    Sessions returned by get() may be copies, so changes must be written back
+    with set() or update(). Async code goes through aget/aset/aupdate/adelete,
+    which keep blocking stores off the event loop.
+
+    Stores shared across worker processes also hold background job status
+    (set_job/get_job), so any worker can answer a progress poll.
+    """
+    # True when operations can block on I/O and must not run on the event loop
+    blocking = False
+
+    def __init__(self, ttl: Optional[float] = None, max_sessions: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("SESSION_TTL_SECONDS", "14400"))
+        self.max_sessions = max_sessions or int(os.getenv("SESSION_MAX_COUNT", "200"))
+        self.max_bytes = max_bytes or int(float(os.getenv("SESSION_MAX_MB", "512")) * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def set(self, session_id: str, session: Dict[str, Any]):
+        pass
+
+    @abstractmethod
+    def update(self, session_id: str, **fields) -> Optional[Dict[str, Any]]:
+        """Merge fields into an existing session; returns None if it is gone"""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def _usage(self) -> Tuple[int, int]:
+        """(sessions, bytes) currently held"""
+
+    def set_job(self, job_id: str, job: Dict[str, Any]):
+        """Share a background job's status with other workers; per-process stores keep none"""
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return None
+
+    async def offload(self, func: Callable, *args, **kwargs):
+        """Run func from async code: in a worker thread for blocking stores, inline otherwise"""
+        if self.blocking:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    async def aget(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await self.offload(self.get, session_id)
+
+    async def aset(self, session_id: str, session: Dict[str, Any]):
+        await self.offload(self.set, session_id, session)
+
+    async def aupdate(self, session_id: str, **fields) -> Optional[Dict[str, Any]]:
+        return await self.offload(self.update, session_id, **fields)
+
+    async def adelete(self, session_id: str) -> bool:
+        return await self.offload(self.delete, session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        return self._usage()[0]
+
+    def _expired(self, accessed: float, now: float) -> bool:
+        return self.ttl > 0 and now - accessed > self.ttl
+
+    def _record(self, hit: Optional[bool] = None, evicted: int = 0, expired: int = 0):
+        with self._lock:
+            if hit is not None:
+                if hit:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            self.evictions += evicted
+            self.expirations += expired
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        sessions, size = self._usage()
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "sessions": sessions,
+            "size_bytes": size,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+class MemorySessionStore(SessionStore):
+    """Per-process LRU session store. Sessions are held as live objects and sized
+    by their pickled length when written."""
+
+    def __init__(self, **limits):
+        super().__init__(**limits)
+        self._sessions = OrderedDict()  # session_id -> [session, size, accessed], oldest first
+        self._bytes = 0
+        self._store_lock = threading.RLock()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._store_lock:
+            expired = self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry:
+                entry[2] = now
+                self._sessions.move_to_end(session_id)
+        self._record(hit=entry is not None, expired=expired)
+        return entry[0] if entry else None
+
+    def set(self, session_id: str, session: Dict[str, Any]):
+        size = len(pickle.dumps(session, protocol=pickle.HIGHEST_PROTOCOL))
+        now = time.time()
+        with self._store_lock:
+            self._drop(session_id)
+            self._sessions[session_id] = [session, size, now]
+            self._bytes += size
+            expired = self._expire(now)
+            evicted = 0
+            while len(self._sessions) > 1 and (
+                len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes
+            ):
+                self._drop(next(iter(self._sessions)))
+                evicted += 1
+        self._record(evicted=evicted, expired=expired)
+
+    def update(self, session_id: str, **fields) -> Optional[Dict[str, Any]]:
+        with self._store_lock:
+            session = self.get(session_id)
+            if session is None:
+                return None
+            session = {**session, **fields}
+            self.set(session_id, session)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._store_lock:
+            return self._drop(session_id)
+
+    def _drop(self, session_id: str) -> bool:
+        entry = self._sessions.pop(session_id, None)
+        if entry:
+            self._bytes -= entry[1]
+        return entry is not None
+
+    def _expire(self, now: float) -> int:
+        # Entries are kept in access order, so expired ones are all at the front
+        expired = 0
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if not self._expired(entry[2], now):
+                break
+            self._drop(session_id)
+            expired += 1
+        return expired
+
+    def _usage(self) -> Tuple[int, int]:
+        with self._store_lock:
+            return len(self._sessions), self._bytes
+
+class SqliteSessionStore(SessionStore):
+    """Session store in a local SQLite file shared by every worker process.
+
+    Sessions hold ExtractedDocument objects, so values are pickled rather than
+    stored as JSON; the file is local to the server and written only by it.
+    Like DiskCache, a fresh connection is opened per operation. Reads take no
+    write lock: a session's access time is refreshed by a separate one-row
+    UPDATE, at most once per TOUCH_INTERVAL. Hit and eviction counters are per
+    process; session and byte totals cover the whole file.
+    """
+    blocking = True
+    # Seconds between access-time refreshes of a session; LRU order is this coarse
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(self, path: Optional[str] = None, **limits):
+        super().__init__(**limits)
+        self.path = path or os.getenv("SESSION_DB", os.path.join(CACHE_DIR, "sessions.sqlite3"))
+        self.touch_after = min(self.TOUCH_INTERVAL, self.ttl / 10) if self.ttl > 0 else self.TOUCH_INTERVAL
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_accessed ON sessions (accessed)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self, write: bool = True):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            if write:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            if write:
+                conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _read(self, conn: sqlite3.Connection, session_id: str, now: float) -> Optional[Dict[str, Any]]:
+        row = conn.execute("SELECT value, accessed FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row and self._expired(row[1], now):
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._record(expired=1)
+            row = None
+        if row:
+            conn.execute("UPDATE sessions SET accessed = ? WHERE id = ?", (now, session_id))
+        return pickle.loads(row[0]) if row else None
+
+    def _write(self, conn: sqlite3.Connection, session_id: str, session: Dict[str, Any], now: float):
+        payload = pickle.dumps(session, protocol=pickle.HIGHEST_PROTOCOL)
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (id, value, size, accessed) VALUES (?, ?, ?, ?)",
+            (session_id, payload, len(payload), now)
+        )
+        expired = 0
+        if self.ttl > 0:
+            expired = conn.execute(
+                "DELETE FROM sessions WHERE accessed < ? AND id != ?", (now - self.ttl, session_id)
+            ).rowcount
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions").fetchone()
+        evicted = 0
+        if count > self.max_sessions or total > self.max_bytes:
+            rows = conn.execute(
+                "SELECT id, size FROM sessions WHERE id != ? ORDER BY accessed ASC", (session_id,)
+            ).fetchall()
+            for victim, size in rows:
+                if count <= self.max_sessions and total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM sessions WHERE id = ?", (victim,))
+                count -= 1
+                total -= size
+                evicted += 1
+        self._record(evicted=evicted, expired=expired)
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        try:
+            with self._connect(write=False) as conn:
+                # fetchall finishes the SELECT so the UPDATE below starts its own transaction
+                rows = conn.execute("SELECT value, accessed FROM sessions WHERE id = ?", (session_id,)).fetchall()
+                row = rows[0] if rows else None
+                # Expired rows are left for the next write's sweep
+                if row and self._expired(row[1], now):
+                    row = None
+                if row and now - row[1] >= self.touch_after:
+                    try:
+                        conn.execute("UPDATE sessions SET accessed = ? WHERE id = ?", (now, session_id))
+                    except sqlite3.OperationalError:
+                        pass  # Recency is best effort; a busy writer must not fail the read
+            session = pickle.loads(row[0]) if row else None
+        except sqlite3.Error as e:
+            print(f"⚠️ Session read failed: {e}")
+            session = None
+        self._record(hit=session is not None)
+        return session
+
+    def set(self, session_id: str, session: Dict[str, Any]):
+        with self._connect() as conn:
+            self._write(conn, session_id, session, time.time())
+
+    def update(self, session_id: str, **fields) -> Optional[Dict[str, Any]]:
+        # Read and write in one IMMEDIATE transaction so concurrent workers cannot
+        # lose each other's fields
+        now = time.time()
+        with self._connect() as conn:
+            session = self._read(conn, session_id, now)
+            if session is not None:
+                session = {**session, **fields}
+                self._write(conn, session_id, session, now)
+        self._record(hit=session is not None)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+
+    def set_job(self, job_id: str, job: Dict[str, Any]):
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO jobs (id, value, updated) VALUES (?, ?, ?)",
+                    (job_id, json.dumps(job), now)
+                )
+                if self.ttl > 0:
+                    conn.execute("DELETE FROM jobs WHERE updated < ?", (now - self.ttl,))
+        except sqlite3.Error as e:
+            print(f"⚠️ Job status write failed: {e}")
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with self._connect(write=False) as conn:
+                row = conn.execute("SELECT value FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️ Job status read failed: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def _usage(self) -> Tuple[int, int]:
+        try:
+            with self._connect(write=False) as conn:
+                return conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions").fetchone()
+        except sqlite3.Error:
+            return 0, 0
+
+SESSION_STORES = {"memory": MemorySessionStore, "sqlite": SqliteSessionStore}
+
+def create_session_store(kind: Optional[str] = None, **limits) -> SessionStore:
+    """Session store selected by SESSION_STORE (memory or sqlite). Use sqlite when
+    the API runs with several workers so they all see the same sessions."""
+    kind = (kind or os.getenv("SESSION_STORE", "memory")).lower()
+    if kind not in SESSION_STORES:
+        raise ValueError(f"Unknown session store '{kind}', expected one of {sorted(SESSION_STORES)}")
+    return SESSION_STORES[kind](**limits)
+
+##### MODEL CIRCUIT BREAKERS #####
+class ModelCircuitBreaker:
+    """Per-model circuit breaker shared by every call on a client.
+
+    A model opens after failure_threshold consecutive failures and is skipped
+    instantly until reset_timeout has passed. It then goes half-open: a single
+    probe request is let through, which closes the circuit on success or
+    re-opens it on failure.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.failure_threshold = failure_threshold or int(os.getenv("GROQ_BREAKER_FAILURES", "3"))
+        self.reset_timeout = reset_timeout or float(os.getenv("GROQ_BREAKER_RESET_SECONDS", "30"))
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, model: str) -> Dict[str, Any]:
+        return self._models.setdefault(model, {
+            "state": self.CLOSED, "failures": 0, "opened_at": 0.0, "probing": False
+        })
+
+    def allow(self, model: str) -> bool:
+        """Whether a request to model may be sent now"""
+        with self._lock:
+            entry = self._entry(model)
+            if entry["state"] == self.OPEN and time.monotonic() - entry["opened_at"] >= self.reset_timeout:
+                entry["state"] = self.HALF_OPEN
+                entry["probing"] = False
+            if entry["state"] == self.CLOSED:
+                return True
+            if entry["state"] == self.HALF_OPEN and not entry["probing"]:
+                entry["probing"] = True
+                return True
+            return False
+
+    def is_open(self, model: str) -> bool:
+        """Whether model is still cooling down (no side effects, unlike allow)"""
+        with self._lock:
+            entry = self._entry(model)
+            return entry["state"] == self.OPEN and time.monotonic() - entry["opened_at"] < self.reset_timeout
+
+    def is_probing(self, model: str) -> bool:
+        """Whether model's half-open probe is taken. Right after allow() returned True this
+        means the caller holds it, since no other request is admitted meanwhile."""
+        with self._lock:
+            entry = self._entry(model)
+            return entry["state"] == self.HALF_OPEN and entry["probing"]
+
+    def release_probe(self, model: str):
+        """Hand back a half-open probe that ended without a verdict (deadline, cancellation,
+        429), so the next caller can probe instead of the model being skipped forever"""
+        with self._lock:
+            entry = self._entry(model)
+            if entry["state"] == self.HALF_OPEN:
+                entry["probing"] = False
+
+    def record_success(self, model: str):
+        with self._lock:
+            entry = self._entry(model)
+            entry.update(state=self.CLOSED, failures=0, probing=False)
+
+    def record_failure(self, model: str):
+        with self._lock:
+            entry = self._entry(model)
+            entry["failures"] += 1
+            entry["probing"] = False
+            if entry["state"] == self.HALF_OPEN or entry["failures"] >= self.failure_threshold:
+                if entry["state"] != self.OPEN:
+                    print(f"🔌 Circuit opened for {model} after {entry['failures']} failures")
+                entry["state"] = self.OPEN
+                entry["opened_at"] = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                model: {
+                    "state": entry["state"],
+                    "failures": entry["failures"],
+                    "retry_in_seconds": round(max(0.0, self.reset_timeout - (now - entry["opened_at"])), 1)
+                    if entry["state"] == self.OPEN else 0.0
+                }
+                for model, entry in self._models.items()
+            }
+
+
+class ModelHealthTracker:
+    """Sliding window of real call outcomes and latencies per model.
+
+    Health comes from traffic the app sends anyway, so checking it costs no
+    requests and never blocks. Samples older than window_seconds are dropped.
+    """
+
+    def __init__(self, window_seconds: Optional[float] = None, max_samples: int = 500):
+        self.window_seconds = window_seconds or float(os.getenv("GROQ_HEALTH_WINDOW_SECONDS", "300"))
+        self.max_samples = max_samples
+        self.consecutive_failures = 0
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, ok: bool, latency: float, rate_limited: bool = False):
+        with self._lock:
+            samples = self._samples.setdefault(model, deque(maxlen=self.max_samples))
+            samples.append((time.time(), ok, latency, rate_limited))
+            self.consecutive_failures = 0 if ok else self.consecutive_failures + 1
+
+    def _recent(self, model: str) -> List[Tuple[float, bool, float, bool]]:
+        cutoff = time.time() - self.window_seconds
+        samples = self._samples.get(model, ())
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return list(samples)
+
+    @staticmethod
+    def _percentile(values: List[float], fraction: float) -> Optional[float]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+    def model_stats(self, model: str) -> Dict[str, Any]:
+        with self._lock:
+            samples = self._recent(model)
+        latencies = [latency for _, ok, latency, _ in samples if ok]
+        successes = sum(1 for _, ok, _, _ in samples if ok)
+        return {
+            "calls": len(samples),
+            "success_rate": round(successes / len(samples), 3) if samples else None,
+            "rate_limited": sum(1 for *_, rate_limited in samples if rate_limited),
+            "p50_latency": self._percentile(latencies, 0.5),
+            "p95_latency": self._percentile(latencies, 0.95),
+            "last_success": max((at for at, ok, _, _ in samples if ok), default=None),
+            "last_failure": max((at for at, ok, _, _ in samples if not ok), default=None)
+        }
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            models = list(self._samples)
+        return {model: self.model_stats(model) for model in models}
+
+    def last_success(self) -> Optional[float]:
+        return max((stats["last_success"] for stats in self.snapshot().values() if stats["last_success"]), default=None)
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 8.0) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+##### TOKEN BUDGETING #####
+# Context windows of the models GroqClient may call; unknown models get the smallest
+MODEL_CONTEXT_WINDOWS = {
+    "llama-3.1-8b-instant": 131072,
+    "llama3-8b-8192": 8192,
+    "llama3-70b-8192": 8192
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+CHARS_PER_TOKEN = 4
+# Placeholder for document text in prompts filled by GroqClient.fill_prompt
+PROMPT_CONTENT = "\x00PROMPT_CONTENT\x00"
+_token_encoding = None
+
+
+def _get_token_encoding():
+    """tiktoken's cl100k_base when installed (close to the Llama 3 tokenizer), else None"""
+    global _token_encoding
+    if _token_encoding is None:
+        try:
+            import tiktoken
+            _token_encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _token_encoding = False
+    return _token_encoding or None
+
+
+def count_tokens(text: str) -> int:
+    """Token count of text; exact with tiktoken, otherwise ~4 characters per token"""
+    encoding = _get_token_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Leading part of text within max_tokens, cut at a paragraph or sentence end when one is near"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_token_encoding()
+    if encoding is not None:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    else:
+        cut = text[:max_tokens * CHARS_PER_TOKEN]
+    # Prefer a clean boundary as long as it keeps at least 80% of the budget
+    for separator in ("\n\n", ". ", "\n"):
+        boundary = cut.rfind(separator)
+        if boundary >= len(cut) * 0.8:
+            cut = cut[:boundary + len(separator.rstrip())]
+            break
+    return cut.rstrip() + "..."
+
+
+class TokenBudget:
+    """Splits a model's context between prompt content and the completion.
+
+    The content budget is what is left of one model's context window (and of its
+    per-minute token limit, since Groq rejects single requests larger than it)
+    after the completion, the prompt template and a safety margin for tokenizer
+    differences. PROMPT_MAX_INPUT_TOKENS optionally caps it to bound cost and latency.
+    """
+    SAFETY_MARGIN = 0.1
+    MESSAGE_OVERHEAD = 16
+    MIN_CONTENT_TOKENS = 256
+    # Overshoot allowed before a prompt fitted for one model is re-trimmed for another;
+    # token counts of the assembled prompt drift a little from the fitted parts
+    RETRIM_TOLERANCE = 32
+
+    def __init__(self, context_windows: Optional[Dict[str, int]] = None, max_input_tokens: Optional[int] = None):
+        self.context_windows = context_windows or MODEL_CONTEXT_WINDOWS
+        self.max_input_tokens = max_input_tokens or int(os.getenv("PROMPT_MAX_INPUT_TOKENS", "0")) or None
+
+    def context_window(self, model: str) -> int:
+        return self.context_windows.get(model, DEFAULT_CONTEXT_WINDOW)
+
+    def input_budget(self, model: str, max_output: int, tokens_per_minute: Optional[int] = None) -> int:
+        """Prompt tokens model can accept alongside max_output completion tokens"""
+        window = self.context_window(model)
+        if tokens_per_minute:
+            window = min(window, tokens_per_minute)
+        budget = int((window - max_output) * (1 - self.SAFETY_MARGIN)) - self.MESSAGE_OVERHEAD
+        if self.max_input_tokens:
+            budget = min(budget, self.max_input_tokens)
+        return budget
+
+##### MODEL ROUTING #####
+# Relative size of each model and the latency assumed before any calls to it are observed
+MODEL_PROFILES = {
+    "llama-3.1-8b-instant": {"tier": "small", "latency": 1.0},
+    "llama3-8b-8192": {"tier": "small", "latency": 1.5},
+    "llama3-70b-8192": {"tier": "large", "latency": 4.0}
+}
+# Preferred model tier and p95 latency target (seconds) per task type
+TASK_PROFILES = {
+    "health": {"tier": "small", "latency_target": 5},
+    "keywords": {"tier": "small", "latency_target": 10},
+    "suggestions": {"tier": "small", "latency_target": 10},
+    "chunk_summary": {"tier": "small", "latency_target": 20},
+    "answer": {"tier": "small", "latency_target": 20},
+    "summary": {"tier": "large", "latency_target": 40},
+    "flashcards": {"tier": "large", "latency_target": 60},
+    "quiz": {"tier": "large", "latency_target": 60},
+    "study_pack": {"tier": "large", "latency_target": 60},
+    "presentation": {"tier": "large", "latency_target": 60}
+}
+
+
+class ModelRouter:
+    """Orders the fallback chain per task from its profile and observed model health.
+
+    Models of the task's preferred tier come first, unless their observed p95
+    latency misses the task's target or their recent error rate is high; then
+    they move behind the models that meet it. Within a group, models are ranked
+    by p50 latency weighted by error rate. Models too small for the requested
+    completion go last. Untyped tasks pick a tier from the completion size.
+    GROQ_TASK_MODELS (JSON, e.g. {"quiz": "llama3-70b-8192"}) pins a model
+    to the front for a task; GROQ_MODEL_ROUTING=0 keeps the fixed order.
+    """
+    LARGE_OUTPUT_TOKENS = 2000
+    MIN_SAMPLES = 5
+    MAX_ERROR_RATE = 0.5
+    ERROR_PENALTY = 4
+
+    def __init__(self, models: List[str], health: ModelHealthTracker, context_windows: Optional[Dict[str, int]] = None):
+        self.models = models
+        self.health = health
+        self.context_windows = context_windows or MODEL_CONTEXT_WINDOWS
+        self.enabled = os.getenv("GROQ_MODEL_ROUTING", "1") != "0"
+        self.pinned = json.loads(os.getenv("GROQ_TASK_MODELS") or "{}")
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def task_profile(self, task: Optional[str], max_tokens: Optional[int]) -> Dict[str, Any]:
+        if task in TASK_PROFILES:
+            return TASK_PROFILES[task]
+        return {"tier": "large" if (max_tokens or 0) > self.LARGE_OUTPUT_TOKENS else "small", "latency_target": 60}
+
+    def _model_view(self, model: str) -> Dict[str, Any]:
+        stats = self.health.model_stats(model)
+        prior = MODEL_PROFILES.get(model, {})
+        latency = stats["p50_latency"] or prior.get("latency", 2.0)
+        error_rate = 1 - stats["success_rate"] if stats["calls"] >= self.MIN_SAMPLES else 0.0
+        return {
+            "tier": prior.get("tier", "small"),
+            "score": round(latency * (1 + self.ERROR_PENALTY * error_rate), 3),
+            "error_rate": round(error_rate, 3),
+            "p95_latency": stats["p95_latency"]
+        }
+
+    def route(self, task: Optional[str] = None, max_tokens: Optional[int] = None, record: bool = True) -> List[str]:
+        """Fallback chain for one call, best model first; record=False leaves the routing stats alone"""
+        if not self.enabled:
+            return self.models
+        
+        profile = self.task_profile(task, max_tokens)
+        views = {model: self._model_view(model) for model in self.models}
+        preferred, others, last = [], [], []
+        for model, view in views.items():
+            if self.context_windows.get(model, DEFAULT_CONTEXT_WINDOW) < 2 * (max_tokens or 1024):
+                last.append(model)
+            elif view["error_rate"] > self.MAX_ERROR_RATE:
+                last.append(model)
+            elif view["tier"] == profile["tier"] and (view["p95_latency"] or 0) <= profile["latency_target"]:
+                preferred.append(model)
+            else:
+                others.append(model)
+        by_score = lambda model: views[model]["score"]
+        models = sorted(preferred, key=by_score) + sorted(others, key=by_score) + sorted(last, key=by_score)
+
+        pinned = self.pinned.get(task)
+        if pinned:
+            models = [pinned] + [m for m in models if m != pinned]
+        if not preferred:
+            reason = f"no {profile['tier']} model meets the task profile"
+        elif pinned:
+            reason = "pinned by GROQ_TASK_MODELS"
+        else:
+            reason = f"fastest healthy {profile['tier']} model"
+
+        if not record:
+            return models
+        with self._lock:
+            route = self._routes.setdefault(task or "untyped", {"routes": Counter(), "last": None})
+            route["routes"][models[0]] += 1
+            route["last"] = {"models": models, "reason": reason, "at": time.time()}
+        return models
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Routing decisions per task and the per-model figures they were based on"""
+        with self._lock:
+            tasks = {
+                task: {**TASK_PROFILES.get(task, {"tier": "by completion size"}), "routes": dict(route["routes"]), "last": route["last"]}
+                for task, route in self._routes.items()
+            }
+        models = {}
+        for model in self.models:
+            stats = self.health.model_stats(model)
+            view = self._model_view(model)
+            models[model] = {
+                "tier": view["tier"],
+                "context_window": self.context_windows.get(model, DEFAULT_CONTEXT_WINDOW),
+                "score": view["score"],
+                "calls": stats["calls"],
+                "success_rate": stats["success_rate"],
+                "p50_latency": stats["p50_latency"],
+                "p95_latency": stats["p95_latency"]
+            }
+        return {"enabled": self.enabled, "pinned": self.pinned, "tasks": tasks, "models": models}
+
+##### GROQ RATE LIMITING #####
+def estimate_request_tokens(messages: List[Dict], max_tokens: Optional[int]) -> int:
+    """Token cost of a request: prompt tokens plus the completion budget"""
+    prompt_tokens = sum(count_tokens(str(message.get("content", ""))) for message in messages)
+    return prompt_tokens + (max_tokens or 1024)
+
+
+class TokenBucketLimiter:
+    """Requests-per-minute and tokens-per-minute buckets for each model.
+
+    Calls reserve capacity before they are sent, so bursts queue briefly or are
+    shed instead of running into 429s. Buckets live in memory by default; with a
+    path they live in a SQLite file, and every process using that file shares
+    one budget (updates run inside BEGIN IMMEDIATE transactions). Async callers
+    should go through offload() so those transactions never block the event loop.
+    """
+    # Groq free-tier limits; GROQ_RPM / GROQ_TPM override them for every model
+    DEFAULT_LIMITS = {
+        "llama-3.1-8b-instant": (30, 6000),
+        "llama3-8b-8192": (30, 6000),
+        "llama3-70b-8192": (30, 6000)
+    }
+
+    def __init__(self, path: Optional[str] = None, max_wait: Optional[float] = None):
+        self.path = path
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("GROQ_RATE_LIMIT_MAX_WAIT", "10"))
+        self.rpm_override = int(os.getenv("GROQ_RPM", "0"))
+        self.tpm_override = int(os.getenv("GROQ_TPM", "0"))
+        self.shed = 0
+        self.queued = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS buckets ("
+                    "model TEXT PRIMARY KEY, requests REAL NOT NULL, tokens REAL NOT NULL, updated REAL NOT NULL)"
+                )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def limits(self, model: str) -> Tuple[int, int]:
+        rpm, tpm = self.DEFAULT_LIMITS.get(model, (30, 6000))
+        return self.rpm_override or rpm, self.tpm_override or tpm
+
+    @contextmanager
+    def _bucket(self, model: str):
+        """Yield the model's bucket refilled to now; changes are saved on exit"""
+        rpm, tpm = self.limits(model)
+        now = time.time()
+        if self.path:
+            with self._connect() as conn:
+                row = conn.execute("SELECT requests, tokens, updated FROM buckets WHERE model = ?", (model,)).fetchone()
+                bucket = dict(zip(("requests", "tokens", "updated"), row)) if row else \
+                    {"requests": float(rpm), "tokens": float(tpm), "updated": now}
+                self._refill(bucket, rpm, tpm, now)
+                yield bucket
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (model, requests, tokens, updated) VALUES (?, ?, ?, ?)",
+                    (model, bucket["requests"], bucket["tokens"], bucket["updated"])
+                )
+        else:
+            with self._lock:
+                bucket = self._buckets.setdefault(model, {"requests": float(rpm), "tokens": float(tpm), "updated": now})
+                self._refill(bucket, rpm, tpm, now)
+                yield bucket
+
+    def _refill(self, bucket: Dict[str, float], rpm: int, tpm: int, now: float):
+        elapsed = max(0.0, now - bucket["updated"])
+        bucket["requests"] = min(float(rpm), bucket["requests"] + elapsed * rpm / 60)
+        bucket["tokens"] = min(float(tpm), bucket["tokens"] + elapsed * tpm / 60)
+        bucket["updated"] = now
+
+    def try_acquire(self, model: str, tokens: int) -> float:
+        """Reserve one request and tokens; returns 0 when granted, else seconds until it could be"""
+        rpm, tpm = self.limits(model)
+        # A request larger than the whole minute budget can only ever wait for a full bucket
+        tokens = min(tokens, tpm)
+        with self._bucket(model) as bucket:
+            if bucket["requests"] >= 1 and bucket["tokens"] >= tokens:
+                bucket["requests"] -= 1
+                bucket["tokens"] -= tokens
+                return 0.0
+            request_wait = max(0.0, (1 - bucket["requests"]) * 60 / rpm)
+            token_wait = max(0.0, (tokens - bucket["tokens"]) * 60 / tpm)
+            return max(request_wait, token_wait)
+
+    def acquire(self, model: str, tokens: int, timeout: Optional[float] = None) -> bool:
+        """Block until capacity is reserved; False (shed) if that would take longer than timeout"""
+        give_up_at = time.monotonic() + (self.max_wait if timeout is None else min(timeout, self.max_wait))
+        queued = False
+        while True:
+            wait = self.try_acquire(model, tokens)
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > give_up_at:
+                self._count("shed")
+                return False
+            if not queued:
+                queued = True
+                self._count("queued")
+            time.sleep(wait)
+
+    async def offload(self, func: Callable, *args):
+        """Run func(*args) from async code: in a worker thread when buckets are in SQLite
+        (a locked file can stall a transaction for seconds), inline when they are in memory"""
+        if self.path:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    async def aacquire(self, model: str, tokens: int, timeout: Optional[float] = None) -> bool:
+        """Async acquire; waits with asyncio.sleep so queued calls never hold a thread"""
+        give_up_at = time.monotonic() + (self.max_wait if timeout is None else min(timeout, self.max_wait))
+        queued = False
+        while True:
+            wait = await self.offload(self.try_acquire, model, tokens)
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > give_up_at:
+                self._count("shed")
+                return False
+            if not queued:
+                queued = True
+                self._count("queued")
+            await asyncio.sleep(wait)
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def settle(self, model: str, reserved: int, used: Optional[int]):
+        """Return the unused part of a reservation once actual usage is known"""
+        if used is None or used >= reserved:
+            return
+        _, tpm = self.limits(model)
+        with self._bucket(model) as bucket:
+            bucket["tokens"] = min(float(tpm), bucket["tokens"] + reserved - used)
+
+    def release(self, model: str, reserved: int):
+        """Give back a reservation that was never sent"""
+        rpm, tpm = self.limits(model)
+        with self._bucket(model) as bucket:
+            bucket["requests"] = min(float(rpm), bucket["requests"] + 1)
+            bucket["tokens"] = min(float(tpm), bucket["tokens"] + min(reserved, tpm))
+
+    def exhaust(self, model: str):
+        """Empty a model's buckets after the API itself rejected a call for rate limiting"""
+        with self._bucket(model) as bucket:
+            bucket["requests"] = 0.0
+            bucket["tokens"] = 0.0
+
+    def remaining(self) -> Dict[str, Dict[str, Any]]:
+        """Budget left per model, refilled to now; read-only, nothing is written back"""
+        now = time.time()
+        if self.path:
+            conn = sqlite3.connect(self.path, timeout=30)
+            try:
+                rows = conn.execute("SELECT model, requests, tokens, updated FROM buckets").fetchall()
+            finally:
+                conn.close()
+            stored = {model: {"requests": r, "tokens": t, "updated": u} for model, r, t, u in rows}
+        else:
+            with self._lock:
+                stored = {model: dict(bucket) for model, bucket in self._buckets.items()}
+
+        budget = {}
+        for model in self.DEFAULT_LIMITS:
+            rpm, tpm = self.limits(model)
+            bucket = stored.get(model, {"requests": float(rpm), "tokens": float(tpm), "updated": now})
+            self._refill(bucket, rpm, tpm, now)
+            budget[model] = {
+                "requests_per_minute": rpm,
+                "tokens_per_minute": tpm,
+                "requests_remaining": int(bucket["requests"]),
+                "tokens_remaining": int(bucket["tokens"])
+            }
+        return budget
+
+    def stats(self) -> Dict[str, Any]:
+        return {"shared": bool(self.path), "queued": self.queued, "shed": self.shed, "models": self.remaining()}
+
 ##### GROQ CLIENT WITH IMPROVED ERROR HANDLING #####
 class GroqClient:
-  def __init__(self):
+  # Responses are reused only when every input that shapes them is identical
+  RESPONSE_CACHE_VERSION = 2
+
+  def __init__(self, cache: Optional[DiskCache] = None, use_cache: bool = True,
+               limiter: Optional[TokenBucketLimiter] = None):
       api_key = os.getenv("GROQ_API_KEY")
       if not api_key:
           # This will allow the app to run in fallback mode for AI features
@@ -66,54 +1094,1190 @@ class GroqClient:
           "llama3-8b-8192",      # New fallback option
           "llama3-70b-8192"      # Larger model option
       ]
-
-  def chat_completion(self, messages: List[Dict], model: str = None, max_tokens: int = None, retry_count: int = 3) -> str:
+      self.breaker = ModelCircuitBreaker()
+      self.health = ModelHealthTracker()
+      self.router = ModelRouter(self.model_fallbacks, self.health)
+      # GROQ_RATE_LIMIT_DB shares one request/token budget between processes
+      self.limiter = limiter or TokenBucketLimiter(os.getenv("GROQ_RATE_LIMIT_DB") or None)
+      self.budget = TokenBudget()
+      # Content recently trimmed by fit_content, so a fallback to a smaller model can trim it again
+      self._fitted_contents = deque(maxlen=32)
+      self._fitted_lock = threading.Lock()
+      self.temperature = 0.7
+      # Disk-backed response cache keyed by the full request (LLM_CACHE_TTL_SECONDS=0 disables expiry)
+      if cache is None and use_cache and os.getenv("LLM_CACHE_ENABLED", "1") != "0":
+          ttl = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+          cache = DiskCache(
+              os.path.join(CACHE_DIR, "llm_responses.sqlite3"),
+              max_bytes=int(os.getenv("LLM_CACHE_MAX_MB", "128")) * 1024 * 1024,
+              ttl=ttl or None
+          )
+      self.cache = cache
+
+  def _response_cache_key(self, messages: List[Dict], model: Optional[str], max_tokens: Optional[int]) -> str:
+      # The fallback chain stands in for the model, since any model in it may serve the request;
+      # it is sorted so routing changes to the order keep hitting the same entry
+      request = {
+          "version": self.RESPONSE_CACHE_VERSION,
+          "model": model,
+          "models": sorted(self.model_fallbacks),
+          "messages": messages,
+          "max_tokens": max_tokens,
+          "temperature": self.temperature
+      }
+      return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+  def _cached_response(self, cache_key: Optional[str]) -> Optional[str]:
+      if cache_key is None:
+          return None
+      cached = self.cache.get(cache_key)
+      if cached is not None:
+          print(f"⚡ Response cache hit ({cached['model']})")
+          return cached["content"]
+      return None
+
+  def _store_response(self, cache_key: Optional[str], model_name: str, content: str):
+      if cache_key is not None and content:
+          self.cache.set(cache_key, {"model": model_name, "content": content})
+
+  def cache_stats(self) -> Optional[Dict[str, Any]]:
+      return self.cache.stats() if self.cache else None
+
+  def _models_to_try(self, model: Optional[str], task: Optional[str] = None, max_tokens: Optional[int] = None,
+                     record: bool = True) -> List[str]:
+      """Fallback chain for a call: an explicit model first, otherwise the router's order for the task"""
+      if model is None:
+          return self.router.route(task, max_tokens, record)
+      return [model] + [m for m in self.model_fallbacks if m != model]
+
+  def fit_content(self, content: str, template: str = "", max_tokens: Optional[int] = None, model: Optional[str] = None,
+                  max_input_tokens: Optional[int] = None, task: Optional[str] = None) -> str:
+      """Keep as much content as fits next to the prompt template and completion on the model the call will use.
+
+      template is the prompt with the content left out; it is only used to count overhead.
+      Pass the call's model or task so the budget is that of the model it routes to first;
+      a fallback to a model with less room trims the content again (see _fit_messages).
+      max_input_tokens caps the content for tasks that need only a sample of the document
+      (keywords, suggestions), which keeps those calls cheap.
+      """
+      content = trim_to_tokens(content, self.content_budget(template, max_tokens, model, task))
+      content = trim_to_tokens(content, max_input_tokens) if max_input_tokens else content
+      with self._fitted_lock:
+          self._fitted_contents.append(content)
+      return content
+
+  def content_budget(self, template: str = "", max_tokens: Optional[int] = None, model: Optional[str] = None,
+                     task: Optional[str] = None) -> int:
+      """Tokens of content that fit next to template and the completion on the model the call routes to first"""
+      first = self._models_to_try(model, task, max_tokens, record=False)[0]
+      available = self._input_budget(first, max_tokens) - count_tokens(template)
+      return max(available, self.budget.MIN_CONTENT_TOKENS)
+
+  def models_for(self, task: Optional[str], max_tokens: Optional[int] = None) -> List[str]:
+      """The fallback chain a call for task would use now, without counting it as routed"""
+      return self._models_to_try(None, task, max_tokens, record=False)
+
+  def _input_budget(self, model_name: str, max_tokens: Optional[int]) -> int:
+      return self.budget.input_budget(model_name, max_tokens or 1024, self.limiter.limits(model_name)[1])
+
+  def _fit_messages(self, messages: List[Dict], model_name: str, max_tokens: Optional[int]) -> List[Dict]:
+      """messages as sent to model_name: unchanged when they fit, which is the normal case,
+      otherwise with the fitted document content in them trimmed to the model's budget"""
+      excess = estimate_request_tokens(messages, max_tokens) - (max_tokens or 1024) - self._input_budget(model_name, max_tokens)
+      if excess <= self.budget.RETRIM_TOLERANCE:
+          return messages
+      with self._fitted_lock:
+          contents = list(reversed(self._fitted_contents))
+      for index, message in enumerate(messages):
+          text = str(message.get("content", ""))
+          content = next((c for c in contents if c and c in text), None)
+          if content is None:
+              continue
+          keep = max(count_tokens(content) - excess, self.budget.MIN_CONTENT_TOKENS)
+          print(f"✂️ Trimming prompt content by {excess} tokens for {model_name}")
+          trimmed = {**message, "content": text.replace(content, trim_to_tokens(content, keep), 1)}
+          return messages[:index] + [trimmed] + messages[index + 1:]
+      return messages
+
+  def fill_prompt(self, prompt: str, content: str, max_tokens: Optional[int] = None, model: Optional[str] = None,
+                  max_input_tokens: Optional[int] = None, task: Optional[str] = None) -> str:
+      """Replace PROMPT_CONTENT in prompt with as much of content as fits (see fit_content)"""
+      template = prompt.replace(PROMPT_CONTENT, "")
+      fitted = self.fit_content(content, template, max_tokens, model, max_input_tokens, task)
+      return prompt.replace(PROMPT_CONTENT, fitted, 1)
+
+  def _remaining(self, deadline_at: Optional[float]) -> Optional[float]:
+      return None if deadline_at is None else deadline_at - time.monotonic()
+
+  def chat_completion(self, messages: List[Dict], model: str = None, max_tokens: int = None, retry_count: int = 3,
+                      deadline: Optional[float] = None, use_cache: bool = True, task: Optional[str] = None) -> str:
+      """Complete a chat, falling back across models and retrying with jittered backoff.
+
+      Identical requests are answered from the response cache unless use_cache is
+      False. Models with an open circuit are skipped without a request. deadline is
+      the total number of seconds the call may take, including retries and waits.
+      task (see TASK_PROFILES) lets the router pick the model order when model is None.
+      """
       if not self.client:
           return "❌ Groq API client not initialized. Running in fallback mode."
 
-      if model is None:
-          models_to_try = self.model_fallbacks
-      else:
-          models_to_try = [model] + [m for m in self.model_fallbacks if m != model]
-      
+      cache_key = self._response_cache_key(messages, model, max_tokens) if use_cache and self.cache else None
+      cached = self._cached_response(cache_key)
+      if cached is not None:
+          return cached
+
+      deadline_at = time.monotonic() + deadline if deadline is not None else None
+      rate_limited = False
+      models = self._models_to_try(model, task, max_tokens)
       for attempt in range(retry_count):
-    
-          for model_name in models_to_try:
+          attempted = False
+          for model_name in models:
+              remaining = self._remaining(deadline_at)
+              if remaining is not None and remaining <= 0:
+                  return "❌ AI request deadline exceeded. Please try again."
+              attempt_messages = self._fit_messages(messages, model_name, max_tokens)
+              reserved = estimate_request_tokens(attempt_messages, max_tokens)
+              skip_reason = self._admit(model_name, reserved, self._remaining(deadline_at))
+              if skip_reason:
+                  print(f"🔌 Skipping {model_name}: {skip_reason}")
+                  rate_limited = rate_limited or skip_reason == "rate limit budget exhausted"
+                  continue
+              attempted = True
+              started = time.monotonic()
+              probe = self.breaker.is_probing(model_name)
               try:
                   print(f"🤖 Using model: {model_name} (attempt {attempt + 1})")
                   response = self.client.chat.completions.create(
                       model=model_name,
-                      messages=messages,
+                      messages=attempt_messages,
                       max_tokens=max_tokens,
-                      temperature=0.7
+                      temperature=self.temperature,
+                      **({"timeout": remaining} if remaining is not None else {})
                   )
-                  return response.choices[0].message.content.strip()
+                  self._record_success(model_name, started)
+                  self.limiter.settle(model_name, reserved, getattr(getattr(response, "usage", None), "total_tokens", None))
+                  content = response.choices[0].message.content.strip()
+                  self._store_response(cache_key, model_name, content)
+                  return content
               
               except Exception as e:
                   print(f"⏱️ Error with {model_name}: {str(e)}")
-                  if attempt < retry_count - 1:
-                      wait_time = (attempt + 1) * 2
-                      print(f"⏳ Waiting {wait_time} seconds before retry...")
-                      time.sleep(wait_time)
-                  continue
+                  if self._deadline_passed(deadline_at):
+                      return "❌ AI request deadline exceeded. Please try again."
+                  rate_limited = self._record_failure(model_name, e, started) or rate_limited
+              finally:
+                  if probe:
+                      self.breaker.release_probe(model_name)
+
+          # Every model is open or out of budget: fail fast instead of waiting out the retry matrix
+          if not attempted:
+              break
+          if attempt < retry_count - 1:
+              wait_time = self._retry_wait(attempt, deadline_at)
+              if wait_time is None:
+                  break
+              print(f"⏳ Waiting {wait_time:.1f} seconds before retry...")
+              time.sleep(wait_time)
       
+      return self._exhausted_message(model, rate_limited)
+
+  def _deadline_passed(self, deadline_at: Optional[float]) -> bool:
+      # A timeout caused by the caller's deadline says nothing about the model's health
+      remaining = self._remaining(deadline_at)
+      return remaining is not None and remaining <= 0
+
+  def _retry_wait(self, attempt: int, deadline_at: Optional[float]) -> Optional[float]:
+      """Jittered wait before the next round, or None when no round fits before the deadline"""
+      wait_time = backoff_delay(attempt)
+      remaining = self._remaining(deadline_at)
+      if remaining is not None and wait_time >= remaining:
+          return None
+      return wait_time
+
+  def _admit(self, model_name: str, reserved: int, timeout: Optional[float]) -> Optional[str]:
+      """Reserve rate-limit budget and a circuit slot; returns why the model is skipped, if it is"""
+      if self.breaker.is_open(model_name):
+          return "circuit open"
+      if not self.limiter.acquire(model_name, reserved, timeout):
+          return "rate limit budget exhausted"
+      return self._admit_circuit(model_name, reserved)
+
+  async def _aadmit(self, model_name: str, reserved: int, timeout: Optional[float]) -> Optional[str]:
+      if self.breaker.is_open(model_name):
+          return "circuit open"
+      if not await self.limiter.aacquire(model_name, reserved, timeout):
+          return "rate limit budget exhausted"
+      return await self.limiter.offload(self._admit_circuit, model_name, reserved)
+
+  def _admit_circuit(self, model_name: str, reserved: int) -> Optional[str]:
+      # Another caller may have taken the half-open probe while this one queued for budget
+      if not self.breaker.allow(model_name):
+          self.limiter.release(model_name, reserved)
+          return "circuit open"
+      return None
+
+  def _record_success(self, model_name: str, started: float):
+      self.breaker.record_success(model_name)
+      self.health.record(model_name, True, time.monotonic() - started)
+
+  def _record_failure(self, model_name: str, error: Exception, started: float) -> bool:
+      """Record a failed call; returns True when the API rejected it for rate limiting.
+
+      A 429 says nothing about the model's health, so it drains the local budget
+      instead of counting towards the circuit breaker.
+      """
+      message = str(error).lower()
+      rate_limited = "429" in message or "rate limit" in message
+      self.health.record(model_name, False, time.monotonic() - started, rate_limited=rate_limited)
+      if rate_limited:
+          self.limiter.exhaust(model_name)
+          return True
+      self.breaker.record_failure(model_name)
+      return False
+
+  def health_status(self) -> Dict[str, Any]:
+      """Passive API status: usable unless every model's circuit is open or its budget is spent"""
+      if not self.client:
+          return {"available": False, "quota_exceeded": False, "consecutive_failures": 0, "last_success": None}
+      models = self.model_fallbacks
+      budget = self.limiter.remaining()
+      quota_exceeded = all(budget.get(m, {}).get("requests_remaining", 1) < 1 for m in models)
+      return {
+          "available": not quota_exceeded and not all(self.breaker.is_open(m) for m in models),
+          "quota_exceeded": quota_exceeded,
+          "consecutive_failures": self.health.consecutive_failures,
+          "last_success": self.health.last_success()
+      }
+
+  def _exhausted_message(self, model: Optional[str], rate_limited: bool = False) -> str:
+      if rate_limited:
+          return "❌ Groq rate limit reached (quota budget exhausted). Please try again shortly."
+      if all(self.breaker.is_open(m) for m in self.model_fallbacks):
+          return "❌ All AI models are temporarily unavailable. Please try again shortly."
       return "❌ All AI models failed. Please check your Groq API key and internet connection."
 
+  async def achat_completion(self, messages: List[Dict], model: str = None, max_tokens: int = None, retry_count: int = 3,
+                             deadline: Optional[float] = None, use_cache: bool = True, task: Optional[str] = None) -> str:
+      """Awaitable chat_completion; runs the blocking call in a worker thread"""
+      return await asyncio.to_thread(self.chat_completion, messages, model, max_tokens, retry_count, deadline, use_cache, task)
+
+
+  def stream_completion(self, messages: List[Dict], model: str = None, max_tokens: int = None,
+                        use_cache: bool = True, task: Optional[str] = None) -> Iterator[str]:
+      """Yield a completion as text chunks while the model generates it.
+
+      Models are tried in fallback order until one starts streaming; there is no
+      retry round, since a stream is only useful if its first token comes quickly.
+      Once tokens have been yielded the stream cannot switch models, so a failure
+      mid-stream ends it with an error marker. Cached responses arrive as one chunk.
+      """
+      if not self.client:
+          yield "❌ Groq API client not initialized. Running in fallback mode."
+          return
+
+      cache_key = self._response_cache_key(messages, model, max_tokens) if use_cache and self.cache else None
+      cached = self._cached_response(cache_key)
+      if cached is not None:
+          yield cached
+          return
+
+      rate_limited = False
+      for model_name in self._models_to_try(model, task, max_tokens):
+          attempt_messages = self._fit_messages(messages, model_name, max_tokens)
+          reserved = estimate_request_tokens(attempt_messages, max_tokens)
+          skip_reason = self._admit(model_name, reserved, None)
+          if skip_reason:
+              print(f"🔌 Skipping {model_name}: {skip_reason}")
+              rate_limited = rate_limited or skip_reason == "rate limit budget exhausted"
+              continue
+          parts = []
+          started = time.monotonic()
+          probe = self.breaker.is_probing(model_name)
+          try:
+              print(f"🤖 Streaming from model: {model_name}")
+              stream = self.client.chat.completions.create(
+                  model=model_name,
+                  messages=attempt_messages,
+                  max_tokens=max_tokens,
+                  temperature=self.temperature,
+                  stream=True
+              )
+              for chunk in stream:
+                  delta = chunk.choices[0].delta.content if chunk.choices else None
+                  if delta:
+                      parts.append(delta)
+                      yield delta
+          except Exception as e:
+              print(f"⏱️ Error with {model_name}: {str(e)}")
+              rate_limited = self._record_failure(model_name, e, started) or rate_limited
+              if parts:
+                  yield "\n\n❌ Response interrupted. Please try again."
+                  return
+              continue
+          finally:
+              # Also runs when the consumer stops early (client disconnect closes the generator)
+              if probe:
+                  self.breaker.release_probe(model_name)
+          self._record_success(model_name, started)
+          content = "".join(parts).strip()
+          self.limiter.settle(model_name, reserved, reserved - (max_tokens or 1024) + len(content) // 4)
+          self._store_response(cache_key, model_name, content)
+          return
+
+      yield self._exhausted_message(model, rate_limited)
+
+  async def astream_completion(self, messages: List[Dict], model: str = None, max_tokens: int = None,
+                               use_cache: bool = True, task: Optional[str] = None):
+      """Async iterator over stream_completion; each chunk is pulled in a worker thread"""
+      chunks = self.stream_completion(messages, model, max_tokens, use_cache, task)
+      finished = object()
+      while True:
+          chunk = await asyncio.to_thread(next, chunks, finished)
+          if chunk is finished:
+              return
+          yield chunk
+
+  def close(self):
+      """Close the sync Groq client's HTTP connection pool"""
+      if self.client is not None:
+          self.client.close()
+          self.client = None
+
+
+class AsyncGroqClient(GroqClient):
+    """GroqClient with a native async path for the API server.
+
+    achat_completion goes through groq.AsyncGroq on one pooled keep-alive HTTP
+    client, so in-flight requests cost a coroutine instead of a thread. A
+    semaphore caps concurrent requests (GROQ_MAX_CONCURRENCY); callers beyond
+    the cap wait for a slot. The synchronous chat_completion keeps working for
+    agents that are still blocking.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, cache: Optional[DiskCache] = None, use_cache: bool = True,
+                 limiter: Optional[TokenBucketLimiter] = None):
+        super().__init__(cache=cache, use_cache=use_cache, limiter=limiter)
+        self.max_concurrency = max_concurrency or int(os.getenv("GROQ_MAX_CONCURRENCY", "16"))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._http_client = None
+        self.async_client = None
+        if self.client:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                    keepalive_expiry=float(os.getenv("GROQ_KEEPALIVE_SECONDS", "30"))
+                ),
+                timeout=httpx.Timeout(float(os.getenv("GROQ_TIMEOUT_SECONDS", "60")), connect=10.0)
+            )
+            self.async_client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), http_client=self._http_client)
+
+    async def achat_completion(self, messages: List[Dict], model: str = None, max_tokens: int = None, retry_count: int = 3,
+                               deadline: Optional[float] = None, use_cache: bool = True, task: Optional[str] = None) -> str:
+        if not self.async_client:
+            return "❌ Groq API client not initialized. Running in fallback mode."
+
+        # SQLite lookups run off the event loop so a busy cache file never stalls other requests
+        cache_key = self._response_cache_key(messages, model, max_tokens) if use_cache and self.cache else None
+        cached = await asyncio.to_thread(self._cached_response, cache_key)
+        if cached is not None:
+            return cached
+
+        deadline_at = time.monotonic() + deadline if deadline is not None else None
+        rate_limited = False
+        models = self._models_to_try(model, task, max_tokens)
+        for attempt in range(retry_count):
+            attempted = False
+            for model_name in models:
+                remaining = self._remaining(deadline_at)
+                if remaining is not None and remaining <= 0:
+                    return "❌ AI request deadline exceeded. Please try again."
+                attempt_messages = self._fit_messages(messages, model_name, max_tokens)
+                reserved = estimate_request_tokens(attempt_messages, max_tokens)
+                skip_reason = await self._aadmit(model_name, reserved, self._remaining(deadline_at))
+                if skip_reason:
+                    print(f"🔌 Skipping {model_name}: {skip_reason}")
+                    rate_limited = rate_limited or skip_reason == "rate limit budget exhausted"
+                    continue
+                attempted = True
+                started = time.monotonic()
+                probe = self.breaker.is_probing(model_name)
+                try:
+                    print(f"🤖 Using model: {model_name} (attempt {attempt + 1}, async)")
+                    async with self._semaphore:
+                        response = await asyncio.wait_for(
+                            self.async_client.chat.completions.create(
+                                model=model_name,
+                                messages=attempt_messages,
+                                max_tokens=max_tokens,
+                                temperature=self.temperature
+                            ),
+                            timeout=self._remaining(deadline_at)
+                        )
+                    self._record_success(model_name, started)
+                    await self.limiter.offload(
+                        self.limiter.settle, model_name, reserved,
+                        getattr(getattr(response, "usage", None), "total_tokens", None)
+                    )
+                    content = response.choices[0].message.content.strip()
+                    await asyncio.to_thread(self._store_response, cache_key, model_name, content)
+                    return content
+
+                except Exception as e:
+                    print(f"⏱️ Error with {model_name}: {str(e) or type(e).__name__}")
+                    if self._deadline_passed(deadline_at):
+                        return "❌ AI request deadline exceeded. Please try again."
+                    rate_limited = await self.limiter.offload(self._record_failure, model_name, e, started) or rate_limited
+                finally:
+                    if probe:
+                        self.breaker.release_probe(model_name)
+
+            # Every model is open or out of budget: fail fast instead of waiting out the retry matrix
+            if not attempted:
+                break
+            if attempt < retry_count - 1:
+                wait_time = self._retry_wait(attempt, deadline_at)
+                if wait_time is None:
+                    break
+                print(f"⏳ Waiting {wait_time:.1f} seconds before retry...")
+                await asyncio.sleep(wait_time)
+
+        return self._exhausted_message(model, rate_limited)
+
+    async def astream_completion(self, messages: List[Dict], model: str = None, max_tokens: int = None,
+                                 use_cache: bool = True, task: Optional[str] = None):
+        """Native async stream_completion; holds one concurrency slot for the whole stream"""
+        if not self.async_client:
+            yield "❌ Groq API client not initialized. Running in fallback mode."
+            return
+
+        cache_key = self._response_cache_key(messages, model, max_tokens) if use_cache and self.cache else None
+        cached = await asyncio.to_thread(self._cached_response, cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+        rate_limited = False
+        for model_name in self._models_to_try(model, task, max_tokens):
+            attempt_messages = self._fit_messages(messages, model_name, max_tokens)
+            reserved = estimate_request_tokens(attempt_messages, max_tokens)
+            skip_reason = await self._aadmit(model_name, reserved, None)
+            if skip_reason:
+                print(f"🔌 Skipping {model_name}: {skip_reason}")
+                rate_limited = rate_limited or skip_reason == "rate limit budget exhausted"
+                continue
+            parts = []
+            started = time.monotonic()
+            probe = self.breaker.is_probing(model_name)
+            try:
+                print(f"🤖 Streaming from model: {model_name} (async)")
+                async with self._semaphore:
+                    stream = await self.async_client.chat.completions.create(
+                        model=model_name,
+                        messages=attempt_messages,
+                        max_tokens=max_tokens,
+                        temperature=self.temperature,
+                        stream=True
+                    )
+                    async for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+            except Exception as e:
+                print(f"⏱️ Error with {model_name}: {str(e) or type(e).__name__}")
+                rate_limited = await self.limiter.offload(self._record_failure, model_name, e, started) or rate_limited
+                if parts:
+                    yield "\n\n❌ Response interrupted. Please try again."
+                    return
+                continue
+            finally:
+                if probe:
+                    self.breaker.release_probe(model_name)
+            self._record_success(model_name, started)
+            content = "".join(parts).strip()
+            await self.limiter.offload(
+                self.limiter.settle, model_name, reserved, reserved - (max_tokens or 1024) + len(content) // 4
+            )
+            await asyncio.to_thread(self._store_response, cache_key, model_name, content)
+            return
+
+        yield self._exhausted_message(model, rate_limited)
+
+    async def aclose(self):
+        """Close the pooled HTTP connections, async and sync"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+            self.async_client = None
+        await asyncio.to_thread(self.close)
+
+##### STRUCTURED DOCUMENT MODEL #####
+# A paragraph ends at a blank line or at a line that finishes a sentence
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n|(?<=[.!?:])\n")
+
+@dataclass
+class DocumentParagraph:
+    """A paragraph span inside ExtractedDocument.text"""
+    start: int
+    end: int
+    word_count: int
+
+@dataclass
+class DocumentPage:
+    """A page span inside ExtractedDocument.text (body only, without the page marker)"""
+    page_number: int
+    method: str
+    start: int
+    end: int
+    word_count: int
+    paragraphs: List[DocumentParagraph]
+
+@dataclass
+class ExtractedDocument:
+    """Extracted PDF text with precomputed page and paragraph spans.
+
+    text keeps the "--- Page N ---" layout used throughout the app. Consumers take
+    page windows or character budgets through the spans instead of re-splitting it.
+    """
+    text: str
+    pages: List[DocumentPage]
+    word_count: int
+
+    @classmethod
+    def from_pages(cls, page_texts: Dict[int, Tuple[str, str]]) -> "ExtractedDocument":
+        """Build a document from {page_number: (method, body)}"""
+        parts = []
+        pages = []
+        offset = 0
+        for page_number in sorted(page_texts):
+            method, body = page_texts[page_number]
+            body = body.strip()
+            if parts:
+                parts.append("\n\n")
+                offset += 2
+            header = f"--- Page {page_number}{' (OCR)' if method == 'ocr' else ''} ---\n"
+            parts.append(header + body)
+            start = offset + len(header)
+
+            paragraphs = []
+            paragraph_start = 0
+            for match in list(PARAGRAPH_BREAK.finditer(body)) + [None]:
+                paragraph_end = match.start() if match else len(body)
+                paragraph = body[paragraph_start:paragraph_end]
+                if paragraph.strip():
+                    paragraphs.append(DocumentParagraph(
+                        start=start + paragraph_start,
+                        end=start + paragraph_end,
+                        word_count=len(paragraph.split())
+                    ))
+                if match:
+                    paragraph_start = match.end()
+
+            pages.append(DocumentPage(
+                page_number=page_number,
+                method=method,
+                start=start,
+                end=start + len(body),
+                word_count=sum(p.word_count for p in paragraphs),
+                paragraphs=paragraphs
+            ))
+            offset = start + len(body)
+
+        return cls(text="".join(parts), pages=pages, word_count=sum(p.word_count for p in pages))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ExtractedDocument":
+        return cls(
+            text=data["text"],
+            pages=[
+                DocumentPage(**{**page, "paragraphs": [DocumentParagraph(**p) for p in page["paragraphs"]]})
+                for page in data["pages"]
+            ],
+            word_count=data["word_count"]
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def page_text(self, page_number: int) -> str:
+        for page in self.pages:
+            if page.page_number == page_number:
+                return self.text[page.start:page.end]
+        return ""
+
+    def window(self, first_page: int, last_page: int) -> str:
+        """Text of pages first_page..last_page (inclusive), page markers included"""
+        selected = [p for p in self.pages if first_page <= p.page_number <= last_page]
+        if not selected:
+            return ""
+        marker_start = self.text.rfind("--- Page", 0, selected[0].start)
+        return self.text[max(marker_start, 0):selected[-1].end]
+
+    def head(self, max_chars: int) -> str:
+        """Leading text that fits in max_chars, cut at a paragraph boundary when possible"""
+        if len(self.text) <= max_chars:
+            return self.text
+        cut = 0
+        for page in self.pages:
+            if page.start > max_chars:
+                break
+            for paragraph in page.paragraphs:
+                if paragraph.end > max_chars:
+                    break
+                cut = paragraph.end
+        return self.text[:cut or max_chars] + "..."
+
+##### DISK-BACKED PAGE STORE FOR LARGE DOCUMENTS #####
+class PageStore:
+    """SQLite page store with a full-text index, one file per document and extraction settings.
+
+    Large documents are written here page by page during extraction so worker
+    memory stays flat, and queried later by page range or keyword search.
+    Each extraction writes a private staging file and publishes it with an atomic
+    rename, so concurrent extractions of one document never share a page table
+    and readers only ever see a complete store. Only staging() creates files;
+    PageStore(path) opens an existing store read-only, and raises sqlite3.Error
+    on first use if it is gone. Published stores are pruned oldest first once
+    they exceed PAGE_STORE_MAX_MB.
+    """
+    # Staging files older than this are left over from crashed extractions
+    STALE_STAGING_SECONDS = 24 * 3600
+
+    def __init__(self, path: str, create: bool = False):
+        self.path = path
+        self.staged = False
+        self.writable = create
+        if not create:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "page_number INTEGER PRIMARY KEY, method TEXT NOT NULL, "
+                "text TEXT NOT NULL, word_count INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5("
+                "text, content='pages', content_rowid='page_number')"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    @staticmethod
+    def document_path(store_key: str) -> str:
+        return os.path.join(CACHE_DIR, "pages", f"{store_key}.sqlite3")
+
+    @classmethod
+    def for_document(cls, store_key: str) -> "PageStore":
+        return cls(cls.document_path(store_key))
+
+    @classmethod
+    def staging(cls, store_key: str) -> "PageStore":
+        """Empty store in a uniquely named file, to be publish()ed once fully written"""
+        target = cls.document_path(store_key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix=os.path.basename(target) + ".", suffix=".tmp", dir=os.path.dirname(target))
+        os.close(fd)
+        store = cls(path, create=True)
+        store.staged = True
+        return store
+
+    @classmethod
+    def is_available(cls, path: str) -> bool:
+        """True if a complete store is published at path"""
+        try:
+            return cls(path).is_complete()
+        except sqlite3.Error:
+            return False
+
+    @classmethod
+    def prune(cls, max_bytes: Optional[int] = None, keep: Optional[str] = None) -> int:
+        """Delete the oldest published stores until they fit in max_bytes, plus stale
+        staging files. keep (a path) is never deleted. Returns the files removed."""
+        max_bytes = max_bytes or int(float(os.getenv("PAGE_STORE_MAX_MB", "2048")) * 1024 * 1024)
+        directory = os.path.dirname(cls.document_path(""))
+        now = time.time()
+        published, removed = [], 0
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return 0
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            if name.endswith(".tmp"):
+                if now - info.st_mtime > cls.STALE_STAGING_SECONDS:
+                    removed += cls._remove(path)
+            elif name.endswith(".sqlite3"):
+                published.append((info.st_mtime, info.st_size, path))
+        total = sum(size for _, size, _ in published)
+        for _, size, path in sorted(published):
+            if total <= max_bytes:
+                break
+            if keep and os.path.abspath(path) == os.path.abspath(keep):
+                continue
+            removed += cls._remove(path)
+            total -= size
+        return removed
+
+    @staticmethod
+    def _remove(path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+    @contextmanager
+    def _connect(self):
+        # Rollback journal rather than WAL: published files are only read, and a WAL
+        # sidecar would not follow the file across the rename in publish()
+        if self.writable:
+            conn = sqlite3.connect(self.path, timeout=30)
+        else:
+            conn = sqlite3.connect(f"{Path(os.path.abspath(self.path)).as_uri()}?mode=ro", timeout=30, uri=True)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def publish(self, store_key: str):
+        """Atomically move this staging store to the document's path"""
+        target = self.document_path(store_key)
+        os.replace(self.path, target)
+        self.path = target
+        self.staged = False
+
+    def discard(self):
+        """Delete an unpublished staging file"""
+        if self.staged:
+            self._remove(self.path)
+
+    def write_pages(self, pages: List[Tuple[int, str, str]]):
+        """Insert (page_number, method, text) rows and index them"""
+        if not pages:
+            return
+        rows = [(page_number, method, text, len(text.split())) for page_number, method, text in pages]
+        with self._connect() as conn:
+            conn.executemany("INSERT INTO pages (page_number, method, text, word_count) VALUES (?, ?, ?, ?)", rows)
+            conn.executemany(
+                "INSERT INTO pages_fts (rowid, text) VALUES (?, ?)",
+                [(page_number, text) for page_number, _, text in pages]
+            )
+
+    def mark_complete(self):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('complete', '1')")
+
+    def is_complete(self) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM meta WHERE key = 'complete'").fetchone() is not None
+
+    def stats(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            pages, words = conn.execute("SELECT COUNT(*), COALESCE(SUM(word_count), 0) FROM pages").fetchone()
+        return {"pages": pages, "word_count": words}
+
+    def read_pages(self, first_page: int = 1, last_page: Optional[int] = None) -> Iterator[Tuple[int, str, str]]:
+        """Yield (page_number, method, text) in page order"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "SELECT page_number, method, text FROM pages WHERE page_number >= ? AND page_number <= ? "
+                "ORDER BY page_number",
+                (first_page, last_page if last_page is not None else 2 ** 31)
+            )
+            for row in cursor:
+                yield row
+
+    def preview(self, max_chars: int) -> Dict[int, Tuple[str, str]]:
+        """Leading pages that fit in max_chars, as {page_number: (method, text)}"""
+        pages = {}
+        total = 0
+        for page_number, method, text in self.read_pages():
+            if pages and total + len(text) > max_chars:
+                break
+            pages[page_number] = (method, text)
+            total += len(text)
+        return pages
+
+    def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Pages ranked by BM25 relevance to the words in query"""
+        terms = {word for word in re.findall(r"[A-Za-z0-9]+", query.lower()) if len(word) > 2 or word.isdigit()}
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in sorted(terms))
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT pages.page_number, pages.method, pages.text FROM pages_fts "
+                "JOIN pages ON pages.page_number = pages_fts.rowid "
+                "WHERE pages_fts MATCH ? ORDER BY bm25(pages_fts) LIMIT ?",
+                (match, limit)
+            ).fetchall()
+        return [{"page": page_number, "method": method, "text": text} for page_number, method, text in rows]
+
+##### OCR IMAGE PREPROCESSING #####
+def binarize_image(image: Image.Image) -> Image.Image:
+    """Grayscale, autocontrast and Otsu-threshold a page image for tesseract"""
+    gray = ImageOps.autocontrast(image.convert("L"))
+    histogram = gray.histogram()
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    sum_background, weight_background = 0.0, 0
+    best_threshold, best_variance = 127, 0.0
+    for level, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += level * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = level, variance
+    return gray.point(lambda value: 255 if value > best_threshold else 0, mode="1")
+
+##### PLUGGABLE TEXT-LAYER EXTRACTION BACKENDS #####
+class ExtractionBackend(ABC):
+    """Reads the embedded text layer of a PDF one page at a time.
+
+    Subclasses only open documents and return page text; timing and per-page
+    error capture are shared so every backend reports pages the same way.
+    """
+    name = ""
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return True
+
+    @abstractmethod
+    def open(self, file_path: str):
+        """Context manager yielding a document handle"""
+
+    @abstractmethod
+    def page_count(self, document) -> int:
+        pass
+
+    @abstractmethod
+    def page_text(self, document, index: int) -> str:
+        pass
+
+    def count_pages(self, file_path: str) -> int:
+        with self.open(file_path) as document:
+            return self.page_count(document)
+
+    def extract_range(self, file_path: str, start: int, end: int) -> List[Dict[str, Any]]:
+        pages = []
+        with self.open(file_path) as document:
+            for index in range(start, min(end, self.page_count(document))):
+                page_started = time.perf_counter()
+                entry = {"page": index + 1, "text": "", "seconds": 0.0, "error": None}
+                try:
+                    entry["text"] = (self.page_text(document, index) or "").strip()
+                except Exception as e:
+                    entry["error"] = str(e)
+                entry["seconds"] = round(time.perf_counter() - page_started, 4)
+                pages.append(entry)
+        return pages
+
+
+class PdfPlumberBackend(ExtractionBackend):
+    """Layout-aware extraction; slow but handles tables and ruled layouts well"""
+    name = "pdfplumber"
+
+    def open(self, file_path: str):
+        return pdfplumber.open(file_path)
+
+    def page_count(self, document) -> int:
+        return len(document.pages)
+
+    def page_text(self, document, index: int) -> str:
+        page = document.pages[index]
+        try:
+            return page.extract_text()
+        finally:
+            # Drop parsed layout objects so memory stays flat across long shards
+            page.flush_cache()
+
+
+class PdfiumBackend(ExtractionBackend):
+    """Fast text-layer extraction through PDFium (pypdfium2 ships with pdfplumber)"""
+    name = "pdfium"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        try:
+            import pypdfium2  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    @contextmanager
+    def open(self, file_path: str):
+        import pypdfium2
+        document = pypdfium2.PdfDocument(file_path)
+        try:
+            yield document
+        finally:
+            document.close()
+
+    def page_count(self, document) -> int:
+        return len(document)
+
+    def page_text(self, document, index: int) -> str:
+        page = document[index]
+        text_page = page.get_textpage()
+        try:
+            return text_page.get_text_range().replace("\r\n", "\n")
+        finally:
+            text_page.close()
+            page.close()
+
+
+EXTRACTION_BACKENDS = {backend.name: backend for backend in (PdfPlumberBackend, PdfiumBackend)}
+DEFAULT_EXTRACTION_BACKEND = PdfPlumberBackend.name
+
+
+def get_extraction_backend(name: str) -> ExtractionBackend:
+    """Instantiate a backend by name, falling back to pdfplumber when unavailable"""
+    backend = EXTRACTION_BACKENDS.get(name)
+    if backend is None or not backend.is_available():
+        return PdfPlumberBackend()
+    return backend()
+
+
+def choose_extraction_backend(file_path: str, probe_pages: int = 3) -> Tuple[str, str]:
+    """Pick the cheapest backend that keeps quality for this document.
+
+    The first probe_pages pages are inspected with pdfplumber: tables, heavy ruling
+    (forms, grids) or a fast text layer that drops characters pdfplumber sees all
+    keep the document on pdfplumber. Everything else goes to the fast backend.
+    Returns (backend name, reason).
+    """
+    if not PdfiumBackend.is_available():
+        return PdfPlumberBackend.name, "fast backend not installed"
+
+    fast = PdfiumBackend()
+    try:
+        with pdfplumber.open(file_path) as pdf, fast.open(file_path) as fast_document:
+            for index in range(min(probe_pages, len(pdf.pages))):
+                page = pdf.pages[index]
+                try:
+                    if page.find_tables():
+                        return PdfPlumberBackend.name, f"table on page {index + 1}"
+                    if len(page.rects) + len(page.lines) > 20:
+                        return PdfPlumberBackend.name, f"ruled layout on page {index + 1}"
+                    layout_chars = sum(1 for char in page.chars if not char["text"].isspace())
+                    fast_text = fast.page_text(fast_document, index) or ""
+                    fast_chars = sum(1 for char in fast_text if not char.isspace())
+                    if layout_chars and fast_chars < 0.9 * layout_chars:
+                        return PdfPlumberBackend.name, f"fast backend lost text on page {index + 1}"
+                finally:
+                    page.flush_cache()
+    except Exception as e:
+        return PdfPlumberBackend.name, f"probe failed: {e}"
+    return PdfiumBackend.name, "simple text layout"
+
+
+##### PARALLEL PAGE EXTRACTION WORKER #####
+def _extract_page_range(file_path: str, start: int, end: int,
+                        backend: str = DEFAULT_EXTRACTION_BACKEND) -> List[Dict[str, Any]]:
+    """Extract text from pages [start, end) in a worker process.
+
+    Each worker opens its own document handle so shards never share parser state.
+    """
+    return get_extraction_backend(backend).extract_range(file_path, start, end)
+
 ##### ENHANCED PDF PROCESSOR WITH BETTER ERROR HANDLING #####
 class EnhancedPDFProcessor:
-  def __init__(self):
+  # Bump when extraction output changes so stale cache entries are ignored
+  CACHE_VERSION = 5
+  # Pages buffered in memory before each PageStore write
+  PAGE_STORE_BATCH = 25
+  # Adaptive OCR: probe resolution and ink-density thresholds (fraction of dark pixels)
+  OCR_PROBE_DPI = 50
+  OCR_BLANK_DENSITY = 0.002
+  OCR_SPARSE_DENSITY = 0.03
+  OCR_DENSE_DENSITY = 0.12
+  # Adaptive OCR: first-pass results below these trigger orientation detection
+  OCR_MIN_CONFIDENCE = 60
+  OCR_MIN_CHARS = 40
+
+  def __init__(self, max_workers: Optional[int] = None, parallel_min_pages: int = 4,
+               ocr_page_budget: Optional[int] = None, cache: Optional[DiskCache] = None,
+               use_cache: bool = True, ocr_mode: Optional[str] = None,
+               extraction_backend: Optional[str] = None):
       self.tesseract_available = self._check_tesseract()
       print(f"🔍 Tesseract available: {self.tesseract_available}")
+      # Page-sharded extraction settings (PDF_EXTRACTION_WORKERS overrides the default)
+      self.max_workers = max_workers or int(os.getenv("PDF_EXTRACTION_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+      self.parallel_min_pages = parallel_min_pages
+      self._executor = None
+      self._executor_lock = threading.Lock()
+      # Streaming OCR settings: tesseract runs in subprocesses, so threads are enough
+      self.ocr_workers = max(1, int(os.getenv("OCR_WORKERS", "0")) or min(4, os.cpu_count() or 1))
+      self.ocr_queue_size = self.ocr_workers
+      # Maximum number of failed pages sent to OCR per document
+      self.ocr_page_budget = ocr_page_budget or int(os.getenv("OCR_PAGE_BUDGET", "10"))
+      # Documents with at least this many pages are streamed into a disk-backed PageStore
+      self.large_document_pages = int(os.getenv("LARGE_DOCUMENT_PAGES", "50"))
+      self.large_document_preview_chars = int(os.getenv("LARGE_DOCUMENT_PREVIEW_CHARS", "60000"))
+      # "fixed" (200 DPI, --psm 6) or "adaptive" (density-driven DPI plus binarization)
+      self.ocr_mode = ocr_mode or os.getenv("OCR_MODE", "fixed")
+      # Text-layer backend name from EXTRACTION_BACKENDS, or "auto" to probe each document
+      self.extraction_backend = extraction_backend or os.getenv("EXTRACTION_BACKEND", "auto")
+      # Content-addressed extraction cache shared by every processor using the same file
+      if cache is None and use_cache:
+          cache = DiskCache(
+              os.path.join(CACHE_DIR, "extraction.sqlite3"),
+              max_bytes=int(os.getenv("EXTRACTION_CACHE_MAX_MB", "512")) * 1024 * 1024
+          )
+      self.cache = cache
+
+  def _get_executor(self) -> ProcessPoolExecutor:
+      # Concurrent extraction jobs share one pool, so only the first may create it.
+      # Workers are spawned, not forked: the API server forks from a multi-threaded
+      # process, and a forked child can inherit locks held by other threads.
+      with self._executor_lock:
+          if self._executor is None:
+              self._executor = ProcessPoolExecutor(
+                  max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+              )
+          return self._executor
+
+  def _discard_executor(self, executor: ProcessPoolExecutor):
+      """Shut down a broken pool; a concurrent job may already have replaced it"""
+      with self._executor_lock:
+          if self._executor is executor:
+              self._executor = None
+      executor.shutdown(wait=False, cancel_futures=True)
+
+  def close(self):
+      """Shut down the extraction process pool"""
+      with self._executor_lock:
+          executor, self._executor = self._executor, None
+      if executor is not None:
+          executor.shutdown(wait=False, cancel_futures=True)
+
+  def _extract_text_layer(self, file_path: str, page_count: int, workers: int,
+                          backend: str = DEFAULT_EXTRACTION_BACKEND) -> Iterator[Dict[str, Any]]:
+      """Yield the text layer of the first page_count pages in page order.
+
+      Pages are sharded across a process pool and each shard is yielded as soon as it
+      and every shard before it have finished, so callers can use early pages while
+      later ones are still being extracted.
+      """
+      # Twice as many shards as workers keeps the pool busy when some pages are slower
+      shard_size = max(1, -(-page_count // (workers * 2)))
+      shards = [(start, min(start + shard_size, page_count)) for start in range(0, page_count, shard_size)]
+
+      if workers <= 1 or page_count < self.parallel_min_pages:
+          for start, end in shards:
+              yield from _extract_page_range(file_path, start, end, backend)
+          return
+
+      print(f"⚡ Extracting {page_count} pages in {len(shards)} shards across {workers} workers")
+      executor = self._get_executor()
+      try:
+          futures = [executor.submit(_extract_page_range, file_path, start, end, backend) for start, end in shards]
+      except BrokenProcessPool as e:
+          # A worker died during an earlier job; the next job gets a fresh pool
+          print(f"⚠️ Extraction pool failed ({e}), falling back to sequential extraction")
+          self._discard_executor(executor)
+          for start, end in shards:
+              yield from _extract_page_range(file_path, start, end, backend)
+          return
+      for index, future in enumerate(futures):
+          try:
+              shard_pages = future.result()
+          except BrokenProcessPool as e:
+              print(f"⚠️ Extraction pool failed ({e}), falling back to sequential extraction")
+              self._discard_executor(executor)
+              for start, end in shards[index:]:
+                  yield from _extract_page_range(file_path, start, end, backend)
+              return
+          yield from shard_pages
+
+  def _resolve_backend(self, file_path: str) -> ExtractionBackend:
+      if self.extraction_backend != "auto":
+          backend = get_extraction_backend(self.extraction_backend)
+          if backend.name != self.extraction_backend:
+              print(f"⚠️ Extraction backend '{self.extraction_backend}' unavailable, using {backend.name}")
+          return backend
+      name, reason = choose_extraction_backend(file_path)
+      print(f"🧭 Extraction backend: {name} ({reason})")
+      return get_extraction_backend(name)
+
+  def _notify(self, progress_callback: Optional[Callable[[Dict[str, Any]], None]], event: Dict[str, Any]):
+      if progress_callback is None:
+          return
+      try:
+          progress_callback(event)
+      except Exception as e:
+          print(f"⚠️ Progress callback failed: {e}")
 
   def _check_tesseract(self) -> bool:
       try:
+          import pytesseract
           pytesseract.get_tesseract_version()
           return True
       except Exception as e:
           print(f"⚠️ Tesseract not available: {e}")
           return False
 
-  def extract_text_with_ocr(self, file_path: str, max_pages: int = 20) -> Dict[str, any]:
+  def _cache_key(self, content_hash: str, max_pages: int) -> str:
+      settings = (f"v{self.CACHE_VERSION}:pages={max_pages}:ocr={self.tesseract_available}:"
+                  f"budget={self.ocr_page_budget}:mode={self.ocr_mode}:backend={self.extraction_backend}")
+      return hashlib.sha256(f"{content_hash}:{settings}".encode("utf-8")).hexdigest()
+
+  def extract_text_with_ocr(self, file_path: str, max_pages: Optional[int] = None, workers: Optional[int] = None,
+                            content_hash: Optional[str] = None,
+                            progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, any]:
+      """Extract text from a PDF, serving repeat uploads from the extraction cache.
+
+      All pages are processed unless max_pages is given. Documents with at least
+      large_document_pages pages are streamed into a PageStore; their result text is
+      a preview and result["page_store"] points at the full, searchable page text.
+      content_hash may be passed when the caller already hashed the upload.
+      progress_callback receives an event dict when extraction starts ("started"),
+      for every page that lands ("page", with its text) and when OCR of failed
+      pages begins ("ocr_started"). It is not called on cache hits.
+      """
+      if not os.path.exists(file_path):
+          return self._extract_text(file_path, max_pages, workers, progress_callback, content_hash)
+
+      try:
+          content_hash = content_hash or hash_file(file_path)
+      except OSError as e:
+          print(f"⚠️ Could not hash PDF: {e}")
+          return self._extract_text(file_path, max_pages, workers, progress_callback)
+
+      if self.cache is None:
+          return self._extract_text(file_path, max_pages, workers, progress_callback, content_hash)
+
+      cache_key = self._cache_key(content_hash, max_pages)
+      cached = self.cache.get(cache_key)
+      if cached is not None and (not cached.get("page_store") or PageStore.is_available(cached["page_store"])):
+          print(f"⚡ Extraction cache hit: {cached['word_count']} words")
+          cached["document"] = ExtractedDocument.from_dict(cached["document"])
+          cached["cache_hit"] = True
+          return cached
+
+      result = self._extract_text(file_path, max_pages, workers, progress_callback, content_hash)
+      if result["status"] != "error":
+          self.cache.set(cache_key, {**result, "document": result["document"].to_dict()})
+      result["cache_hit"] = False
+      return result
+
+  def _extract_text(self, file_path: str, max_pages: Optional[int] = None, workers: Optional[int] = None,
+                    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                    content_hash: Optional[str] = None) -> Dict[str, any]:
       result = {
           "text": "",
           "page_count": 0,
@@ -123,7 +2287,14 @@ class EnhancedPDFProcessor:
           "status": "success",
           "methods_used": [],
           "message": "",
-          "error_details": []
+          "error_details": [],
+          "page_timings": [],
+          "workers": 1,
+          "failed_pages": [],
+          "document": None,
+          "large_document": False,
+          "page_store": None,
+          "backend": None
       }
 
       if not os.path.exists(file_path):
@@ -133,59 +2304,120 @@ class EnhancedPDFProcessor:
 
       try:
           print(f"📄 Processing PDF: {file_path}")
-          text_content = ""
-          ocr_content = ""
+          page_texts = {}
+          extracted_pages = set()
+          pages_to_process = 0
+          page_store = None
+          pending_pages = []
 
-          # Try pdfplumber first
+          # Read the text layer first, with the configured or probed backend
           try:
-              with pdfplumber.open(file_path) as pdf:
-                  result["page_count"] = len(pdf.pages)
-                  pages_to_process = min(result["page_count"], max_pages)
-                  print(f"📊 PDF has {result['page_count']} pages, processing {pages_to_process}")
-
-                  for page_num, page in enumerate(pdf.pages[:pages_to_process], 1):
-                      try:
-                          page_text = page.extract_text()
-                          if page_text and len(page_text.strip()) > 20:
-                              text_content += f"\n--- Page {page_num} ---\n{page_text.strip()}\n"
-                              result["extracted_pages"] += 1
-                              print(f"✅ Extracted text from page {page_num}: {len(page_text)} chars")
-                          else:
-                              print(f"⚠️ Page {page_num}: No meaningful text found")
-                      except Exception as e:
-                          result["error_details"].append(f"Page {page_num}: {str(e)}")
-                          continue
-
-                  if result["extracted_pages"] > 0:
-                      result["methods_used"].append("text_extraction")
-                      print(f"✅ Successfully extracted text from {result['extracted_pages']} pages")
-
+              backend = self._resolve_backend(file_path)
+              result["backend"] = backend.name
+              result["page_count"] = backend.count_pages(file_path)
+              pages_to_process = min(result["page_count"], max_pages or result["page_count"])
+              print(f"📊 PDF has {result['page_count']} pages, processing {pages_to_process}")
+
+              # Large documents stream page text to disk instead of holding it in memory
+              if pages_to_process >= self.large_document_pages:
+                  store_key = self._cache_key(content_hash or hash_file(file_path), max_pages)
+                  page_store = PageStore.staging(store_key)
+                  result["large_document"] = True
+                  result["page_store"] = PageStore.document_path(store_key)
+                  print(f"📚 Large document mode: writing pages to {page_store.path}")
+
+              worker_count = max(1, min(workers or self.max_workers, pages_to_process))
+              if pages_to_process < self.parallel_min_pages:
+                  worker_count = 1
+              result["workers"] = worker_count
+              self._notify(progress_callback, {"event": "started", "pages_total": pages_to_process})
+
+              for page in self._extract_text_layer(file_path, pages_to_process, worker_count, backend.name):
+                  page_num = page["page"]
+                  page_text = page["text"]
+                  result["page_timings"].append({
+                      "page": page_num,
+                      "seconds": page["seconds"],
+                      "chars": len(page_text)
+                  })
+                  if page["error"]:
+                      result["error_details"].append(f"Page {page_num}: {page['error']}")
+                  elif len(page_text) > 20:
+                      extracted_pages.add(page_num)
+                      if page_store:
+                          pending_pages.append((page_num, "text", page_text))
+                          if len(pending_pages) >= self.PAGE_STORE_BATCH:
+                              page_store.write_pages(pending_pages)
+                              pending_pages = []
+                      else:
+                          page_texts[page_num] = ("text", page_text)
+                      result["extracted_pages"] += 1
+                      print(f"✅ Extracted text from page {page_num}: {len(page_text)} chars")
+                  else:
+                      print(f"⚠️ Page {page_num}: No meaningful text found")
+                  self._notify(progress_callback, {
+                      "event": "page",
+                      "page": page_num,
+                      "method": "text",
+                      "text": page_text if page_num in extracted_pages else ""
+                  })
+
+              if page_store:
+                  page_store.write_pages(pending_pages)
+                  pending_pages = []
+
+              if result["extracted_pages"] > 0:
+                  result["methods_used"].append("text_extraction")
+                  print(f"✅ Successfully extracted text from {result['extracted_pages']} pages")
+
+          except sqlite3.Error:
+              # Lost page writes must fail the extraction, not pass as a shorter document
+              raise
           except Exception as e:
-              result["error_details"].append(f"PDFPlumber error: {str(e)}")
-              print(f"❌ PDFPlumber failed: {e}")
+              result["error_details"].append(f"Text extraction error ({result['backend']}): {str(e)}")
+              print(f"❌ Text extraction with {result['backend']} failed: {e}")
 
-          # Try OCR if text extraction failed or yielded poor results
-          if (result["extracted_pages"] == 0 or 
-              result["extracted_pages"] < result["page_count"] * 0.3):
-              
+          # OCR only the pages whose text layer came back empty, short or broken
+          result["failed_pages"] = [n for n in range(1, pages_to_process + 1) if n not in extracted_pages]
+          if result["failed_pages"]:
               if self.tesseract_available:
-                  print("🔍 Attempting OCR extraction...")
+                  ocr_targets = result["failed_pages"][:self.ocr_page_budget]
+                  print(f"🔍 Attempting OCR on {len(ocr_targets)} of {len(result['failed_pages'])} failed pages...")
+                  if len(ocr_targets) < len(result["failed_pages"]):
+                      result["error_details"].append(
+                          f"OCR budget reached: {len(result['failed_pages']) - len(ocr_targets)} pages not OCR'd"
+                      )
+                  self._notify(progress_callback, {"event": "ocr_started", "ocr_pages": len(ocr_targets)})
                   try:
-                      ocr_content = self._extract_with_ocr(file_path, max_pages=min(5, result["page_count"]))
-                      if ocr_content:
+                      ocr_texts = self._extract_with_ocr(file_path, ocr_targets, progress_callback)
+                      if ocr_texts:
                           result["methods_used"].append("ocr")
-                          result["ocr_pages"] = ocr_content.count("--- Page")
+                          result["ocr_pages"] = len(ocr_texts)
+                          if page_store:
+                              page_store.write_pages([(n, "ocr", text) for n, text in sorted(ocr_texts.items())])
+                          else:
+                              page_texts.update({n: ("ocr", text) for n, text in ocr_texts.items()})
                           print(f"✅ OCR extracted text from {result['ocr_pages']} pages")
+                  except sqlite3.Error:
+                      raise
                   except Exception as e:
                       result["error_details"].append(f"OCR error: {str(e)}")
                       print(f"❌ OCR failed: {e}")
               else:
                   result["error_details"].append("OCR not available (Tesseract not installed)")
 
-          # Combine results
-          final_text = text_content + ocr_content
-          result["text"] = final_text.strip()
-          result["word_count"] = len(final_text.split())
+          # Combine text layer and OCR results in page order
+          if page_store:
+              page_store.mark_complete()
+              document = ExtractedDocument.from_pages(page_store.preview(self.large_document_preview_chars))
+              result["word_count"] = page_store.stats()["word_count"]
+              page_store.publish(store_key)
+              PageStore.prune(keep=page_store.path)
+          else:
+              document = ExtractedDocument.from_pages(page_texts)
+              result["word_count"] = document.word_count
+          result["document"] = document
+          result["text"] = document.text
 
           # Set final status and message
           if result["word_count"] > 50:
@@ -199,74 +2431,485 @@ class EnhancedPDFProcessor:
               result["status"] = "error"
               result["message"] = "❌ No text could be extracted. PDF might be image-based, protected, or corrupted."
 
+          if page_store and result["status"] != "error":
+              result["message"] += (f" Full text of {result['page_count']} pages is indexed for search;"
+                                    f" pages {document.pages[0].page_number}-{document.pages[-1].page_number} are loaded as a preview."
+                                    if document.pages else "")
+
           print(f"📊 Final result: {result['status']} - {result['word_count']} words")
           return result
 
       except Exception as e:
+          if page_store:
+              page_store.discard()
+              result["page_store"] = None
           result["status"] = "error"
           result["message"] = f"❌ Critical error processing PDF: {str(e)}"
           result["error_details"].append(str(e))
           return result
 
-  def _extract_with_ocr(self, file_path: str, max_pages: int = 5) -> str:
-      if not self.tesseract_available:
-          return ""
+  def _rasterize_for_ocr(self, file_path: str, page_num: int, ocr_mode: str) -> List[Tuple[Image.Image, str]]:
+      """Rasterize one page for OCR, returning (image, tesseract config) pairs.
+
+      "fixed" uses 200 DPI and --psm 6 for every page. "adaptive" first renders a
+      cheap low-resolution probe to estimate ink density, skips blank pages, and
+      picks DPI and page segmentation from the density. Orientation is left to
+      _recognize_page, which only checks it when the first pass reads poorly.
+      """
+      from pdf2image import convert_from_path
+
+      if ocr_mode != "adaptive":
+          images = convert_from_path(file_path, first_page=page_num, last_page=page_num, dpi=200)
+          return [(image, "--psm 6") for image in images]
+
+      probes = convert_from_path(
+          file_path, first_page=page_num, last_page=page_num,
+          dpi=self.OCR_PROBE_DPI, grayscale=True
+      )
+      if not probes:
+          return []
+      probe = probes[0]
+      histogram = probe.histogram()
+      density = sum(histogram[:128]) / max(1, sum(histogram))
+
+      if density < self.OCR_BLANK_DENSITY:
+          probe.close()
+          print(f"⏭️ Page {page_num}: blank (ink density {density:.3f}), skipping OCR")
+          return []
+
+      probe.close()
 
-      ocr_text = ""
-      temp_dir = tempfile.mkdtemp()
+      if density < self.OCR_SPARSE_DENSITY:
+          dpi, config = 150, "--psm 3"
+      elif density > self.OCR_DENSE_DENSITY:
+          dpi, config = 300, "--psm 6"
+      else:
+          dpi, config = 200, "--psm 6"
+      print(f"📐 Page {page_num}: ink density {density:.3f} -> {dpi} DPI ({config})")
+
+      prepared = []
+      for image in convert_from_path(file_path, first_page=page_num, last_page=page_num, dpi=dpi, grayscale=True):
+          prepared.append((binarize_image(image), config))
+          image.close()
+      return prepared
+
+  def _read_image(self, image: Image.Image, config: str) -> Tuple[str, float]:
+      """OCR an image, returning its text and the mean word confidence (0-100)"""
+      import pytesseract
+
+      data = pytesseract.image_to_data(image, lang='eng', config=config, output_type=pytesseract.Output.DICT)
+      lines, confidences = {}, []
+      for i, word in enumerate(data["text"]):
+          word = word.strip()
+          confidence = float(data["conf"][i])
+          if not word or confidence < 0:
+              continue
+          confidences.append(confidence)
+          key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+          lines.setdefault(key, []).append(word)
+
+      text, previous = [], None
+      for (block, paragraph, _), words in lines.items():
+          if previous is not None and previous != (block, paragraph):
+              text.append("")
+          text.append(" ".join(words))
+          previous = (block, paragraph)
+      return "\n".join(text), (sum(confidences) / len(confidences) if confidences else 0.0)
+
+  def _recognize_page(self, page_num: int, image: Image.Image, config: str, ocr_mode: str) -> str:
+      """OCR one prepared page image.
+
+      In adaptive mode a first pass that reads too little text or scores low
+      confidence is retried after orientation detection, which runs on the
+      working-resolution image and only for those pages.
+      """
+      import pytesseract
+
+      if ocr_mode != "adaptive":
+          return pytesseract.image_to_string(image, lang='eng', config=config).strip()
+
+      text, confidence = self._read_image(image, config)
+      if len(text) >= self.OCR_MIN_CHARS and confidence >= self.OCR_MIN_CONFIDENCE:
+          return text
 
       try:
-          print(f"🖼️ Converting PDF to images for OCR (max {max_pages} pages)...")
-          images = convert_from_path(
-              file_path, 
-              first_page=1, 
-              last_page=max_pages, 
-              output_folder=temp_dir,
-              dpi=200
-          )
-          
-          for i, image in enumerate(images, 1):
+          osd = pytesseract.image_to_osd(image)
+          rotation = int(re.search(r"Rotate:\s+(\d+)", osd).group(1))
+      except Exception:
+          return text  # Too little text for orientation detection; keep the first pass
+      if not rotation:
+          return text
+
+      upright = image.rotate(-rotation, expand=True)
+      try:
+          rotated_text, rotated_confidence = self._read_image(upright, config)
+      finally:
+          upright.close()
+      print(f"🔄 Page {page_num}: rotated {rotation}° (confidence {confidence:.0f} -> {rotated_confidence:.0f})")
+      if (rotated_confidence, len(rotated_text)) > (confidence, len(text)):
+          return rotated_text
+      return text
+
+  def _extract_with_ocr(self, file_path: str, page_numbers: List[int],
+                        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                        ocr_mode: Optional[str] = None) -> Dict[int, str]:
+      """Rasterize the given pages one at a time and OCR them on a pool of tesseract workers.
+
+      Rasterization and recognition overlap, and the bounded queue keeps only a few
+      page images in memory at once. Returns page text keyed by page number.
+      """
+      if not self.tesseract_available or not page_numbers:
+          return {}
+      ocr_mode = ocr_mode or self.ocr_mode
+
+      page_queue = queue.Queue(maxsize=self.ocr_queue_size)
+      ocr_pages = {}
+
+      def ocr_worker():
+          while True:
+              item = page_queue.get()
+              if item is None:
+                  break
+              page_num, image, config = item
               try:
-                  print(f"🔍 Processing image {i} with OCR...")
-                  page_text = pytesseract.image_to_string(
-                      image, 
-                      lang='eng', 
-                      config='--psm 6'
-                  )
-                  if page_text.strip():
-                      ocr_text += f"\n--- Page {i} (OCR) ---\n{page_text.strip()}\n"
-                      print(f"✅ OCR page {i}: {len(page_text)} chars")
+                  print(f"🔍 Processing image {page_num} with OCR...")
+                  page_text = self._recognize_page(page_num, image, config, ocr_mode)
+                  if page_text:
+                      ocr_pages[page_num] = page_text
+                      print(f"✅ OCR page {page_num}: {len(page_text)} chars")
               except Exception as e:
-                  print(f"❌ OCR failed on page {i}: {e}")
-                  continue
-          
-          return ocr_text
+                  print(f"❌ OCR failed on page {page_num}: {e}")
+              finally:
+                  image.close()
+              self._notify(progress_callback, {
+                  "event": "page",
+                  "page": page_num,
+                  "method": "ocr",
+                  "text": ocr_pages.get(page_num, "")
+              })
+
+      workers = [threading.Thread(target=ocr_worker, daemon=True) for _ in range(self.ocr_workers)]
+      for worker in workers:
+          worker.start()
+
+      try:
+          print(f"🖼️ Streaming {len(page_numbers)} PDF pages to OCR ({self.ocr_workers} workers)...")
+          for page_num in page_numbers:
+              try:
+                  images = self._rasterize_for_ocr(file_path, page_num, ocr_mode)
+              except Exception as e:
+                  print(f"❌ Rasterizing page {page_num} failed: {e}")
+                  images = []
+              if not images:
+                  self._notify(progress_callback, {"event": "page", "page": page_num, "method": "ocr", "text": ""})
+              for image, config in images:
+                  page_queue.put((page_num, image, config))
       
       except Exception as e:
           print(f"❌ OCR process failed: {e}")
-          return ""
       
       finally:
-          shutil.rmtree(temp_dir, ignore_errors=True)
+          for _ in workers:
+              page_queue.put(None)
+          for worker in workers:
+              worker.join()
+
+      return ocr_pages
+
+##### MAP-REDUCE SUMMARIZATION #####
+PAGE_MARKER = re.compile(r"^--- Page (\d+)[^\n]*---$", re.MULTILINE)
+
+
+def document_units(text: str, max_tokens: int) -> List[Tuple[Optional[Tuple[int, int]], str]]:
+    """Split text into (pages, body) units of at most max_tokens.
+
+    Units follow the "--- Page N ---" markers (the markers themselves are dropped);
+    text without markers is split into paragraphs. Pages over max_tokens are split
+    at paragraph boundaries, and paragraphs over it are cut into slices.
+    """
+    markers = list(PAGE_MARKER.finditer(text))
+    if markers:
+        pieces = []
+        for i, marker in enumerate(markers):
+            end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+            page_number = int(marker.group(1))
+            pieces.append(((page_number, page_number), text[marker.end():end].strip()))
+    else:
+        pieces = [(None, paragraph.strip()) for paragraph in PARAGRAPH_BREAK.split(text)]
+
+    units = []
+    for pages, body in pieces:
+        if not body:
+            continue
+        if count_tokens(body) <= max_tokens:
+            units.append((pages, body))
+            continue
+        for _, part in pack_chunks([(pages, p.strip()) for p in PARAGRAPH_BREAK.split(body) if p.strip()], max_tokens, None):
+            if count_tokens(part) <= max_tokens:
+                units.append((pages, part))
+                continue
+            # Conservative slice size: tokenizers rarely average under 3 characters per token
+            step = max_tokens * 3
+            units.extend((pages, part[i:i + step]) for i in range(0, len(part), step))
+    return units
+
+
+def pack_chunks(units: List[Tuple[Optional[Tuple[int, int]], str]], max_tokens: int,
+                target_units: Optional[int] = 4) -> List[Tuple[Optional[Tuple[int, int]], str]]:
+    """Group consecutive units into chunks of at most max_tokens.
+
+    Besides the size limit, a chunk ends after any unit whose content hash selects it
+    (about one unit in target_units). Boundaries then depend on the units themselves
+    rather than on their offsets, so an edit to one page leaves the other chunks - and
+    their cached summaries - unchanged.
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            first, last = current[0][0], current[-1][0]
+            pages = (first[0], last[1]) if first and last else None
+            chunks.append((pages, "\n\n".join(body for _, body in current)))
+        current = []
+        current_tokens = 0
+
+    for pages, body in units:
+        tokens = count_tokens(body)
+        if current and current_tokens + tokens > max_tokens:
+            flush()
+        current.append((pages, body))
+        current_tokens += tokens
+        if target_units and int(hashlib.sha1(body.encode("utf-8")).hexdigest(), 16) % target_units == 0:
+            flush()
+    flush()
+    return chunks
 
 ##### ENHANCED STUDY AGENTS WITH FIXED PROMPTS #####
 class SummaryAgent:
+  MAX_TOKENS = 1500
+  CHUNK_SUMMARY_TOKENS = 500
+  MAX_REDUCE_LEVELS = 3
+  # Seconds before the deadline kept for the final summary call, and allowed for one chunk call
+  REDUCE_RESERVE_SECONDS = 25.0
+  CHUNK_CALL_SECONDS = 8.0
+
   def __init__(self, client: GroqClient):
       self.client = client
+      self.chunk_tokens = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+      self.map_concurrency = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "4"))
 
   def generate_summary(self, text: str) -> str:
+      problem = self._check_content(text)
+      if problem:
+          return problem
+      
+      try:
+          prompt = self._build_prompt(text)
+          return self._parse_response(self.client.chat_completion([{"role": "user", "content": prompt}], max_tokens=self.MAX_TOKENS, task="summary"))
+      except Exception as e:
+          return f"❌ Summary generation failed: {str(e)}"
+
+  async def agenerate_summary(self, text: str, deadline: Optional[float] = None) -> str:
+      problem = self._check_content(text)
+      if problem:
+          return problem
+      
+      try:
+          deadline_at = time.monotonic() + deadline if deadline is not None else None
+          prompt = await self._abuild_prompt(text, deadline_at)
+          if deadline_at is not None:
+              deadline = deadline_at - time.monotonic()
+          return self._parse_response(await self.client.achat_completion([{"role": "user", "content": prompt}], max_tokens=self.MAX_TOKENS, deadline=deadline, task="summary"))
+      except Exception as e:
+          return f"❌ Summary generation failed: {str(e)}"
+
+  async def astream_summary(self, text: str, map_deadline: Optional[float] = None):
+      """Yield the summary as text chunks while it is generated.
+
+      map_deadline bounds the chunk summaries of a long document, which all finish
+      before the first token can stream.
+      """
+      problem = self._check_content(text)
+      if problem:
+          yield problem
+          return
+      
+      prompt = await self._abuild_prompt(text, time.monotonic() + map_deadline if map_deadline is not None else None)
+      async for chunk in self.client.astream_completion([{"role": "user", "content": prompt}], max_tokens=self.MAX_TOKENS, task="summary"):
+          yield chunk
+
+  def _check_content(self, text: str) -> Optional[str]:
       if not text.strip():
           return "❌ No content available to summarize."
       
       if len(text.split()) < 10:
           return "⚠️ Content too short for meaningful summary."
+      return None
+
+  def _build_prompt(self, text: str) -> str:
+      """Single-pass prompt when the document fits the model, otherwise a map-reduce over its chunks"""
+      chunks = self._plan_chunks(text)
+      if chunks is None:
+          return self._prompt(text)
+      
+      for _ in range(self.MAX_REDUCE_LEVELS):
+          notes = self._summarize_chunks(chunks)
+          chunks = self._regroup(notes)
+          if chunks is None:
+              break
+      return self._reduce_prompt(notes)
+
+  async def _abuild_prompt(self, text: str, deadline_at: Optional[float] = None) -> str:
+      chunks = self._plan_chunks(text)
+      if chunks is None:
+          return self._prompt(text)
       
-      # Truncate text if too long
-      max_chars = 8000
-      if len(text) > max_chars:
-          text = text[:max_chars] + "..."
+      for _ in range(self.MAX_REDUCE_LEVELS):
+          notes = await self._asummarize_chunks(chunks, deadline_at)
+          chunks = self._regroup(notes)
+          if chunks is None:
+              break
+      return self._reduce_prompt(notes)
+
+  def _plan_chunks(self, text: str) -> Optional[List[Tuple[Optional[Tuple[int, int]], str]]]:
+      """Page-aligned chunks of text, or None when the whole text fits one summary prompt"""
+      if count_tokens(text) <= self.client.content_budget(self._prompt(""), self.MAX_TOKENS, task="summary"):
+          return None
       
-      prompt = f"""Create a comprehensive, well-structured summary of the following academic content.
+      chunk_tokens = min(self.chunk_tokens, self.client.content_budget(self._chunk_prompt(""), self.CHUNK_SUMMARY_TOKENS, task="chunk_summary"))
+      chunks = pack_chunks(document_units(text, chunk_tokens), chunk_tokens)
+      print(f"📚 Document exceeds the model context, summarizing {len(chunks)} chunks")
+      return chunks
+
+  def _regroup(self, notes: List[Tuple[Optional[Tuple[int, int]], str]]) -> Optional[List[Tuple[Optional[Tuple[int, int]], str]]]:
+      """None when the chunk notes fit the final prompt, otherwise the notes packed into chunks for another round"""
+      if count_tokens(self._notes_text(notes)) <= self.client.content_budget(self._reduce_prompt([]), self.MAX_TOKENS, task="summary"):
+          return None
+      
+      chunk_tokens = min(self.chunk_tokens, self.client.content_budget(self._chunk_prompt(""), self.CHUNK_SUMMARY_TOKENS, task="chunk_summary"))
+      return pack_chunks(notes, chunk_tokens, None)
+
+  def _schedule_chunks(self, chunks: List[Tuple[Optional[Tuple[int, int]], str]],
+                       deadline_at: Optional[float] = None) -> List[Tuple[Tuple[Optional[Tuple[int, int]], str], str, float]]:
+      """(chunk, model, start offset in seconds) for each chunk call, paced to the rate limiter.
+
+      Chunk calls avoid the model the final summary routes to, so the map phase leaves
+      its budget intact. Each call is planned for when its model's buckets can admit it,
+      since the limiter sheds calls that would wait longer than its max wait. If the
+      deadline leaves room for fewer calls than chunks, an evenly spread subset is kept.
+      """
+      limiter = self.client.limiter
+      reduce_model = self.client.models_for("summary", self.MAX_TOKENS)[0]
+      route = self.client.models_for("chunk_summary", self.CHUNK_SUMMARY_TOKENS)
+      models = [m for m in route if m != reduce_model] or route
+      buckets = limiter.remaining()
+
+      def plan(selected):
+          state = {}
+          for m in models:
+              rpm, tpm = limiter.limits(m)
+              bucket = buckets.get(m, {})
+              state[m] = [0.0, float(bucket.get("requests_remaining", rpm)), float(bucket.get("tokens_remaining", tpm))]
+          schedule = []
+          for chunk in selected:
+              cost = count_tokens(self._chunk_prompt(chunk[1])) + self.CHUNK_SUMMARY_TOKENS
+              best = None
+              for m in models:
+                  rpm, tpm = limiter.limits(m)
+                  clock, requests, tokens = state[m]
+                  start = clock + max(0.0, (1 - requests) * 60 / rpm, (min(cost, tpm) - tokens) * 60 / tpm)
+                  if best is None or start < best[1]:
+                      best = (m, start)
+              m, start = best
+              rpm, tpm = limiter.limits(m)
+              clock, requests, tokens = state[m]
+              elapsed = start - clock
+              state[m] = [start, min(rpm, requests + elapsed * rpm / 60) - 1, min(tpm, tokens + elapsed * tpm / 60) - min(cost, tpm)]
+              schedule.append((chunk, m, start))
+          return schedule
+
+      schedule = plan(chunks)
+      if deadline_at is None:
+          return schedule
+      window = deadline_at - time.monotonic() - self.REDUCE_RESERVE_SECONDS - self.CHUNK_CALL_SECONDS
+      fits = max(1, sum(1 for _, _, start in schedule if start <= window))
+      if fits >= len(chunks):
+          return schedule
+      picks = sorted({round(i * (len(chunks) - 1) / max(1, fits - 1)) for i in range(fits)})
+      print(f"⏱️ Rate limits allow {fits} of {len(chunks)} chunk summaries before the deadline; summarizing an even spread")
+      return plan([chunks[i] for i in picks])
+
+  def _summarize_chunks(self, chunks: List[Tuple[Optional[Tuple[int, int]], str]]) -> List[Tuple[Optional[Tuple[int, int]], str]]:
+      # Calls go through the client's rate limiter and response cache, so unchanged chunks are free
+      schedule = self._schedule_chunks(chunks)
+      started = time.monotonic()
+
+      def summarize(planned):
+          chunk, model, start = planned
+          time.sleep(max(0.0, started + start - time.monotonic()))
+          return self.client.chat_completion([{"role": "user", "content": self._chunk_prompt(chunk[1])}], model=model,
+                                             max_tokens=self.CHUNK_SUMMARY_TOKENS, task="chunk_summary")
+
+      with ThreadPoolExecutor(max_workers=self.map_concurrency) as pool:
+          responses = list(pool.map(summarize, schedule))
+      return [(chunk[0], self._chunk_notes(chunk, response)) for (chunk, _, _), response in zip(schedule, responses)]
+
+  async def _asummarize_chunks(self, chunks: List[Tuple[Optional[Tuple[int, int]], str]],
+                               deadline_at: Optional[float] = None) -> List[Tuple[Optional[Tuple[int, int]], str]]:
+      schedule = await self.client.limiter.offload(self._schedule_chunks, chunks, deadline_at)
+      started = time.monotonic()
+      semaphore = asyncio.Semaphore(self.map_concurrency)
+
+      async def summarize(planned):
+          chunk, model, start = planned
+          await asyncio.sleep(max(0.0, started + start - time.monotonic()))
+          async with semaphore:
+              deadline = None if deadline_at is None else deadline_at - time.monotonic()
+              response = await self.client.achat_completion([{"role": "user", "content": self._chunk_prompt(chunk[1])}], model=model,
+                                                            max_tokens=self.CHUNK_SUMMARY_TOKENS, deadline=deadline, task="chunk_summary")
+          return chunk[0], self._chunk_notes(chunk, response)
+
+      return await asyncio.gather(*(summarize(planned) for planned in schedule))
+
+  def _chunk_notes(self, chunk: Tuple[Optional[Tuple[int, int]], str], response: str) -> str:
+      if response.startswith("❌"):
+          # Keep the section represented with an excerpt rather than dropping it
+          print(f"⚠️ Chunk summary failed, using an excerpt: {response}")
+          return trim_to_tokens(chunk[1], self.CHUNK_SUMMARY_TOKENS)
+      return response.strip()
+
+  def _notes_text(self, notes: List[Tuple[Optional[Tuple[int, int]], str]]) -> str:
+      sections = []
+      for i, (pages, summary) in enumerate(notes, 1):
+          if pages is None:
+              label = f"Section {i}"
+          elif pages[0] == pages[1]:
+              label = f"Page {pages[0]}"
+          else:
+              label = f"Pages {pages[0]}-{pages[1]}"
+          sections.append(f"### {label}\n{summary}")
+      return "\n\n".join(sections)
+
+  def _reduce_prompt(self, notes: List[Tuple[Optional[Tuple[int, int]], str]]) -> str:
+      return self._prompt(self._notes_text(notes),
+                          "a long academic document, given as section-by-section notes in document order")
+
+  def _chunk_prompt(self, text: str) -> str:
+      return f"""Summarize this section of a longer academic document as concise study notes.
+
+Section Content:
+{text}
+
+List the main points, key concepts with their definitions, and important evidence, examples or conclusions.
+Use short bullet points, keep technical terms exact, and do not add an introduction or conclusion."""
+
+  def _prompt(self, text: str, description: str = "the following academic content") -> str:
+      if text:
+          text = self.client.fit_content(text, self._prompt("", description), self.MAX_TOKENS, task="summary")
+      return f"""Create a comprehensive, well-structured summary of {description}.
 
 Document Content:
 {text}
@@ -294,14 +2937,11 @@ List 4-6 essential points that students must remember
 Highlight areas that deserve extra attention
 
 Make the summary engaging, clear, and educational."""
-      
-      try:
-          response = self.client.chat_completion([{"role": "user", "content": prompt}], max_tokens=1500)
-          if response.startswith("❌"):
-              return f"❌ Summary generation failed: {response}"
-          return response
-      except Exception as e:
-          return f"❌ Summary generation failed: {str(e)}"
+
+  def _parse_response(self, response: str) -> str:
+      if response.startswith("❌"):
+          return f"❌ Summary generation failed: {response}"
+      return response
 """
 AIPresentationCoordinatorAgent - Add this class to your pipeline.py file
 """
@@ -464,7 +3104,8 @@ Guidelines:
         try:
             response = self.client.chat_completion(
                 [{"role": "user", "content": prompt}],
-                max_tokens=2000
+                max_tokens=2000,
+                task="presentation"
             )
             
             # Parse JSON response
@@ -628,23 +3269,52 @@ Guidelines:
             self.logger.error(f"PPTX generation failed: {str(e)}")
             return False
 class FlashcardAgent:
+  MAX_TOKENS = 2500
+
   def __init__(self, client: GroqClient):
       self.client = client
 
   def generate_flashcards_structured(self, text: str, num_cards=10) -> List[Dict]:
       """Generate structured flashcards data for the app interface"""
-      if not text.strip():
+      text = self._prepare_text(text)
+      if text is None:
           return []
       
-      if len(text.split()) < 20:
+      try:
+          response = self.client.chat_completion([{"role": "user", "content": self._build_prompt(text, num_cards)}], max_tokens=self.MAX_TOKENS, task="flashcards")
+          return self._parse_response(response, text, num_cards)
+      except Exception as e:
+          print(f"❌ Flashcard generation error: {e}")
+          return self._generate_basic_flashcards(text, num_cards)
+
+  async def agenerate_flashcards_structured(self, text: str, num_cards=10, deadline: Optional[float] = None) -> List[Dict]:
+      """Async generate_flashcards_structured for the API server"""
+      text = self._prepare_text(text)
+      if text is None:
           return []
       
-      # Truncate text if too long
-      max_chars = 7000
-      if len(text) > max_chars:
-          text = text[:max_chars] + "..."
+      try:
+          response = await self.client.achat_completion([{"role": "user", "content": self._build_prompt(text, num_cards)}], max_tokens=self.MAX_TOKENS,
+                                                      deadline=deadline, task="flashcards")
+          return self._parse_response(response, text, num_cards)
+      except Exception as e:
+          print(f"❌ Flashcard generation error: {e}")
+          return self._generate_basic_flashcards(text, num_cards)
+
+  def _prepare_text(self, text: str) -> Optional[str]:
+      """Source text, or None when it is too short for flashcards"""
+      if not text.strip():
+          return None
       
-      prompt = f"""Create {num_cards} high-quality study flashcards based on the following content. Return ONLY a valid JSON array with no additional text.
+      if len(text.split()) < 20:
+          return None
+      return text
+
+  def _build_prompt(self, text: str, num_cards: int) -> str:
+      return self._prompt(self.client.fit_content(text, self._prompt("", num_cards), self.MAX_TOKENS, task="flashcards"), num_cards)
+
+  def _prompt(self, text: str, num_cards: int) -> str:
+      return f"""Create {num_cards} high-quality study flashcards based on the following content. Return ONLY a valid JSON array with no additional text.
 
 Content:
 {text}
@@ -673,49 +3343,46 @@ Guidelines:
 - Include relevant examples in answers
 - Mix difficulty levels: Basic, Intermediate, Advanced
 - Keep questions clear and answers comprehensive"""
+
+  def _parse_response(self, response: str, text: str, num_cards: int) -> List[Dict]:
+      # Clean response to extract JSON
+      response = response.strip()
+      if response.startswith("```json"):
+          response = response[7:]
+      if response.endswith("```"):
+          response = response[:-3]
+      response = response.strip()
       
+      # Try to parse JSON response
       try:
-          response = self.client.chat_completion([{"role": "user", "content": prompt}], max_tokens=2500)
-          
-          # Clean response to extract JSON
-          response = response.strip()
-          if response.startswith("```json"):
-              response = response[7:]
-          if response.endswith("```"):
-              response = response[:-3]
-          response = response.strip()
-          
-          # Try to parse JSON response
-          try:
-              flashcards_data = safe_json_parse(response)
-              if isinstance(flashcards_data, list) and len(flashcards_data) > 0:
-                  # Validate structure
-                  valid_cards = []
-                  for card in flashcards_data:
-                      if isinstance(card, dict) and 'question' in card and 'answer' in card:
-                          # Ensure all required fields
-                          valid_card = {
-                              'question': str(card.get('question', '')),
-                              'answer': str(card.get('answer', '')),
-                              'difficulty': card.get('difficulty', 'Basic'),
-                              'category': card.get('category', 'General'),
-                              'hint': card.get('hint', '')
-                          }
-                          valid_cards.append(valid_card)
-                  
-                  if valid_cards:
-                      print(f"✅ Generated {len(valid_cards)} flashcards")
-                      return valid_cards
-          except json.JSONDecodeError as e:
-              print(f"❌ JSON parsing failed: {e}")
-              print(f"Response: {response[:200]}...")
-          
-          # Fallback: generate basic flashcards
-          return self._generate_basic_flashcards(text, num_cards)
+          valid_cards = self.validate_flashcards(safe_json_parse(response))
+          if valid_cards:
+              print(f"✅ Generated {len(valid_cards)} flashcards")
+              return valid_cards
+      except json.JSONDecodeError as e:
+          print(f"❌ JSON parsing failed: {e}")
+          print(f"Response: {response[:200]}...")
       
-      except Exception as e:
-          print(f"❌ Flashcard generation error: {e}")
-          return self._generate_basic_flashcards(text, num_cards)
+      # Fallback: generate basic flashcards
+      return self._generate_basic_flashcards(text, num_cards)
+
+  def validate_flashcards(self, flashcards_data: Any) -> List[Dict]:
+      """Well-formed cards from parsed JSON, with every field filled in; [] when none are usable"""
+      if not isinstance(flashcards_data, list):
+          return []
+      valid_cards = []
+      for card in flashcards_data:
+          if isinstance(card, dict) and 'question' in card and 'answer' in card:
+              # Ensure all required fields
+              valid_card = {
+                  'question': str(card.get('question', '')),
+                  'answer': str(card.get('answer', '')),
+                  'difficulty': card.get('difficulty', 'Basic'),
+                  'category': card.get('category', 'General'),
+                  'hint': card.get('hint', '')
+              }
+              valid_cards.append(valid_card)
+      return valid_cards
   
   def _generate_basic_flashcards(self, text: str, num_cards: int) -> List[Dict]:
       """Generate basic flashcards as fallback"""
@@ -740,23 +3407,52 @@ Guidelines:
       return flashcards[:num_cards]
 
 class QuizAgent:
+  MAX_TOKENS = 3000
+
   def __init__(self, client: GroqClient):
       self.client = client
 
   def generate_quiz_structured(self, text: str, num_questions=8) -> List[Dict]:
       """Generate structured quiz data for the app interface"""
-      if not text.strip():
+      text = self._prepare_text(text)
+      if text is None:
           return []
       
-      if len(text.split()) < 30:
+      try:
+          response = self.client.chat_completion([{"role": "user", "content": self._build_prompt(text, num_questions)}], max_tokens=self.MAX_TOKENS, task="quiz")
+          return self._parse_response(response, text, num_questions)
+      except Exception as e:
+          print(f"❌ Quiz generation error: {e}")
+          return self._generate_basic_quiz(text, num_questions)
+
+  async def agenerate_quiz_structured(self, text: str, num_questions=8, deadline: Optional[float] = None) -> List[Dict]:
+      """Async generate_quiz_structured for the API server"""
+      text = self._prepare_text(text)
+      if text is None:
           return []
       
-      # Truncate text if too long
-      max_chars = 7000
-      if len(text) > max_chars:
-          text = text[:max_chars] + "..."
+      try:
+          response = await self.client.achat_completion([{"role": "user", "content": self._build_prompt(text, num_questions)}], max_tokens=self.MAX_TOKENS,
+                                                      deadline=deadline, task="quiz")
+          return self._parse_response(response, text, num_questions)
+      except Exception as e:
+          print(f"❌ Quiz generation error: {e}")
+          return self._generate_basic_quiz(text, num_questions)
+
+  def _prepare_text(self, text: str) -> Optional[str]:
+      """Source text, or None when it is too short for a quiz"""
+      if not text.strip():
+          return None
       
-      prompt = f"""Create {num_questions} multiple choice questions based on the following content. Return ONLY a valid JSON array with no additional text.
+      if len(text.split()) < 30:
+          return None
+      return text
+
+  def _build_prompt(self, text: str, num_questions: int) -> str:
+      return self._prompt(self.client.fit_content(text, self._prompt("", num_questions), self.MAX_TOKENS, task="quiz"), num_questions)
+
+  def _prompt(self, text: str, num_questions: int) -> str:
+      return f"""Create {num_questions} multiple choice questions based on the following content. Return ONLY a valid JSON array with no additional text.
 
 Content:
 {text}
@@ -785,56 +3481,53 @@ Guidelines:
 - Mix difficulty: Basic, Intermediate, Advanced
 - correct_answer should be the index (0-3) of the correct option
 - Provide educational explanations"""
+
+  def _parse_response(self, response: str, text: str, num_questions: int) -> List[Dict]:
+      # Clean response to extract JSON
+      response = response.strip()
+      if response.startswith("```json"):
+          response = response[7:]
+      if response.endswith("```"):
+          response = response[:-3]
+      response = response.strip()
       
+      # Try to parse JSON response
       try:
-          response = self.client.chat_completion([{"role": "user", "content": prompt}], max_tokens=3000)
-          
-          # Clean response to extract JSON
-          response = response.strip()
-          if response.startswith("```json"):
-              response = response[7:]
-          if response.endswith("```"):
-              response = response[:-3]
-          response = response.strip()
-          
-          # Try to parse JSON response
-          try:
-              quiz_data = safe_json_parse(response)
-              if isinstance(quiz_data, list) and len(quiz_data) > 0:
-                  # Validate structure
-                  valid_questions = []
-                  for q in quiz_data:
-                      if (isinstance(q, dict) and 'question' in q and 'options' in q 
-                          and 'correct_answer' in q and isinstance(q['options'], list) 
-                          and len(q['options']) == 4):
-                          
-                          # Ensure valid correct_answer index
-                          correct_idx = q.get('correct_answer', 0)
-                          if not isinstance(correct_idx, int) or correct_idx < 0 or correct_idx > 3:
-                              correct_idx = 0
-                          
-                          valid_question = {
-                              'question': str(q.get('question', '')),
-                              'options': [str(opt) for opt in q['options'][:4]],
-                              'correct_answer': correct_idx,
-                              'explanation': str(q.get('explanation', 'No explanation provided')),
-                              'difficulty': q.get('difficulty', 'Basic')
-                          }
-                          valid_questions.append(valid_question)
-                  
-                  if valid_questions:
-                      print(f"✅ Generated {len(valid_questions)} quiz questions")
-                      return valid_questions
-          except json.JSONDecodeError as e:
-              print(f"❌ JSON parsing failed: {e}")
-              print(f"Response: {response[:200]}...")
-          
-          # Fallback: generate basic quiz
-          return self._generate_basic_quiz(text, num_questions)
+          valid_questions = self.validate_questions(safe_json_parse(response))
+          if valid_questions:
+              print(f"✅ Generated {len(valid_questions)} quiz questions")
+              return valid_questions
+      except json.JSONDecodeError as e:
+          print(f"❌ JSON parsing failed: {e}")
+          print(f"Response: {response[:200]}...")
       
-      except Exception as e:
-          print(f"❌ Quiz generation error: {e}")
-          return self._generate_basic_quiz(text, num_questions)
+      # Fallback: generate basic quiz
+      return self._generate_basic_quiz(text, num_questions)
+
+  def validate_questions(self, quiz_data: Any) -> List[Dict]:
+      """Well-formed four-option questions from parsed JSON; [] when none are usable"""
+      if not isinstance(quiz_data, list):
+          return []
+      valid_questions = []
+      for q in quiz_data:
+          if (isinstance(q, dict) and 'question' in q and 'options' in q 
+              and 'correct_answer' in q and isinstance(q['options'], list) 
+              and len(q['options']) == 4):
+              
+              # Ensure valid correct_answer index
+              correct_idx = q.get('correct_answer', 0)
+              if not isinstance(correct_idx, int) or correct_idx < 0 or correct_idx > 3:
+                  correct_idx = 0
+              
+              valid_question = {
+                  'question': str(q.get('question', '')),
+                  'options': [str(opt) for opt in q['options'][:4]],
+                  'correct_answer': correct_idx,
+                  'explanation': str(q.get('explanation', 'No explanation provided')),
+                  'difficulty': q.get('difficulty', 'Basic')
+              }
+              valid_questions.append(valid_question)
+      return valid_questions
   
   def _generate_basic_quiz(self, text: str, num_questions: int) -> List[Dict]:
       """Generate basic quiz as fallback"""
@@ -863,6 +3556,163 @@ Guidelines:
       
       return quiz_questions[:num_questions]
 
+##### COMBINED STUDY PACK AGENT #####
+class StudyPackAgent:
+    """Summary, flashcards, quiz and keywords from one structured request.
+
+    The document text is sent once instead of four times. Each section of the
+    JSON reply is validated on its own; a missing or malformed section is
+    regenerated by the agent that normally owns it, so one bad section never
+    costs the whole pack. When the completion for the requested item counts
+    would leave less than MIN_CONTENT_TOKENS of a longer document, every section
+    goes to its own agent instead, since each of those sees more of the text.
+    """
+    SECTIONS = ("summary", "flashcards", "quiz", "keywords")
+    # Completion allowance per section; the prompt asks for short items to keep these small
+    SUMMARY_TOKENS = 900
+    KEYWORDS_TOKENS = 80
+    FLASHCARD_TOKENS = 90
+    QUESTION_TOKENS = 110
+    MIN_CONTENT_TOKENS = 2000
+
+    def __init__(self, client: GroqClient, summary_agent: Optional[SummaryAgent] = None,
+                 flashcard_agent: Optional[FlashcardAgent] = None, quiz_agent: Optional[QuizAgent] = None,
+                 research_agent=None):
+        self.client = client
+        self.summary_agent = summary_agent or SummaryAgent(client)
+        self.flashcard_agent = flashcard_agent or FlashcardAgent(client)
+        self.quiz_agent = quiz_agent or QuizAgent(client)
+        self.research_agent = research_agent or AIEnhancedResearchDiscoveryAgent(client)
+
+    def max_tokens(self, num_cards: int, num_questions: int) -> int:
+        return (self.SUMMARY_TOKENS + self.KEYWORDS_TOKENS
+                + num_cards * self.FLASHCARD_TOKENS + num_questions * self.QUESTION_TOKENS)
+
+    def _build_prompt(self, text: str, num_cards: int, num_questions: int, max_tokens: int) -> Optional[str]:
+        """Combined prompt, or None if too little of the document would fit in it"""
+        template = self._prompt("", num_cards, num_questions)
+        budget = self.client.content_budget(template, max_tokens, task="study_pack")
+        if budget < self.MIN_CONTENT_TOKENS and count_tokens(text) > budget:
+            print(f"📦 Study pack would keep only {budget} tokens of the document; using the separate agents")
+            return None
+        return self._prompt(self.client.fit_content(text, template, max_tokens, task="study_pack"), num_cards, num_questions)
+
+    def _prompt(self, text: str, num_cards: int, num_questions: int) -> str:
+        return f"""Create a complete study pack for the following academic content. Return ONLY a valid JSON object with no additional text.
+
+Content:
+{text}
+
+Return format (MUST be valid JSON):
+{{
+  "summary": "Markdown summary with the sections ## 📋 DOCUMENT OVERVIEW, ## 🎯 KEY CONCEPTS & DEFINITIONS, ## 📝 DETAILED SUMMARY, ## 🔑 CRITICAL TAKEAWAYS and ## 📚 STUDY FOCUS AREAS",
+  "flashcards": [
+    {{"question": "Clear, specific question", "answer": "Concise answer", "difficulty": "Basic", "category": "Main topic category", "hint": "Short memory aid"}}
+  ],
+  "quiz": [
+    {{"question": "Clear, specific question", "options": ["Option A", "Option B", "Option C", "Option D"], "correct_answer": 0, "explanation": "Why the answer is correct", "difficulty": "Basic"}}
+  ],
+  "keywords": {{
+    "main_topic": "The primary subject or field",
+    "keywords": ["keyword1", "keyword2", "keyword3", "keyword4", "keyword5"]
+  }}
+}}
+
+Guidelines:
+- Exactly {num_cards} flashcards and {num_questions} quiz questions
+- Keep the summary under 500 words, flashcard answers to one or two sentences and quiz explanations to one sentence
+- Mix difficulty levels: Basic, Intermediate, Advanced
+- correct_answer is the index (0-3) of the correct option
+- Keywords should be academic and technical terms useful for finding related research
+- Escape newlines inside the summary string as \\n"""
+
+    def _parse_sections(self, response: str, num_cards: int, num_questions: int) -> Dict[str, Any]:
+        """Valid sections of the combined reply; malformed ones are left out"""
+        data = safe_json_parse(response) if not response.startswith("❌") else None
+        if not isinstance(data, dict):
+            return {}
+
+        sections = {}
+        summary = data.get("summary")
+        if isinstance(summary, str) and len(summary.split()) >= 30:
+            sections["summary"] = summary.strip()
+        flashcards = self.flashcard_agent.validate_flashcards(data.get("flashcards"))
+        if flashcards:
+            sections["flashcards"] = flashcards[:num_cards]
+        quiz = self.quiz_agent.validate_questions(data.get("quiz"))
+        if quiz:
+            sections["quiz"] = quiz[:num_questions]
+        keywords = data.get("keywords")
+        if isinstance(keywords, dict) and isinstance(keywords.get("keywords"), list) and keywords["keywords"]:
+            sections["keywords"] = {
+                "topic": str(keywords.get("main_topic") or "Academic Research"),
+                "keywords": [str(keyword) for keyword in keywords["keywords"][:8]]
+            }
+        return sections
+
+    def _keywords_fallback(self, text: str) -> Dict[str, Any]:
+        keywords, topic = self.research_agent.extract_smart_keywords_and_topic(text)
+        return {"topic": topic, "keywords": keywords}
+
+    def _assemble(self, sections: Dict[str, Any], fallback_sections: List[str]) -> Dict[str, Any]:
+        print(f"✅ Study pack ready (regenerated: {', '.join(fallback_sections) or 'none'})")
+        return {**{section: sections.get(section) for section in self.SECTIONS}, "fallback_sections": fallback_sections}
+
+    def generate_study_pack(self, text: str, num_cards: int = 10, num_questions: int = 8) -> Dict[str, Any]:
+        """Generate every section in one request, regenerating malformed sections one by one"""
+        max_tokens = self.max_tokens(num_cards, num_questions)
+        sections = {}
+        try:
+            prompt = self._build_prompt(text, num_cards, num_questions, max_tokens)
+            if prompt is not None:
+                response = self.client.chat_completion(
+                    [{"role": "user", "content": prompt}], max_tokens=max_tokens, task="study_pack"
+                )
+                sections = self._parse_sections(response, num_cards, num_questions)
+        except Exception as e:
+            print(f"❌ Study pack generation error: {e}")
+
+        fallback_sections = [section for section in self.SECTIONS if section not in sections]
+        for section in fallback_sections:
+            print(f"⚠️ Study pack section '{section}' missing or malformed, regenerating")
+            if section == "summary":
+                sections[section] = self.summary_agent.generate_summary(text)
+            elif section == "flashcards":
+                sections[section] = self.flashcard_agent.generate_flashcards_structured(text, num_cards)
+            elif section == "quiz":
+                sections[section] = self.quiz_agent.generate_quiz_structured(text, num_questions)
+            else:
+                sections[section] = self._keywords_fallback(text)
+        return self._assemble(sections, fallback_sections)
+
+    async def agenerate_study_pack(self, text: str, num_cards: int = 10, num_questions: int = 8,
+                                   deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Async generate_study_pack; malformed sections are regenerated concurrently"""
+        max_tokens = self.max_tokens(num_cards, num_questions)
+        sections = {}
+        try:
+            prompt = self._build_prompt(text, num_cards, num_questions, max_tokens)
+            if prompt is not None:
+                response = await self.client.achat_completion(
+                    [{"role": "user", "content": prompt}], max_tokens=max_tokens, deadline=deadline, task="study_pack"
+                )
+                sections = self._parse_sections(response, num_cards, num_questions)
+        except Exception as e:
+            print(f"❌ Study pack generation error: {e}")
+
+        fallback_sections = [section for section in self.SECTIONS if section not in sections]
+        regenerators = {
+            "summary": lambda: self.summary_agent.agenerate_summary(text),
+            "flashcards": lambda: self.flashcard_agent.agenerate_flashcards_structured(text, num_cards),
+            "quiz": lambda: self.quiz_agent.agenerate_quiz_structured(text, num_questions),
+            "keywords": lambda: asyncio.to_thread(self._keywords_fallback, text)
+        }
+        for section in fallback_sections:
+            print(f"⚠️ Study pack section '{section}' missing or malformed, regenerating")
+        results = await asyncio.gather(*(regenerators[section]() for section in fallback_sections))
+        sections.update(zip(fallback_sections, results))
+        return self._assemble(sections, fallback_sections)
+
 ##### REAL WEB DISCOVERY AGENTS #####
 
 #!/usr/bin/env python3
@@ -878,6 +3728,10 @@ from typing import Dict, List, Any, Tuple
 from urllib.parse import quote_plus
 
 class QAChatbotAgent:
+    ANSWER_MAX_TOKENS = 800
+    SUGGESTIONS_MAX_TOKENS = 400
+    SUGGESTIONS_INPUT_TOKENS = 1000
+
     def __init__(self, client: GroqClient):
         self.client = client
         self.conversation_history = {}
@@ -941,12 +3795,6 @@ class QAChatbotAgent:
     def _generate_ai_answer(self, question: str, document_text: str, session_id: str) -> str:
         """Generate AI-powered answer with conversation context"""
         try:
-            # Limit document text for processing
-            max_chars = 6000
-            text_content = document_text[:max_chars]
-            if len(document_text) > max_chars:
-                text_content += "..."
-                
             # Build conversation context
             context = ""
             if session_id in self.conversation_history and self.conversation_history[session_id]:
@@ -954,8 +3802,25 @@ class QAChatbotAgent:
                 context = "\n\nPrevious conversation:\n"
                 for i, (prev_q, prev_a) in enumerate(recent_history, 1):
                     context += f"Q{i}: {prev_q}\nA{i}: {prev_a[:100]}...\n"
-                    
-            prompt = f"""You are an intelligent document assistant. Answer the question based on the document content and conversation context.
+
+            template = self._answer_prompt(question, "", context)
+            text_content = self.client.fit_content(document_text, template, self.ANSWER_MAX_TOKENS, task="answer")
+            prompt = self._answer_prompt(question, text_content, context)
+
+            response = self.client.chat_completion(
+                [{"role": "user", "content": prompt}], 
+                max_tokens=self.ANSWER_MAX_TOKENS,
+                task="answer"
+            )
+            
+            return response
+            
+        except Exception as e:
+            print(f"❌ AI answer generation failed: {e}")
+            return f"❌ AI answer generation failed: {str(e)}"
+    
+    def _answer_prompt(self, question: str, text_content: str, context: str) -> str:
+        return f"""You are an intelligent document assistant. Answer the question based on the document content and conversation context.
 
 Document Content:
 {text_content}
@@ -972,17 +3837,6 @@ Instructions:
 - Keep the answer well-structured and educational
 
 Answer:"""
-
-            response = self.client.chat_completion(
-                [{"role": "user", "content": prompt}], 
-                max_tokens=800
-            )
-            
-            return response
-            
-        except Exception as e:
-            print(f"❌ AI answer generation failed: {e}")
-            return f"❌ AI answer generation failed: {str(e)}"
     
     def _generate_enhanced_fallback_answer(self, question: str, document_text: str, session_id: str) -> str:
         """Enhanced fallback answer with better text analysis"""
@@ -1099,13 +3953,11 @@ Answer:"""
     def _generate_ai_suggested_questions(self, document_text: str, num_questions: int) -> List[str]:
         """Generate AI-powered suggested questions"""
         try:
-            # Limit text for analysis
-            analysis_text = document_text[:4000]
-            
+            # A sample of the document is enough to suggest questions
             prompt = f"""Based on this document content, generate {num_questions} insightful questions that would help someone understand the material better.
 
 Document Content:
-{analysis_text}
+{PROMPT_CONTENT}
 
 Generate questions that:
 - Test understanding of key concepts
@@ -1116,10 +3968,13 @@ Generate questions that:
 
 Return ONLY a JSON array of questions:
 ["Question 1?", "Question 2?", "Question 3?"]"""
+            prompt = self.client.fill_prompt(prompt, document_text, self.SUGGESTIONS_MAX_TOKENS,
+                                             max_input_tokens=self.SUGGESTIONS_INPUT_TOKENS, task="suggestions")
 
             response = self.client.chat_completion(
                 [{"role": "user", "content": prompt}], 
-                max_tokens=400
+                max_tokens=self.SUGGESTIONS_MAX_TOKENS,
+                task="suggestions"
             )
             
             # Clean and parse response
@@ -1243,6 +4098,9 @@ Return ONLY a JSON array of questions:
 
 
 class AIEnhancedResearchDiscoveryAgent:
+    KEYWORDS_MAX_TOKENS = 300
+    KEYWORDS_INPUT_TOKENS = 1500
+
     def __init__(self, client):
         self.client = client
         self.session = requests.Session()
@@ -1257,12 +4115,9 @@ class AIEnhancedResearchDiscoveryAgent:
         if not text.strip():
             return ["academic", "study"], "Academic Content"
         
-        # Limit text for analysis
-        analysis_text = text[:6000]
-        
         prompt = f"""Analyze this academic text and extract the most important keywords and main topic for research discovery.
 
-Text: {analysis_text}
+Text: {PROMPT_CONTENT}
 
 Return ONLY a JSON object with this format:
 {{
@@ -1272,10 +4127,11 @@ Return ONLY a JSON object with this format:
 }}
 
 Focus on academic and technical terms that would help find relevant research papers."""
+        prompt = self.client.fill_prompt(prompt, text, self.KEYWORDS_MAX_TOKENS, max_input_tokens=self.KEYWORDS_INPUT_TOKENS, task="keywords")
 
         for attempt in range(self.max_retries):
             try:
-                response = self.client.chat_completion([{"role": "user", "content": prompt}], max_tokens=300)
+                response = self.client.chat_completion([{"role": "user", "content": prompt}], max_tokens=self.KEYWORDS_MAX_TOKENS, task="keywords")
                 
                 # Clean response
                 response = response.strip()
@@ -1698,25 +4554,7 @@ Focus on academic and technical terms that would help find relevant research pap
             return all_papers[:max_papers]
 
 
-import os
-import json
-import re
-from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
-from googleapiclient.discovery import build
-from dotenv import load_dotenv
-import requests
-
-load_dotenv()
-
-# REPLACE your AIEnhancedYouTubeDiscoveryAgent class with this fixed version
-
-from transformers import pipeline
-from pptx import Presentation
-from pptx.util import Inches
-import tempfile
-import os
-from typing import List, Dict, Tuple
 
 class PresentationAgent:
     def __init__(self, slidegpt_api_key: str = None):
@@ -2108,6 +4946,9 @@ class AIEnhancedYouTubeDiscoveryAgent:
 # REPLACE your AIEnhancedWebResourceAgent class with this fixed version
 
 class AIEnhancedWebResourceAgent:
+    KEYWORDS_MAX_TOKENS = 200
+    KEYWORDS_INPUT_TOKENS = 1500
+
     def __init__(self, client):
         self.client = client
         self.session = requests.Session()
@@ -2122,13 +4963,10 @@ class AIEnhancedWebResourceAgent:
         if not text.strip():
             return "Educational Resources", ["education", "learning"], ["education", "learning"]
         
-        # Limit text for analysis
-        analysis_text = text[:6000]
-        
         if self.client and self.client.client:
             prompt = f"""Analyze this text and extract keywords for finding educational web resources.
 
-Text: {analysis_text}
+Text: {PROMPT_CONTENT}
 
 Return ONLY a JSON object:
 {{
@@ -2137,9 +4975,10 @@ Return ONLY a JSON object:
 }}
 
 Focus on educational terms that would help find learning resources."""
+            prompt = self.client.fill_prompt(prompt, text, self.KEYWORDS_MAX_TOKENS, max_input_tokens=self.KEYWORDS_INPUT_TOKENS, task="keywords")
 
             try:
-                response = self.client.chat_completion([{"role": "user", "content": prompt}], max_tokens=200)
+                response = self.client.chat_completion([{"role": "user", "content": prompt}], max_tokens=self.KEYWORDS_MAX_TOKENS, task="keywords")
                 
                 # Clean response
                 response = response.strip()
@@ -2451,197 +5290,502 @@ Focus on educational terms that would help find learning resources."""
         except:
             return False
 
+##### LAZY AGENT REGISTRY #####
+# name -> factory(registry); factories pull the agents they depend on from the registry
+AGENT_FACTORIES = {
+    "client": lambda registry: GroqClient(),
+    "pdf_processor": lambda registry: EnhancedPDFProcessor(),
+    "summary": lambda registry: SummaryAgent(registry.get("client")),
+    "flashcards": lambda registry: FlashcardAgent(registry.get("client")),
+    "quiz": lambda registry: QuizAgent(registry.get("client")),
+    "research": lambda registry: AIEnhancedResearchDiscoveryAgent(registry.get("client")),
+    "youtube": lambda registry: AIEnhancedYouTubeDiscoveryAgent(registry.get("client")),
+    "web": lambda registry: AIEnhancedWebResourceAgent(registry.get("client")),
+    "qa": lambda registry: QAChatbotAgent(registry.get("client")),
+    "presentation": lambda registry: PresentationAgent(),
+    "coordinator": lambda registry: AIPresentationCoordinatorAgent(registry.get("client")),
+    "study_pack": lambda registry: StudyPackAgent(
+        registry.get("client"), registry.get("summary"), registry.get("flashcards"),
+        registry.get("quiz"), registry.get("research")
+    )
+}
+
+
+class AgentRegistry:
+    """Builds each agent on first use and hands out that one instance afterwards.
+
+    Nothing is constructed up front, so a process only pays for the agents (and the
+    optional dependencies they import, such as tesseract or the YouTube client) that
+    it actually uses. Construction is serialized, so concurrent first requests share
+    one instance.
+    """
+
+    def __init__(self, factories: Optional[Dict[str, Callable[["AgentRegistry"], Any]]] = None, **instances):
+        self.factories = dict(AGENT_FACTORIES if factories is None else factories)
+        # Prebuilt instances (e.g. client=AsyncGroqClient()) take the place of factories
+        self._instances = dict(instances)
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[["AgentRegistry"], Any]):
+        with self._lock:
+            self.factories[name] = factory
+            self._instances.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                if name not in self.factories:
+                    raise KeyError(f"Unknown agent: {name}")
+                started = time.perf_counter()
+                self._instances[name] = self.factories[name](self)
+                print(f"🧩 Initialized {name} in {time.perf_counter() - started:.2f}s")
+            return self._instances[name]
+
+    def loaded(self) -> List[str]:
+        return list(self._instances)
+
+    def close(self):
+        """Release resources held by loaded agents (the PDF processor's process pool)"""
+        processor = self._instances.get("pdf_processor")
+        if processor is not None:
+            processor.close()
+
+##### STUDY ASSISTANT ORCHESTRATION #####
+@dataclass
+class StageResult:
+    """Outcome and wall time of one run_study_assistant stage"""
+    status: str
+    seconds: float
+    error: Optional[str] = None
+
+
+@dataclass
+class StudyAssistantResult:
+    """Everything run_study_assistant produced for one PDF, with per-stage timings"""
+    pdf_path: str
+    status: str = "success"
+    message: str = ""
+    word_count: int = 0
+    summary: str = ""
+    flashcards: List[Dict] = field(default_factory=list)
+    quiz: List[Dict] = field(default_factory=list)
+    presentation: Dict[str, Any] = field(default_factory=dict)
+    presentation_path: str = ""
+    keywords: List[str] = field(default_factory=list)
+    topic: str = ""
+    papers: List[Dict] = field(default_factory=list)
+    videos: List[Dict] = field(default_factory=list)
+    resources: List[Dict] = field(default_factory=list)
+    stages: Dict[str, StageResult] = field(default_factory=dict)
+    total_seconds: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+async def arun_study_assistant(pdf_path: str, registry: Optional[AgentRegistry] = None,
+                               max_concurrency: Optional[int] = None,
+                               presentation_path: Optional[str] = None) -> StudyAssistantResult:
+    """Extract a PDF, then run the independent generation and discovery stages concurrently.
+
+    Agents come from registry (a fresh AgentRegistry by default) and share its one
+    GroqClient, so the client's token-bucket limiter and response cache cover all
+    stages. At most max_concurrency stages (STUDY_ASSISTANT_CONCURRENCY, default 4)
+    run at once; 1 runs them one after another. A failing stage is recorded in
+    result.stages and leaves its field empty instead of aborting the run.
+    The presentation is written to presentation_path (default: next to the PDF).
+    """
+    started = time.monotonic()
+    result = StudyAssistantResult(pdf_path=pdf_path)
+    registry = registry or AgentRegistry()
+    semaphore = asyncio.Semaphore(max_concurrency or int(os.getenv("STUDY_ASSISTANT_CONCURRENCY", "4")))
+
+    async def stage(name: str, func: Callable, *args, **kwargs):
+        async with semaphore:
+            stage_started = time.monotonic()
+            try:
+                value = await asyncio.to_thread(func, *args, **kwargs)
+                # Some stages report failure in their result dict instead of raising
+                error = value.get("message") or value.get("error") if isinstance(value, dict) and value.get("status") == "error" else None
+                result.stages[name] = StageResult("error" if error else "success", round(time.monotonic() - stage_started, 3), error)
+                return value
+            except Exception as e:
+                print(f"❌ Stage {name} failed: {e}")
+                result.stages[name] = StageResult("error", round(time.monotonic() - stage_started, 3), str(e))
+                return None
 
+    print("\n📄 Extracting text from PDF...")
+    extraction = await stage("extraction", registry.get("pdf_processor").extract_text_with_ocr, pdf_path)
+    if not extraction or extraction["status"] == "error":
+        result.status = "error"
+        result.message = extraction["message"] if extraction else result.stages["extraction"].error
+        result.total_seconds = round(time.monotonic() - started, 3)
+        return result
 
-# Updated main execution logic with proper error handling
-def run_study_assistant(pdf_path):
+    text = extraction["text"]
+    result.message = extraction["message"]
+    result.word_count = extraction["word_count"]
+    print(f"\n{result.message}")
+    if result.word_count < 20:
+        print("⚠️ Very little content extracted. Results may be limited.")
+
+    research_agent = registry.get("research")
+    pptx_path = presentation_path or os.path.join(os.path.dirname(pdf_path), f"{Path(pdf_path).stem}_presentation.pptx")
+
+    async def discovery():
+        # Videos and resources search on the same extracted keywords, so they wait for them
+        extracted = await stage("keywords", research_agent.extract_smart_keywords_and_topic, text)
+        keywords, topic = extracted or (["academic", "study"], "Academic Content")
+        videos, resources = await asyncio.gather(
+            stage("videos", registry.get("youtube").find_videos, keywords, topic, max_videos=6),
+            stage("resources", registry.get("web").find_resources, keywords, topic, max_resources=8)
+        )
+        return keywords, topic, videos, resources
+
+    print("\n🧠 Generating study materials and discovering resources...")
+    summary, flashcards, quiz, presentation, papers, (keywords, topic, videos, resources) = await asyncio.gather(
+        stage("summary", registry.get("summary").generate_summary, text),
+        stage("flashcards", registry.get("flashcards").generate_flashcards_structured, text, num_cards=8),
+        stage("quiz", registry.get("quiz").generate_quiz_structured, text, num_questions=6),
+        stage("presentation", registry.get("presentation").generate_presentation,
+              document_text=text, output_path=pptx_path, max_slides=12, generate_images=False),
+        stage("papers", research_agent.find_papers, text, max_papers=6),
+        discovery()
+    )
+
+    result.summary = summary or ""
+    result.flashcards = flashcards or []
+    result.quiz = quiz or []
+    result.presentation = presentation or {}
+    result.presentation_path = pptx_path
+    result.keywords, result.topic = keywords, topic
+    result.papers = papers or []
+    result.videos = videos or []
+    result.resources = resources or []
+    result.total_seconds = round(time.monotonic() - started, 3)
+    return result
+
+
+def run_study_assistant(pdf_path: str, max_concurrency: Optional[int] = None) -> Optional[StudyAssistantResult]:
     """Main function to run the study assistant pipeline"""
     print(f"\n🎓 Processing: {pdf_path}")
     
     try:
-        # Initialize components
-        client = GroqClient()
-        processor = EnhancedPDFProcessor()
-        summary_agent = SummaryAgent(client)
-        flashcard_agent = FlashcardAgent(client)
-        quiz_agent = QuizAgent(client)
-        presentation_agent = PresentationAgent()
-        
-        # Create discovery agents
-        print("🔧 Initializing discovery agents...")
-        research_agent = AIEnhancedResearchDiscoveryAgent(client)
-        youtube_agent = AIEnhancedYouTubeDiscoveryAgent(client)
-        web_agent = AIEnhancedWebResourceAgent(client)
-        print("✅ Discovery agents initialized")
+        registry = AgentRegistry()
+        try:
+            result = asyncio.run(arun_study_assistant(pdf_path, registry, max_concurrency=max_concurrency))
+        finally:
+            registry.close()
+        if result.status == "error":
+            print(f"❌ PDF Processing Failed: {result.message}")
+            return result
+        print_study_results(result)
+        return result
 
-        # Extract text
-        print("\n📄 Extracting text from PDF...")
-        result = processor.extract_text_with_ocr(pdf_path)
+    except Exception as e:
+        print(f"❌ Critical error in study assistant: {str(e)}")
+        import traceback
+        print(f"📍 Full error trace:\n{traceback.format_exc()}")
+        return None
 
-        if result["status"] == "error":
-            print(f"❌ PDF Processing Failed: {result['message']}")
-            return
 
-        print(f"\n{result['message']}")
-        
-        if result["word_count"] < 20:
-            print("⚠️ Very little content extracted. Results may be limited.")
+def print_study_results(result: StudyAssistantResult):
+    if result.presentation.get("status") == "success":
+        print(f"✅ Generated presentation: {result.presentation_path}")
+    else:
+        print(f"⚠️ Presentation generation had issues: {result.presentation.get('message') or result.presentation.get('error', 'unknown error')}")
 
-        # Generate study materials
-        print("\n🧠 Generating study materials...")
-        
-        print("📘 Creating summary...")
-        summary = summary_agent.generate_summary(result["text"])
-        
-        print("🃏 Creating flashcards...")
-        flashcards = flashcard_agent.generate_flashcards_structured(result["text"], num_cards=8)
-        
-        print("📝 Creating quiz...")
-        quiz = quiz_agent.generate_quiz_structured(result["text"], num_questions=6)
+    print("\n" + "="*80)
+    print("📘 SUMMARY")
+    print("="*80)
+    print(result.summary)
+    
+    if result.flashcards:
+        print("\n" + "="*80)
+        print("🃏 FLASHCARDS")
+        print("="*80)
+        for i, card in enumerate(result.flashcards, 1):
+            print(f"\nCard {i}:")
+            print(f"Q: {card.get('question', 'No question')}")
+            print(f"A: {card.get('answer', 'No answer')}")
+            print(f"Difficulty: {card.get('difficulty', 'N/A')}")
+    
+    if result.quiz:
+        print("\n" + "="*80)
+        print("📝 QUIZ")
+        print("="*80)
+        for i, question in enumerate(result.quiz, 1):
+            print(f"\nQuestion {i}: {question.get('question', 'No question')}")
+            options = question.get('options', [])
+            for j, option in enumerate(options):
+                print(f"{j+1}. {option}")
+            correct_idx = question.get('correct_answer', 0)
+            if 0 <= correct_idx < len(options):
+                print(f"Correct answer: {options[correct_idx]}")
+            print(f"Explanation: {question.get('explanation', 'No explanation')}")
+    
+    if result.papers:
+        print("\n" + "="*80)
+        print("📄 RESEARCH PAPERS")
+        print("="*80)
+        for i, paper in enumerate(result.papers, 1):
+            print(f"\nPaper {i}: {paper.get('title', 'No title')}")
+            print(f"Authors: {paper.get('authors', 'Unknown')}")
+            print(f"Source: {paper.get('source', 'Unknown')} ({paper.get('year', 'N/A')})")
+            abstract = paper.get('abstract', 'No abstract available')
+            print(f"Abstract: {abstract[:200]}{'...' if len(abstract) > 200 else ''}")
+            print(f"URL: {paper.get('url', 'No URL')}")
+            print(f"Relevance: {paper.get('relevance_label', 'N/A')}")
+    else:
+        print("\n" + "="*80)
+        print("📄 RESEARCH PAPERS")
+        print("="*80)
+        print("No research papers found. This could be due to:")
+        print("- Limited or non-academic content in the PDF")
+        print("- Network connectivity issues")
+        print("- API rate limiting")
+    
+    if result.videos:
+        print("\n" + "="*80)
+        print("🎥 EDUCATIONAL VIDEOS")
+        print("="*80)
+        for i, video in enumerate(result.videos, 1):
+            print(f"\nVideo {i}: {video.get('title', 'No title')}")
+            print(f"Channel: {video.get('channel', 'Unknown')}")
+            print(f"Duration: {video.get('duration', 'N/A')} | Views: {video.get('views', 'N/A')}")
+            description = video.get('description', 'No description')
+            print(f"Description: {description[:200]}{'...' if len(description) > 200 else ''}")
+            print(f"URL: {video.get('url', 'No URL')}")
+            print(f"Quality: {video.get('educational_score', 'N/A')}")
+    else:
+        print("\n" + "="*80)
+        print("🎥 EDUCATIONAL VIDEOS")
+        print("="*80)
+        print("No educational videos found. This could be due to:")
+        print("- YouTube access restrictions")
+        print("- Limited educational content for this topic")
+        print("- Network connectivity issues")
+    
+    if result.resources:
+        print("\n" + "="*80)
+        print("🌐 WEB RESOURCES")
+        print("="*80)
+        for i, resource in enumerate(result.resources, 1):
+            print(f"\nResource {i}: {resource.get('title', 'No title')}")
+            print(f"Type: {resource.get('type', 'Unknown')} | Source: {resource.get('source', 'Unknown')}")
+            description = resource.get('description', 'No description')
+            print(f"Description: {description[:200]}{'...' if len(description) > 200 else ''}")
+            print(f"URL: {resource.get('url', 'No URL')}")
+            print(f"Quality: {resource.get('quality_score', 'N/A')}")
+    else:
+        print("\n" + "="*80)
+        print("🌐 WEB RESOURCES")
+        print("="*80)
+        print("No web resources found. This could be due to:")
+        print("- Network connectivity issues")
+        print("- Content filtering restrictions")
+        print("- Limited educational resources for this topic")
 
-        # Generate presentation
-        print("\n📊 Generating presentation...")
-        pptx_path = os.path.join(os.path.dirname(pdf_path), "generated_presentation.pptx")
-        presentation_result = presentation_agent.generate_presentation(
-            document_text=result["text"],
-            output_path=pptx_path,
-            max_slides=12,
-            generate_images=False
-        )
-        
-        if presentation_result["status"] == "success":
-            print(f"✅ Generated presentation: {pptx_path}")
-        else:
-            print(f"⚠️ Presentation generation had issues: {presentation_result['message']}")
+    print("\n" + "="*80)
+    print("⏱️ STAGE TIMINGS")
+    print("="*80)
+    for name, stage in result.stages.items():
+        print(f"{name:<14} {stage.seconds:>8.2f}s  {stage.status}{f' ({stage.error})' if stage.error else ''}")
+    print(f"{'total':<14} {result.total_seconds:>8.2f}s")
 
-        # Discovery phase
-        print("\n🔍 Discovering learning resources...")
-        
-        papers = []
-        videos = []
-        resources = []
-        
-        try:
-            print("📄 Finding research papers...")
-            papers = research_agent.find_papers(result["text"], max_papers=6)
-            print(f"✅ Found {len(papers)} research papers")
-        except Exception as e:
-            print(f"❌ Research paper discovery failed: {e}")
-        
-        try:
-            print("🎥 Finding educational videos...")
-            videos = youtube_agent.find_videos(result["text"], max_videos=6)
-            print(f"✅ Found {len(videos)} educational videos")
-        except Exception as e:
-            print(f"❌ Video discovery failed: {e}")
-        
-        try:
-            print("🌐 Finding web resources...")
-            resources = web_agent.find_resources(result["text"], max_resources=8)
-            print(f"✅ Found {len(resources)} web resources")
-        except Exception as e:
-            print(f"❌ Web resource discovery failed: {e}")
+    print(f"\n✅ Study assistant completed successfully!")
+    print(f"📊 Generated: {len(result.flashcards)} flashcards, {len(result.quiz)} quiz questions")
+    print(f"🔍 Found: {len(result.papers)} papers, {len(result.videos)} videos, {len(result.resources)} resources")
+
+##### BATCH PROCESSING #####
+BATCH_JSONL_NAME = "results.jsonl"
+_batch_state = {}
+
+
+def collect_batch_inputs(source: str) -> List[str]:
+    """PDF paths from a directory (searched recursively) or a manifest file.
+
+    A manifest lists one path per line (blank lines and # comments are ignored) or,
+    as .jsonl, one {"path": ...} object per line. Relative paths are resolved
+    against the manifest's folder.
+    """
+    if os.path.isdir(source):
+        return sorted(str(path) for path in Path(source).rglob("*") if path.suffix.lower() == ".pdf" and path.is_file())
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path = json.loads(line)["path"] if source.endswith(".jsonl") else line
+            paths.append(path if os.path.isabs(path) else os.path.join(base_dir, path))
+    return paths
 
-        # Display results
-        print("\n" + "="*80)
-        print("📘 SUMMARY")
-        print("="*80)
-        print(summary)
-        
-        if flashcards:
-            print("\n" + "="*80)
-            print("🃏 FLASHCARDS")
-            print("="*80)
-            for i, card in enumerate(flashcards, 1):
-                print(f"\nCard {i}:")
-                print(f"Q: {card.get('question', 'No question')}")
-                print(f"A: {card.get('answer', 'No answer')}")
-                print(f"Difficulty: {card.get('difficulty', 'N/A')}")
-        
-        if quiz:
-            print("\n" + "="*80)
-            print("📝 QUIZ")
-            print("="*80)
-            for i, question in enumerate(quiz, 1):
-                print(f"\nQuestion {i}: {question.get('question', 'No question')}")
-                options = question.get('options', [])
-                for j, option in enumerate(options):
-                    print(f"{j+1}. {option}")
-                correct_idx = question.get('correct_answer', 0)
-                if 0 <= correct_idx < len(options):
-                    print(f"Correct answer: {options[correct_idx]}")
-                print(f"Explanation: {question.get('explanation', 'No explanation')}")
-        
-        if papers:
-            print("\n" + "="*80)
-            print("📄 RESEARCH PAPERS")
-            print("="*80)
-            for i, paper in enumerate(papers, 1):
-                print(f"\nPaper {i}: {paper.get('title', 'No title')}")
-                print(f"Authors: {paper.get('authors', 'Unknown')}")
-                print(f"Source: {paper.get('source', 'Unknown')} ({paper.get('year', 'N/A')})")
-                abstract = paper.get('abstract', 'No abstract available')
-                print(f"Abstract: {abstract[:200]}{'...' if len(abstract) > 200 else ''}")
-                print(f"URL: {paper.get('url', 'No URL')}")
-                print(f"Relevance: {paper.get('relevance_label', 'N/A')}")
-        else:
-            print("\n" + "="*80)
-            print("📄 RESEARCH PAPERS")
-            print("="*80)
-            print("No research papers found. This could be due to:")
-            print("- Limited or non-academic content in the PDF")
-            print("- Network connectivity issues")
-            print("- API rate limiting")
-        
-        if videos:
-            print("\n" + "="*80)
-            print("🎥 EDUCATIONAL VIDEOS")
-            print("="*80)
-            for i, video in enumerate(videos, 1):
-                print(f"\nVideo {i}: {video.get('title', 'No title')}")
-                print(f"Channel: {video.get('channel', 'Unknown')}")
-                print(f"Duration: {video.get('duration', 'N/A')} | Views: {video.get('views', 'N/A')}")
-                description = video.get('description', 'No description')
-                print(f"Description: {description[:200]}{'...' if len(description) > 200 else ''}")
-                print(f"URL: {video.get('url', 'No URL')}")
-                print(f"Quality: {video.get('educational_score', 'N/A')}")
-        else:
-            print("\n" + "="*80)
-            print("🎥 EDUCATIONAL VIDEOS")
-            print("="*80)
-            print("No educational videos found. This could be due to:")
-            print("- YouTube access restrictions")
-            print("- Limited educational content for this topic")
-            print("- Network connectivity issues")
-        
-        if resources:
-            print("\n" + "="*80)
-            print("🌐 WEB RESOURCES")
-            print("="*80)
-            for i, resource in enumerate(resources, 1):
-                print(f"\nResource {i}: {resource.get('title', 'No title')}")
-                print(f"Type: {resource.get('type', 'Unknown')} | Source: {resource.get('source', 'Unknown')}")
-                description = resource.get('description', 'No description')
-                print(f"Description: {description[:200]}{'...' if len(description) > 200 else ''}")
-                print(f"URL: {resource.get('url', 'No URL')}")
-                print(f"Quality: {resource.get('quality_score', 'N/A')}")
-        else:
-            print("\n" + "="*80)
-            print("🌐 WEB RESOURCES")
-            print("="*80)
-            print("No web resources found. This could be due to:")
-            print("- Network connectivity issues")
-            print("- Content filtering restrictions")
-            print("- Limited educational resources for this topic")
-
-        print(f"\n✅ Study assistant completed successfully!")
-        print(f"📊 Generated: {len(flashcards)} flashcards, {len(quiz)} quiz questions")
-        print(f"🔍 Found: {len(papers)} papers, {len(videos)} videos, {len(resources)} resources")
 
+def _batch_output_name(pdf_path: str, root: str) -> str:
+    # Relative path keeps same-named PDFs from different folders apart
+    relative = os.path.relpath(os.path.abspath(pdf_path), root)
+    return os.path.splitext(relative)[0].replace(os.sep, "__")
+
+
+def _load_completed(output_dir: str, output_format: str, names: Dict[str, str]) -> Dict[str, str]:
+    """{pdf_path: source_sha256} of documents already processed successfully in output_dir"""
+    completed = {}
+    if output_format == "jsonl":
+        jsonl_path = os.path.join(output_dir, BATCH_JSONL_NAME)
+        if os.path.exists(jsonl_path):
+            with open(jsonl_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Line cut short by an interrupted run
+                    if record.get("status") == "success":
+                        completed[record["pdf_path"]] = record.get("source_sha256")
+        return completed
+
+    for pdf_path, name in names.items():
+        try:
+            with open(os.path.join(output_dir, f"{name}.json"), "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        if record.get("status") == "success":
+            completed[pdf_path] = record.get("source_sha256")
+    return completed
+
+
+def _init_batch_worker(max_concurrency: Optional[int]):
+    """Process pool initializer: one agent registry (and so one GroqClient) per worker, reused for every document"""
+    registry = AgentRegistry()
+    # Documents are the unit of parallelism here, so each worker extracts pages in-process
+    registry.register("pdf_processor", lambda registry: EnhancedPDFProcessor(max_workers=1))
+    _batch_state["registry"] = registry
+    _batch_state["max_concurrency"] = max_concurrency
+
+
+def _process_batch_document(pdf_path: str, presentation_path: str) -> Dict[str, Any]:
+    started = time.monotonic()
+    try:
+        source_hash = hash_file(pdf_path)
+        result = asyncio.run(arun_study_assistant(
+            pdf_path,
+            registry=_batch_state["registry"],
+            max_concurrency=_batch_state["max_concurrency"],
+            presentation_path=presentation_path
+        ))
     except Exception as e:
-        print(f"❌ Critical error in study assistant: {str(e)}")
-        import traceback
-        print(f"📍 Full error trace:\n{traceback.format_exc()}")
+        source_hash = None
+        result = StudyAssistantResult(pdf_path=pdf_path, status="error", message=str(e),
+                                      total_seconds=round(time.monotonic() - started, 3))
+    return {**result.to_dict(), "source_sha256": source_hash}
+
+
+def run_batch(source: str, output_dir: str, workers: Optional[int] = None, output_format: str = "json",
+              resume: bool = True, max_concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """Run the study assistant over every PDF in a directory or manifest.
+
+    Documents are spread over a process pool (BATCH_WORKERS, default min(4, CPUs)).
+    Each worker keeps one GroqClient; all of them share the on-disk extraction and
+    response caches and, through GROQ_RATE_LIMIT_DB, one Groq rate budget.
+    output_format "json" writes <output_dir>/<name>.json per document, "jsonl"
+    appends one line per document to <output_dir>/results.jsonl. With resume,
+    documents whose successful output matches the file's current hash are skipped,
+    so an interrupted run picks up where it stopped.
+    """
+    started = time.monotonic()
+    pdf_paths = [os.path.abspath(path) for path in collect_batch_inputs(source)]
+    root = os.path.abspath(source) if os.path.isdir(source) else os.path.commonpath(pdf_paths or [os.getcwd()])
+    if pdf_paths and not os.path.isdir(root):
+        root = os.path.dirname(root)
+    names = {path: _batch_output_name(path, root) for path in pdf_paths}
+    os.makedirs(output_dir, exist_ok=True)
+    presentation_dir = os.path.join(output_dir, "presentations")
+    os.makedirs(presentation_dir, exist_ok=True)
+
+    pending = pdf_paths
+    if resume:
+        completed = _load_completed(output_dir, output_format, names)
+        pending = [path for path in pdf_paths if path not in completed or completed[path] != hash_file(path)]
+    skipped = len(pdf_paths) - len(pending)
+    workers = max(1, min(workers or int(os.getenv("BATCH_WORKERS", "0")) or min(4, os.cpu_count() or 1), len(pending) or 1))
+    print(f"📦 Batch: {len(pdf_paths)} PDFs, {skipped} already done, {len(pending)} to process on {workers} workers")
+
+    # Worker processes share one rate budget unless the caller already configured one
+    os.environ.setdefault("GROQ_RATE_LIMIT_DB", os.path.join(CACHE_DIR, "groq_rate_limits.sqlite3"))
+    summary = {"total": len(pdf_paths), "processed": 0, "skipped": skipped, "failed": 0,
+               "interrupted": False, "output_dir": os.path.abspath(output_dir)}
+    jsonl_file = open(os.path.join(output_dir, BATCH_JSONL_NAME), "a", encoding="utf-8") if output_format == "jsonl" else None
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker, initargs=(max_concurrency,))
+    try:
+        # Decks are named like the JSON outputs so same-named PDFs in different folders don't collide
+        futures = {
+            executor.submit(_process_batch_document, path,
+                            os.path.join(presentation_dir, f"{names[path]}_presentation.pptx")): path
+            for path in pending
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                # The worker itself died (BrokenProcessPool and similar)
+                record = {**StudyAssistantResult(pdf_path=path, status="error", message=str(e)).to_dict(), "source_sha256": None}
+
+            if jsonl_file:
+                jsonl_file.write(json.dumps(record, default=str) + "\n")
+                jsonl_file.flush()
+            else:
+                # Write then rename, so an interruption never leaves a truncated file that looks complete
+                output_path = os.path.join(output_dir, f"{names[path]}.json")
+                with open(output_path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(record, f, indent=2, default=str)
+                os.replace(output_path + ".tmp", output_path)
+
+            done = summary["processed"] + summary["failed"] + 1
+            if record["status"] == "success":
+                summary["processed"] += 1
+                print(f"✅ [{done}/{len(pending)}] {names[path]} ({record['total_seconds']:.1f}s)")
+            else:
+                summary["failed"] += 1
+                print(f"❌ [{done}/{len(pending)}] {names[path]}: {record['message']}")
+    except KeyboardInterrupt:
+        summary["interrupted"] = True
+        print("\n⏹️ Batch interrupted; run again with the same output folder to resume")
+    finally:
+        executor.shutdown(wait=not summary["interrupted"], cancel_futures=True)
+        if jsonl_file:
+            jsonl_file.close()
+
+    summary["seconds"] = round(time.monotonic() - started, 3)
+    print(f"📦 Batch finished in {summary['seconds']:.1f}s: {summary['processed']} processed, "
+          f"{summary['skipped']} skipped, {summary['failed']} failed")
+    return summary
+
+
+def batch_cli(argv: List[str]) -> int:
+    """Command-line entry point: python pipeline.py batch <folder-or-manifest> [options]"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="pipeline.py", description="AI Study Assistant batch processing")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    batch = subcommands.add_parser("batch", help="generate study packs for a folder or manifest of PDFs")
+    batch.add_argument("source", help="folder of PDFs (searched recursively) or manifest file (.txt or .jsonl)")
+    batch.add_argument("-o", "--output", default="study_packs", help="output folder (default: study_packs)")
+    batch.add_argument("-w", "--workers", type=int, help="worker processes (default: BATCH_WORKERS or min(4, CPUs))")
+    batch.add_argument("-c", "--concurrency", type=int, help="concurrent stages per document (default: STUDY_ASSISTANT_CONCURRENCY or 4)")
+    batch.add_argument("--format", choices=("json", "jsonl"), default="json", help="one JSON file per document, or one JSONL line each")
+    batch.add_argument("--no-resume", action="store_true", help="reprocess documents that already have output")
+    args = parser.parse_args(argv)
+
+    summary = run_batch(args.source, args.output, workers=args.workers, output_format=args.format,
+                        resume=not args.no_resume, max_concurrency=args.concurrency)
+    return 1 if summary["failed"] or summary["interrupted"] else 0
 
 # Test function for the discovery agents
 def test_discovery_agents():
@@ -2657,14 +5801,16 @@ def test_discovery_agents():
         papers = research_agent.find_papers(sample_text, max_papers=3)
         print(f"✅ Research agent found {len(papers)} papers")
         
+        keywords, topic = research_agent.extract_smart_keywords_and_topic(sample_text)
+        
         print("🎥 Testing YouTube agent...")
         youtube_agent = AIEnhancedYouTubeDiscoveryAgent(client)
-        videos = youtube_agent.find_videos(sample_text, max_videos=3)
+        videos = youtube_agent.find_videos(keywords, topic, max_videos=3)
         print(f"✅ YouTube agent found {len(videos)} videos")
         
         print("🌐 Testing web resource agent...")
         web_agent = AIEnhancedWebResourceAgent(client)
-        resources = web_agent.find_resources(sample_text, max_resources=3)
+        resources = web_agent.find_resources(keywords, topic, max_resources=3)
         print(f"✅ Web agent found {len(resources)} resources")
         
         print("✅ All discovery agents tested successfully!")
@@ -2674,7 +5820,165 @@ def test_discovery_agents():
         import traceback
         print(f"📍 Full error trace:\n{traceback.format_exc()}")
         
+##### BENCHMARKS #####
+def benchmark_ocr_modes(corpus_dir: str, modes: Tuple[str, ...] = ("fixed", "adaptive"), max_pages: int = 5) -> Dict[str, Dict[str, float]]:
+    """Compare OCR modes on a folder of PDFs by throughput and accuracy.
+
+    Accuracy is word recall against each page's embedded text layer, so the corpus
+    should be digital PDFs: their pages are rasterized and OCR'd as if scanned.
+    """
+    processor = EnhancedPDFProcessor(use_cache=False)
+    if not processor.tesseract_available:
+        print("❌ Tesseract is required to benchmark OCR modes")
+        return {}
+
+    pdf_paths = sorted(Path(corpus_dir).glob("*.pdf"))
+    print(f"🧪 Benchmarking OCR modes {', '.join(modes)} on {len(pdf_paths)} PDFs (max {max_pages} pages each)")
+    totals = {mode: {"pages": 0, "words": 0, "seconds": 0.0, "matched": 0, "reference": 0} for mode in modes}
+
+    for pdf_path in pdf_paths:
+        try:
+            reference = {page["page"]: page["text"] for page in _extract_page_range(str(pdf_path), 0, max_pages)}
+        except Exception as e:
+            print(f"⚠️ Skipping {pdf_path.name}: {e}")
+            continue
+        pages = [page_num for page_num, text in reference.items() if len(text) > 20]
+        if not pages:
+            print(f"⚠️ Skipping {pdf_path.name}: no text layer to compare against")
+            continue
+
+        for mode in modes:
+            started = time.perf_counter()
+            ocr_texts = processor._extract_with_ocr(str(pdf_path), pages, ocr_mode=mode)
+            totals[mode]["seconds"] += time.perf_counter() - started
+            for page_num in pages:
+                reference_words = Counter(reference[page_num].lower().split())
+                ocr_words = Counter(ocr_texts.get(page_num, "").lower().split())
+                totals[mode]["pages"] += 1
+                totals[mode]["words"] += sum(ocr_words.values())
+                totals[mode]["matched"] += sum((reference_words & ocr_words).values())
+                totals[mode]["reference"] += sum(reference_words.values())
+
+    results = {}
+    print(f"\n{'Mode':<10} {'Pages':>6} {'Seconds':>9} {'Words/s':>9} {'Accuracy':>9}")
+    for mode, total in totals.items():
+        results[mode] = {
+            "pages": total["pages"],
+            "seconds": round(total["seconds"], 2),
+            "words_per_second": round(total["words"] / total["seconds"], 1) if total["seconds"] else 0.0,
+            "accuracy": round(total["matched"] / total["reference"], 3) if total["reference"] else 0.0
+        }
+        r = results[mode]
+        print(f"{mode:<10} {r['pages']:>6} {r['seconds']:>9} {r['words_per_second']:>9} {r['accuracy']:>9.1%}")
+    return results
+
+def benchmark_extraction_backends(corpus_dir: str, backends: Optional[Tuple[str, ...]] = None,
+                                  max_pages: Optional[int] = None) -> Dict[str, Dict[str, float]]:
+    """Compare text-layer backends on a folder of PDFs by throughput and agreement.
+
+    Every backend runs single-process so pages/second is a per-core figure.
+    Agreement is word recall against pdfplumber, the most layout-faithful backend.
+    """
+    backends = backends or tuple(name for name, backend in EXTRACTION_BACKENDS.items() if backend.is_available())
+    pdf_paths = sorted(Path(corpus_dir).glob("*.pdf"))
+    print(f"🧪 Benchmarking extraction backends {', '.join(backends)} on {len(pdf_paths)} PDFs")
+    totals = {name: {"pages": 0, "seconds": 0.0, "matched": 0, "reference": 0} for name in backends}
+
+    for pdf_path in pdf_paths:
+        try:
+            page_limit = max_pages or PdfPlumberBackend().count_pages(str(pdf_path))
+            started = time.perf_counter()
+            reference = {page["page"]: page["text"] for page in _extract_page_range(str(pdf_path), 0, page_limit)}
+            reference_seconds = time.perf_counter() - started
+        except Exception as e:
+            print(f"⚠️ Skipping {pdf_path.name}: {e}")
+            continue
+        chosen, reason = choose_extraction_backend(str(pdf_path))
+        print(f"📄 {pdf_path.name}: {len(reference)} pages, auto chooses {chosen} ({reason})")
+
+        for name in backends:
+            if name == PdfPlumberBackend.name:
+                pages, seconds = reference, reference_seconds
+            else:
+                started = time.perf_counter()
+                pages = {page["page"]: page["text"] for page in _extract_page_range(str(pdf_path), 0, page_limit, name)}
+                seconds = time.perf_counter() - started
+            totals[name]["pages"] += len(pages)
+            totals[name]["seconds"] += seconds
+            for page_num, text in reference.items():
+                reference_words = Counter(text.lower().split())
+                backend_words = Counter(pages.get(page_num, "").lower().split())
+                totals[name]["matched"] += sum((reference_words & backend_words).values())
+                totals[name]["reference"] += sum(reference_words.values())
+
+    results = {}
+    print(f"\n{'Backend':<12} {'Pages':>6} {'Seconds':>9} {'Pages/s':>9} {'Agreement':>10}")
+    for name, total in totals.items():
+        results[name] = {
+            "pages": total["pages"],
+            "seconds": round(total["seconds"], 2),
+            "pages_per_second": round(total["pages"] / total["seconds"], 1) if total["seconds"] else 0.0,
+            "agreement": round(total["matched"] / total["reference"], 3) if total["reference"] else 0.0
+        }
+        r = results[name]
+        print(f"{name:<12} {r['pages']:>6} {r['seconds']:>9} {r['pages_per_second']:>9} {r['agreement']:>10.1%}")
+    return results
+
+
+def benchmark_import_time(module: str = "pipeline", runs: int = 5, top: int = 10) -> Dict[str, Any]:
+    """Time a cold import of module in fresh interpreters, as a new API worker pays it.
+
+    Each run is a new Python process started with -X importtime, so only the OS file
+    cache carries over between runs. Reports wall-clock seconds per run, the peak
+    memory of the importing process, and the slowest direct imports of module.
+    """
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    seconds = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                   cwd=module_dir, capture_output=True, text=True)
+        seconds.append(time.perf_counter() - started)
+        if completed.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+
+    # Lines read "import time: self [us] | cumulative | name", children indented under parents
+    direct_imports = []
+    for line in completed.stderr.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:") or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        if len(name) - len(name.lstrip()) == 3:
+            direct_imports.append((name.strip(), int(parts[1]) / 1000))
+    direct_imports.sort(key=lambda item: item[1], reverse=True)
+
+    try:
+        import resource
+        # ru_maxrss is the largest child so far: KiB on Linux, bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        max_rss_mb = round(max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        max_rss_mb = None
+
+    results = {
+        "module": module,
+        "runs": runs,
+        "mean_seconds": round(sum(seconds) / len(seconds), 3),
+        "min_seconds": round(min(seconds), 3),
+        "max_rss_mb": max_rss_mb,
+        "slowest_imports": [{"module": name, "ms": round(ms, 1)} for name, ms in direct_imports[:top]]
+    }
+    print(f"⏱️ import {module}: mean {results['mean_seconds']}s, min {results['min_seconds']}s over {runs} runs"
+          f"{f', peak RSS {max_rss_mb} MB' if max_rss_mb else ''}")
+    for item in results["slowest_imports"]:
+        print(f"   {item['module']:<28} {item['ms']:>8.1f} ms")
+    return results
+
 if __name__ == "__main__":
+  if len(sys.argv) > 1:
+      sys.exit(batch_cli(sys.argv[1:]))
+
   print("\n🎓 AI Study Assistant CLI - Enhanced Version")
   print("="*50)
   print("1. Run Study Assistant")
@@ -2682,8 +5986,12 @@ if __name__ == "__main__":
   print("3. Test OCR Setup")
   print("4. Test Groq Connection")
   print("5. Exit")
+  print("6. Benchmark OCR Modes")
+  print("7. Benchmark Extraction Backends")
+  print("8. Batch Process PDFs")
+  print("9. Benchmark Import Time")
   
-  choice = input("\nChoose an option (1-5): ").strip()
+  choice = input("\nChoose an option (1-9): ").strip()
 
   if choice == "1":
       pdf_path = input("Enter PDF file path: ").strip().strip('"')
@@ -2705,5 +6013,21 @@ if __name__ == "__main__":
   elif choice == "5":
       print("👋 Goodbye!")
   
+  elif choice == "6":
+      corpus_dir = input("Enter folder of sample PDFs: ").strip().strip('"')
+      benchmark_ocr_modes(corpus_dir)
+  
+  elif choice == "7":
+      corpus_dir = input("Enter folder of sample PDFs: ").strip().strip('"')
+      benchmark_extraction_backends(corpus_dir)
+  
+  elif choice == "8":
+      source = input("Enter folder of PDFs or manifest file: ").strip().strip('"')
+      output_dir = input("Enter output folder [study_packs]: ").strip().strip('"') or "study_packs"
+      run_batch(source, output_dir)
+  
+  elif choice == "9":
+      benchmark_import_time()
+  
   else:
-      print("❌ Invalid option. Please choose 1-5.")
+      print("❌ Invalid option. Please choose 1-9.")
@@ -55,7 +55,7 @@ export function FileUpload() {
       setUploadStatus('success');
 
       // Update session
-      const sessionInfo = await apiService.getSessionInfo();
+      const sessionInfo = await apiService.getSessionInfo(result.session_id);
       dispatch({ type: 'SET_SESSION', payload: sessionInfo });
 
       // Generate all study materials
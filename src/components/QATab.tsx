@@ -43,7 +43,11 @@ export function QATab() {
     setIsLoading(true);
 
     try {
-      const response = await apiService.askQuestion(userMessage.content, state.documentText || 'document_text_placeholder');
+      const response = await apiService.askQuestion(
+        userMessage.content,
+        state.documentText || 'document_text_placeholder',
+        state.session.session_id
+      );
       
       const botMessage: ChatMessage = {
         id: (Date.now() + 1).toString(),
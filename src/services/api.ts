@@ -34,6 +34,36 @@ api.interceptors.response.use(
   }
 );
 
+// Read a server-sent-events response, calling onToken for each streamed chunk.
+// Resolves with fallback_used from the final event.
+async function readEventStream(path: string, init: RequestInit, onToken: (token: string) => void): Promise<{ fallbackUsed: boolean }> {
+  const response = await fetch(`${API_BASE}${path}`, init);
+  if (!response.ok || !response.body) {
+    throw new Error(`Stream request failed: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let fallbackUsed = false;
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    const events = buffer.split('\n\n');
+    buffer = events.pop() || '';
+    for (const event of events) {
+      if (!event.startsWith('data: ')) continue;
+      const data = JSON.parse(event.slice(6));
+      if (data.token) onToken(data.token);
+      if (data.done) fallbackUsed = data.fallback_used;
+    }
+  }
+  return { fallbackUsed };
+}
+
 export const apiService = {
   // Health check
   async healthCheck(): Promise<{ status: string }> {
@@ -60,6 +90,11 @@ export const apiService = {
     return response.data;
   },
 
+  // Stream summary tokens as they are generated
+  async streamSummary(onToken: (token: string) => void, sessionId: string = 'default'): Promise<{ fallbackUsed: boolean }> {
+    return readEventStream(`/generate-summary/stream?session_id=${sessionId}`, { method: 'POST' }, onToken);
+  },
+
   // Generate flashcards
   async generateFlashcards(sessionId: string = 'default', numCards: number = 10): Promise<{ flashcards: Flashcard[]; count: number; status: string }> {
     const response = await api.post(`/generate-flashcards?session_id=${sessionId}&num_cards=${numCards}`);
@@ -72,6 +107,12 @@ export const apiService = {
     return response.data;
   },
 
+  // Generate summary, flashcards, quiz and keywords in one request
+  async generateStudyPack(sessionId: string = 'default', numCards: number = 10, numQuestions: number = 8): Promise<{ summary: string; flashcards: Flashcard[]; quiz: QuizQuestion[]; topic: string; keywords: string[]; status: string; fallback_sections: string[] }> {
+    const response = await api.post(`/generate-study-pack?session_id=${sessionId}&num_cards=${numCards}&num_questions=${numQuestions}`, undefined, { timeout: 180000 });
+    return response.data;
+  },
+
   // Discover research papers
   async discoverResearch(sessionId: string = 'default', maxPapers: number = 10): Promise<{ papers: ResearchPaper[]; count: number; status: string }> {
     const response = await api.post(`/discover-research?session_id=${sessionId}&max_papers=${maxPapers}`);
@@ -91,14 +132,25 @@ export const apiService = {
   },
 
   // Ask question
-  async askQuestion(question: string, documentText: string): Promise<{ answer: string; status: string }> {
+  // sessionId lets the backend search the full text of large documents for context
+  async askQuestion(question: string, documentText: string, sessionId: string = 'default'): Promise<{ answer: string; status: string }> {
     const response = await api.post('/ask-question', {
       question,
       document_text: documentText,
+      session_id: sessionId,
     });
     return response.data;
   },
 
+  // Stream answer tokens as they are generated
+  async streamQuestion(question: string, documentText: string, onToken: (token: string) => void, sessionId: string = 'default'): Promise<{ fallbackUsed: boolean }> {
+    return readEventStream('/ask-question/stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ question, document_text: documentText, session_id: sessionId }),
+    }, onToken);
+  },
+
   // Clear session
   async clearSession(sessionId: string = 'default'): Promise<{ message: string; status: string }> {
     const response = await api.delete(`/clear-session?session_id=${sessionId}`);
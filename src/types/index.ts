@@ -4,10 +4,12 @@ export interface ProcessingStatus {
   word_count: number;
   page_count: number;
   methods_used: string[];
+  session_id?: string;
 }
 
 export interface StudySession {
   active: boolean;
+  session_id?: string;
   file_info?: string;
   word_count?: number;
   page_count?: number;